@@ -0,0 +1,71 @@
+"""
+Example to export the spotify streaming history of many users (Parquet by
+default, or Feather or CSV).
+The metadata of the tracks/artists of all users is accessed only once
+"""
+
+import sys
+import os
+import argparse
+import logging
+from spotify_analysis.auth import SpotifySession
+from spotify_analysis.batch import get_jobs, run_batch
+from spotify_analysis.cache import MetadataCache
+from spotify_analysis.export import add_export_arguments
+from spotify_analysis.pipeline import EnrichmentPipeline
+
+
+# Metadata that is requested for every track and artist
+TRACK_METADATA = ["name", "duration_ms", "explicit", "popularity"]
+ARTIST_METADATA = ["name", "genres", "popularity", "followers"]
+
+
+def main():
+    """
+    Main function to export the spotify streaming history of every user in
+    corresponding tables
+    """
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Analyse spotify input of many users")
+    parser.add_argument("inputs", type=str, nargs="+", help="Directory per user")
+    parser.add_argument("--output", type=str, required=True, help="Output directory")
+    parser.add_argument("--secret", type=str, required=True, help="Credentials yaml")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+
+    # Outputs of every user are stored in a subdirectory named after the
+    # position and the name of its input (exports share the same name)
+    jobs = get_jobs(args.inputs, args.output)
+
+    # Persistent cache shared by all users (and all runs)
+    cache = MetadataCache(os.path.join(args.output, "spotify_metadata_cache.sqlite"))
+    session = SpotifySession()
+    session.get_spotify_credentials(args.secret)
+    pipeline = EnrichmentPipeline(
+        TRACK_METADATA, ARTIST_METADATA, session=session, cache=cache
+    )
+
+    result = run_batch(
+        jobs,
+        pipeline,
+        n_jobs=args.jobs,
+        file_format=args.export_format,
+        partition=args.partition,
+    )
+    logging.info(
+        "Processed %d users: %d distinct tracks accessed for %d user tracks",
+        result["users"],
+        result["unique_uris"],
+        result["uris"],
+    )
+
+    logging.info("Metadata cache usage: %s", cache.stats())
+    cache.close()
+    session.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
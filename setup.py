@@ -72,6 +72,8 @@ SETUP = Setup(
         "tqdm>=4.66.1",
         "requests>=2.31.0",
         "aiohttp>=3.9.1",
+        "pyarrow>=14.0.1",
+        "scipy>=1.11.4",
     ],
     python_requires=">3.11.1",
     # List additional groups of dependencies here (e.g. development dependencies). You can install
@@ -7,4 +7,8 @@ def entrypoint():
     """
     This is the entrypoint: call it from command line
     """
-    print("Hello, world!\n")
+
+    # pylint: disable=import-outside-toplevel
+    from spotify_analysis.cli import main
+
+    main()
@@ -0,0 +1,414 @@
+"""
+Module with the credentials, access token and connection pools that are
+shared by all clients of Spotify web API
+"""
+import asyncio
+import contextlib
+import threading
+import time
+import yaml
+import requests
+from requests.adapters import HTTPAdapter
+from aiohttp import ClientSession, TCPConnector
+from spotify_analysis.ratelimit import RateLimiter, RetryPolicy
+
+
+AUTH_URL = "https://accounts.spotify.com/api/token"
+BASE_URL = "https://api.spotify.com/v1/"
+
+
+class AccessToken:
+    """
+    Class that holds the credentials and access token of the client
+    credentials flow of Spotify web API, and refreshes the token shortly
+    before it expires. Safe to use from multiple threads
+
+    Attributes
+    ----------
+    cred : dict
+        Dictionary containing the credentials to connect to
+        Spotify's web API (`CLIENT_ID` and `CLIENT_SECRET`)
+    value : str
+        String with access token containing credentials and
+        permissions to access Spotify resources
+    expires_at : float or None
+        Unix time at which the access token expires. None in case
+        the expiry is not known (e.g. token was set by hand)
+
+    auth_url : str, default `AUTH_URL`
+        URL of the Spotify accounts service to request tokens
+    refresh_margin : float, default 60
+        Number of seconds before expiry that the token is refreshed
+    """
+
+    def __init__(self, cred=None, auth_url=AUTH_URL, refresh_margin=60):
+        self.cred = {} if cred is None else cred
+        self.value = None
+        self.expires_at = None
+
+        self.auth_url = auth_url
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+
+    @property
+    def headers(self):
+        """
+        Dictionary containing header with access token to be included
+        in Spotify API calls (empty if there is no token)
+        """
+
+        if self.value is None:
+            return {}
+        return {"Authorization": f"Bearer {self.value}"}
+
+    def request(self, http, retry=None):
+        """
+        Request a new spotify access token (client credentials flow) and
+        store when it expires. Rate-limit and server errors, and requests
+        without response, are retried. Raises a RuntimeError with the
+        status and body of the last response if no token is obtained.
+
+        See https://developer.spotify.com/documentation/web-api/concepts/access-token
+
+        Parameters
+        ----------
+        http : requests.Session
+            Session used to request the token
+        retry : RetryPolicy, default None
+            Number of retries and backoff of failed token requests.
+            `RetryPolicy()` if not provided
+        """
+
+        retry = RetryPolicy() if retry is None else retry
+        for attempt in range(retry.max_retries + 1):
+            try:
+                auth_response = http.post(
+                    self.auth_url,
+                    {
+                        "grant_type": "client_credentials",
+                        "client_id": self.cred["CLIENT_ID"],
+                        "client_secret": self.cred["CLIENT_SECRET"],
+                    },
+                    timeout=10,
+                )
+            except requests.RequestException as error:
+                status, body, retry_after = None, str(error), None
+            else:
+                if auth_response.status_code == 200:
+                    auth_response_data = auth_response.json()
+                    self.value = auth_response_data["access_token"]
+                    self.expires_at = time.time() + auth_response_data.get(
+                        "expires_in", 3600
+                    )
+                    return
+                status, body = auth_response.status_code, auth_response.text
+                retry_after = auth_response.headers.get("Retry-After")
+
+            if attempt == retry.max_retries or not retry.is_retryable(status):
+                break
+            time.sleep(retry.backoff(attempt, retry_after))
+
+        raise RuntimeError(
+            f"Requesting a Spotify access token from {self.auth_url} failed "
+            f"(status {status}): {body}"
+        )
+
+    def can_refresh(self):
+        """
+        Whether the credentials to request a new token are known
+
+        Return
+        ------
+        bool
+            True if `CLIENT_ID` and `CLIENT_SECRET` are known
+        """
+
+        return "CLIENT_ID" in self.cred and "CLIENT_SECRET" in self.cred
+
+    def needs_refresh(self):
+        """
+        Whether the access token is missing or (almost) expired, and can
+        be refreshed
+
+        Return
+        ------
+        bool
+            True if a new access token should be requested
+        """
+
+        if not self.can_refresh():
+            return False
+        if self.value is None:
+            return True
+        if self.expires_at is None:
+            return False
+        return time.time() >= self.expires_at - self.refresh_margin
+
+    def refresh(self, http, retry=None):
+        """
+        Request a new access token if it is (almost) expired. Concurrent
+        callers wait for a single refresh
+
+        Parameters
+        ----------
+        http : requests.Session
+            Session used to request the token
+        retry : RetryPolicy, default None
+            Number of retries and backoff of failed token requests
+
+        Return
+        ------
+        bool
+            True if a new access token was requested
+        """
+
+        if not self.needs_refresh():
+            return False
+        with self._lock:
+            if not self.needs_refresh():
+                return False
+            self.request(http, retry)
+            return True
+
+    def invalidate(self, value):
+        """
+        Mark the access token as expired, e.g. after a 401 response, such
+        that it is refreshed before the next request. Does nothing if the
+        token was already refreshed by another request in the meantime
+
+        Parameters
+        ----------
+        value : str
+            The access token that was rejected
+        """
+
+        with self._lock:
+            if self.value == value:
+                self.expires_at = 0.0
+
+
+class SpotifySession:
+    """
+    Class that holds the credentials and access token to Spotify web API,
+    together with the HTTP connection pools and the rate limiter. A single
+    session can be shared by every `Spotify(reference=...)` client. The
+    access token is refreshed shortly before it expires, also while
+    asynchronous requests are in flight.
+
+    Attributes
+    ----------
+    token : AccessToken
+        Credentials and access token, of which `cred`, `access_token` and
+        `expires_at` are also available on the session
+    http : requests.Session
+        Pooled session used for all requests via `requests`
+    rate_limiter : RateLimiter
+        Adaptive rate limiter shared by all clients of the session
+    metrics : Metrics or None
+        Metrics shared by all clients of the session, None if no metrics
+        are recorded
+
+    base_url : str, default `BASE_URL`
+        URL of Spotify web API
+    max_connections : int, default 10
+        Integer of maximum number of pooled connections
+    """
+
+    def __init__(
+        self,
+        cred=None,
+        auth_url=AUTH_URL,
+        base_url=BASE_URL,
+        *,
+        refresh_margin=60,
+        max_connections=10,
+        rate_limiter=None,
+        metrics=None,
+    ):
+        self.token = AccessToken(cred, auth_url, refresh_margin)
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.metrics = metrics
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        self._clients = {}
+
+    @property
+    def cred(self):
+        """
+        Dictionary containing the credentials to connect to Spotify's web
+        API (`CLIENT_ID` and `CLIENT_SECRET`)
+        """
+
+        return self.token.cred
+
+    @cred.setter
+    def cred(self, cred):
+        self.token.cred = cred
+
+    @property
+    def access_token(self):
+        """
+        String with the current access token, None if there is none.
+        The expiry of a token that is set by hand is not known
+        """
+
+        return self.token.value
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self.token.value = access_token
+        self.token.expires_at = None
+
+    @property
+    def expires_at(self):
+        """
+        Unix time at which the access token expires, None if unknown
+        """
+
+        return self.token.expires_at
+
+    @expires_at.setter
+    def expires_at(self, expires_at):
+        self.token.expires_at = expires_at
+
+    @property
+    def headers(self):
+        """
+        Dictionary containing header with access token to be included
+        in Spotify API calls (empty if there is no token)
+        """
+
+        return self.token.headers
+
+    def get_spotify_credentials(self, secret_yaml_file):
+        """
+        Loads your spotify credentials from a yaml configuration file
+
+        Parameters
+        ----------
+        secret_yaml_file : str
+            The file location of your spotify credentials. Should contain
+            your `CLIENT_ID` and `CLIENT_SECRET`
+        """
+
+        with open(secret_yaml_file, "r", encoding="utf-8") as file:
+            self.token.cred = yaml.safe_load(file)
+
+    def get_spotify_access_token(self):
+        """
+        Request a new spotify access token (client credentials flow) and
+        store when it expires.
+        """
+
+        self.token.request(self.http, self.rate_limiter.retry)
+        if self.metrics is not None:
+            self.metrics.inc("spotify_token_refreshes_total")
+
+    def can_refresh(self):
+        """
+        Whether the session has the credentials to request a new token
+
+        Return
+        ------
+        bool
+            True if `CLIENT_ID` and `CLIENT_SECRET` are known
+        """
+
+        return self.token.can_refresh()
+
+    def needs_refresh(self):
+        """
+        Whether the access token is missing or (almost) expired, and can
+        be refreshed
+
+        Return
+        ------
+        bool
+            True if a new access token should be requested
+        """
+
+        return self.token.needs_refresh()
+
+    def invalidate_token(self, access_token):
+        """
+        Mark the access token as expired, see `AccessToken.invalidate`
+
+        Parameters
+        ----------
+        access_token : str
+            The access token that was rejected
+        """
+
+        self.token.invalidate(access_token)
+
+    def get_headers(self):
+        """
+        Headers of the next request, refreshing the access token first
+        if it is (almost) expired. Safe to call from multiple threads
+
+        Return
+        ------
+        dict
+            Dictionary containing header with valid access token
+        """
+
+        refreshed = self.token.refresh(self.http, self.rate_limiter.retry)
+        if refreshed and self.metrics is not None:
+            self.metrics.inc("spotify_token_refreshes_total")
+        return self.headers
+
+    async def get_headers_async(self):
+        """
+        Headers of the next asynchronous request. A refresh of the access
+        token is done in a worker thread, such that requests in flight are
+        not blocked
+
+        Return
+        ------
+        dict
+            Dictionary containing header with valid access token
+        """
+
+        if self.needs_refresh():
+            return await asyncio.to_thread(self.get_headers)
+        return self.headers
+
+    @contextlib.asynccontextmanager
+    async def client(self):
+        """
+        Pooled `aiohttp.ClientSession` of the running event loop. Clients
+        that run concurrently in the same event loop share one connection
+        pool, which is closed when the last of them is done
+
+        Yield
+        -----
+        aiohttp.ClientSession
+            The pooled session of the running event loop
+        """
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            connector = TCPConnector(limit=self.max_connections)
+            self._clients[loop] = [ClientSession(connector=connector), 0]
+
+        entry = self._clients[loop]
+        entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._clients[loop]
+                await entry[0].close()
+
+    def close(self):
+        """
+        Close the pooled `requests` session
+        """
+
+        self.http.close()
@@ -0,0 +1,214 @@
+"""
+Module to process the streaming history exports of many users in one
+batch. Histories are loaded in parallel, the track uri's of all users are
+deduplicated, such that every uri is accessed via Spotify web API only
+once, and the per-user outputs are written in parallel
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from spotify_analysis.export import export_plays, export_table
+from spotify_analysis.stats import ListeningStats
+from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
+
+
+# Metadata tables shared with the worker processes that write the outputs
+_METADATA = {}
+
+
+def prepare_user(inputdir, outputdir, file_format="parquet", partition=False):
+    """
+    Load and normalize the streaming history of one user, and export it
+    (sorted by most listened songs) as `MySpotifyDataTable` (see
+    `export_plays()`)
+
+    Parameters
+    ----------
+    inputdir : str
+        The path to the directory with the streaming history of the user
+    outputdir : str
+        The path to the directory to store the outputs of the user
+    file_format : str, default 'parquet'
+        Format of the exported tables ('parquet', 'feather' or 'csv')
+    partition : bool, default False
+        Whether the exported plays are partitioned by year and month
+
+    Return
+    ------
+    list of str
+        List with the unique track uri's of the user
+    """
+
+    os.makedirs(outputdir, exist_ok=True)
+    df_songs = get_spotify_history(
+        inputdir, n_jobs=1, cache_dir=os.path.join(outputdir, "history_cache")
+    )
+    df_songs = modify_columns_spotify_history(df_songs, compact=True)
+
+    stats = ListeningStats()
+    stats.update(df_songs)
+    df_songs["c_unique_tr"] = stats.counts("track", df_songs["unique_tr"])
+    df_songs["c_unique_ar"] = stats.counts("artist", df_songs["artist_name"])
+    df_songs = df_songs.sort_values(by=["c_unique_tr"], ascending=False)
+    export_plays(
+        df_songs, outputdir, "MySpotifyDataTable", file_format, partition=partition
+    )
+
+    return df_songs.drop_duplicates("unique_tr")["track_uri"].to_list()
+
+
+def set_metadata(df_meta_track, df_meta_artist):
+    """
+    Share the metadata tables of all users with a worker process
+
+    Parameters
+    ----------
+    df_meta_track : pandas.DataFrame
+        Track metadata of all users, with `track_uri` as the first column
+    df_meta_artist : pandas.DataFrame
+        Artist metadata of all users, with `artist_uri` as the first column
+    """
+
+    _METADATA["tracks"] = df_meta_track.set_index("track_uri", drop=False)
+    _METADATA["artists"] = df_meta_artist.set_index("artist_uri", drop=False)
+
+
+def write_user_metadata(uri_list, outputdir, file_format="parquet"):
+    """
+    Export the track and artist metadata of one user, selected from the
+    metadata tables of all users (see `set_metadata()` and `export_table()`)
+
+    Parameters
+    ----------
+    uri_list : list of str
+        List with the unique track uri's of the user
+    outputdir : str
+        The path to the directory to store the outputs of the user
+    file_format : str, default 'parquet'
+        Format of the exported tables ('parquet', 'feather' or 'csv')
+    """
+
+    df_meta_track = _METADATA["tracks"]
+    df_meta_track = df_meta_track.loc[df_meta_track.index.intersection(uri_list)]
+    export_table(df_meta_track, outputdir, "TrackMetadataTable", file_format)
+
+    artist_ids = []
+    if "artist_ids" in df_meta_track.columns:
+        artist_ids = df_meta_track["artist_ids"].explode().dropna().unique()
+    df_meta_artist = _METADATA["artists"]
+    df_meta_artist = df_meta_artist.loc[df_meta_artist.index.intersection(artist_ids)]
+    export_table(df_meta_artist, outputdir, "ArtistMetadataTable", file_format)
+    if "genres" in df_meta_artist.columns:
+        export_table(
+            df_meta_artist.explode("genres"),
+            outputdir,
+            "ArtistMetadataTable_GenresExpanded",
+            file_format,
+        )
+
+
+def get_jobs(inputdirs, outputdir):
+    """
+    Output directory of every user, named after the position and the name
+    of its input directory (e.g. `003_my_spotify_data`). Exports of Spotify
+    all have the same default directory name, so the name alone is not
+    unique
+
+    Parameters
+    ----------
+    inputdirs : list of str
+        The paths to the directories with the streaming history of every
+        user
+    outputdir : str
+        The path to the directory in which the outputs of every user are
+        stored in a subdirectory
+
+    Return
+    ------
+    dict
+        Dictionary with the input directory of every user as keys and the
+        output directory of the user as values
+    """
+
+    if len(set(inputdirs)) != len(inputdirs):
+        raise ValueError("The same input directory is given more than once")
+    width = len(str(max(len(inputdirs) - 1, 0)))
+    return {
+        inputdir: os.path.join(
+            outputdir,
+            f"{index:0{width}d}_{os.path.basename(os.path.normpath(inputdir))}",
+        )
+        for index, inputdir in enumerate(inputdirs)
+    }
+
+
+def run_batch(jobs, pipeline, n_jobs=None, file_format="parquet", partition=False):
+    """
+    Process the streaming history exports of many users. The uri's of all
+    users are merged, such that the cost of accessing Spotify web API
+    scales with the number of distinct tracks and artists, not with the
+    number of users
+
+    Parameters
+    ----------
+    jobs : dict
+        Dictionary with the input directory of every user as keys and the
+        output directory of the user as values (see `get_jobs()`). Raises
+        a ValueError if users share an output directory
+    pipeline : EnrichmentPipeline
+        Pipeline to access the metadata of the tracks and their artists.
+        Raises a RuntimeError if not all metadata could be accessed, in
+        which case no metadata tables are written
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+    file_format : str, default 'parquet'
+        Format of the exported tables ('parquet', 'feather' or 'csv')
+    partition : bool, default False
+        Whether the exported plays are partitioned by year and month
+
+    Return
+    ------
+    dict
+        Dictionary with the number of users, the number of track uri's
+        summed over users and the number of distinct track uri's
+    """
+
+    outputdirs = [os.path.abspath(outputdir) for outputdir in jobs.values()]
+    if len(set(outputdirs)) != len(outputdirs):
+        raise ValueError("Users would write their outputs to the same directory")
+
+    with ProcessPoolExecutor(n_jobs) as executor:
+        uri_lists = list(
+            executor.map(
+                prepare_user,
+                jobs,
+                jobs.values(),
+                repeat(file_format),
+                repeat(partition),
+            )
+        )
+
+    # Every track is only accessed once, whatever the number of its listeners
+    uri_list = list(dict.fromkeys(uri for uris in uri_lists for uri in uris))
+    if not pipeline.run(uri_list):
+        raise RuntimeError(
+            f"Failed to access the metadata of all {len(uri_list)} tracks "
+            "(and their artists) of the batch"
+        )
+
+    df_meta_track = pipeline.tracks.to_dataframe("track_uri")
+    df_meta_artist = pipeline.artists.to_dataframe("artist_uri")
+    with ProcessPoolExecutor(
+        n_jobs, initializer=set_metadata, initargs=(df_meta_track, df_meta_artist)
+    ) as executor:
+        list(
+            executor.map(
+                write_user_metadata, uri_lists, jobs.values(), repeat(file_format)
+            )
+        )
+
+    return {
+        "users": len(jobs),
+        "uris": sum(len(uris) for uris in uri_lists),
+        "unique_uris": len(uri_list),
+    }
@@ -0,0 +1,563 @@
+"""
+Module with benchmarks that run offline:
+- `fetch`: the fetch paths of Spotify web API against the local stand-in of
+  `spotify_analysis.mockapi`, measuring the requests/s, items/s and tail
+  latency of every fetch mode
+- `pipeline`: the loading and analysis of a (synthetic) streaming history,
+  measuring the wall time and peak memory of every stage
+
+Results are appended to a JSON lines file and compared with the previous
+run with the same parameters, such that regressions can be gated
+
+Run as `python -m spotify_analysis.benchmark {fetch,pipeline} --help`
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from spotify_analysis.export import EXPORT_FORMATS, export_plays
+from spotify_analysis.mockapi import MockSpotifyAPI
+from spotify_analysis.ratelimit import RateLimiter
+from spotify_analysis.spotify import Spotify
+from spotify_analysis.stats import ListeningStats
+from spotify_analysis.synthetic import HISTORY_SIZES, write_export
+from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
+
+
+# Fetch modes with the method of `Spotify` that accesses the metadata. New
+# fetch paths are benchmarked by adding them here
+FETCH_MODES = {"requests": "access_spotify_api", "aiohttp": "access_spotify_api_async"}
+
+# Metrics compared with the baseline, and whether higher values are better
+FETCH_METRICS = {"requests_per_s": True, "items_per_s": True, "p95_ms": False}
+STAGE_METRICS = {"seconds": False, "peak_rss_mb": False}
+
+# Arguments that are no parameters of the benchmark itself
+RUN_ARGUMENTS = ["benchmark", "results", "label", "compare", "tolerance"]
+
+
+class TimedSpotify(Spotify):
+    """
+    `Spotify` client that records the latency of every request as seen by
+    the client, i.e. including the pacing by the rate limiter and retries
+
+    Attributes
+    ----------
+    latencies : list of float
+        Seconds of every (sync or async) request
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def make_request_sync(self, url):
+        """
+        Timed `Spotify.make_request_sync()`
+        """
+
+        start = time.perf_counter()
+        result = super().make_request_sync(url)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def make_request(self, client, semaphore, url):
+        """
+        Timed `Spotify.make_request()`
+        """
+
+        start = time.perf_counter()
+        result = await super().make_request(client, semaphore, url)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+
+def get_percentiles(latencies, percentiles=(50, 95, 99)):
+    """
+    Percentiles of the latencies in milliseconds
+
+    Parameters
+    ----------
+    latencies : list of float
+        Latencies in seconds
+    percentiles : tuple of int, default (50, 95, 99)
+        Percentiles to be computed
+
+    Return
+    ------
+    dict
+        Dictionary with e.g. `p95_ms` as keys, NaN if there are no latencies
+    """
+
+    values = np.percentile(latencies, percentiles) if latencies else [np.nan] * 3
+    return {f"p{pct}_ms": 1000 * float(val) for pct, val in zip(percentiles, values)}
+
+
+def run_fetch_benchmark(
+    mode,
+    server,
+    *,
+    n_items=1000,
+    reference="tracks",
+    n_uri=50,
+    max_concurrency=10,
+    rate_limiter=None,
+):
+    """
+    Access the metadata of `n_items` fake uri's from the mock server with
+    one fetch mode, and measure its throughput and latency
+
+    Parameters
+    ----------
+    mode : str
+        Fetch mode, one of `FETCH_MODES`
+    server : MockSpotifyAPI
+        Running mock server, of which the log is reset first
+    n_items : int, default 1000
+        Number of uri's to be accessed
+    reference : str, default 'tracks'
+        Endpoint to be accessed ('tracks', 'artists' or 'albums')
+    n_uri : int, default 50
+        Number of uri's per request
+    max_concurrency : int, default 10
+        Maximum number of requests in flight (asynchronous modes)
+    rate_limiter : RateLimiter, default None
+        Rate limiter of the client. `RateLimiter()` if not provided
+
+    Return
+    ------
+    dict
+        Dictionary with the settings and results of the benchmark, e.g.
+        `requests_per_s`, `items_per_s` and `p95_ms`
+    """
+
+    server.reset()
+    session = server.get_session(
+        rate_limiter=RateLimiter() if rate_limiter is None else rate_limiter,
+        max_connections=max_concurrency,
+    )
+    client = TimedSpotify(
+        reference=reference, session=session, max_concurrency=max_concurrency
+    )
+    uri_list = [f"bm{number:07d}" for number in range(n_items)]
+
+    start = time.perf_counter()
+    success = getattr(client, FETCH_MODES[mode])(uri_list, ["name"], n_uri=n_uri)
+    seconds = time.perf_counter() - start
+    session.close()
+
+    stats = server.stats()
+    return {
+        "mode": mode,
+        "reference": reference,
+        "success": bool(success) and len(client.metadata) == n_items,
+        "seconds": seconds,
+        "requests": len(client.latencies),
+        "server_requests": stats["requests"],
+        "status": stats["status"],
+        "tokens": stats["tokens"],
+        "requests_per_s": len(client.latencies) / seconds,
+        "items_per_s": len(client.metadata) / seconds,
+        **get_percentiles(client.latencies),
+    }
+
+
+def check_regression(results, baseline, tolerance=0.2, metrics=None):
+    """
+    Compare the results with a baseline (e.g. the results of the main
+    branch). A metric regresses if it is worse by more than `tolerance`
+
+    Parameters
+    ----------
+    results : dict
+        Dictionary with the results of every fetch mode (or stage), as
+        keys the modes
+    baseline : dict
+        Dictionary with the baseline results of every mode. Modes that are
+        not in the baseline are not checked
+    tolerance : float, default 0.2
+        Allowed relative difference
+    metrics : dict, default None
+        Compared metrics, with as values whether higher values are better.
+        `FETCH_METRICS` if not provided
+
+    Return
+    ------
+    list of str
+        Description of every regression, empty if there is none
+    """
+
+    metrics = FETCH_METRICS if metrics is None else metrics
+    regressions = []
+    for mode, result in results.items():
+        if mode not in baseline:
+            continue
+        if not result.get("success", True):
+            regressions.append(f"{mode}: not all items were accessed")
+        for metric, higher_is_better in metrics.items():
+            value, reference = result[metric], baseline[mode][metric]
+            if higher_is_better:
+                regressed = value < reference * (1 - tolerance)
+            else:
+                regressed = value > reference * (1 + tolerance)
+            if regressed:
+                regressions.append(
+                    f"{mode}: {metric} {value:.1f} vs baseline {reference:.1f}"
+                )
+    return regressions
+
+
+def get_memory_mb(field="VmHWM"):
+    """
+    Resident memory of this process. Falls back on the peak memory of the
+    whole process where `/proc` is not available (e.g. macOS)
+
+    Parameters
+    ----------
+    field : str, default 'VmHWM'
+        Field of `/proc/self/status`, 'VmHWM' for the peak since the last
+        `reset_peak_memory()` or 'VmRSS' for the current memory
+
+    Return
+    ------
+    float
+        Resident memory in MB
+    """
+
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_memory():
+    """
+    Reset the peak resident memory of this process to its current memory
+    (Linux only), such that the peak of a single stage can be measured
+
+    Return
+    ------
+    bool
+        True if the peak was reset, False if the peak is the one of the
+        whole process so far
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+            file.write("5")
+    except OSError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def measure_stage(stages, name):
+    """
+    Measure the wall time and peak resident memory of the stage that runs
+    in the `with` block. Memory of worker processes is not included
+
+    Parameters
+    ----------
+    stages : dict
+        Dictionary with the results of every stage, to which the results
+        of this stage are added: `seconds`, `peak_rss_mb`, `rss_mb` (after
+        the stage) and whether the peak was measured for the stage only
+        (`peak_reset`)
+    name : str
+        Name of the stage
+
+    Yield
+    -----
+    dict
+        Results of the stage, to which the stage can add e.g. its number
+        of rows
+    """
+
+    stage = stages.setdefault(name, {})
+    stage["peak_reset"] = reset_peak_memory()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage["seconds"] = time.perf_counter() - start
+        stage["peak_rss_mb"] = get_memory_mb("VmHWM")
+        stage["rss_mb"] = get_memory_mb("VmRSS")
+        logging.info(
+            "%s: %.2f s, peak %.0f MB", name, stage["seconds"], stage["peak_rss_mb"]
+        )
+
+
+def run_pipeline_benchmark(inputdir, outputdir, file_format="parquet", n_jobs=None):
+    """
+    Run the stages of the analysis of `examples/store_history_example.py`
+    (without accessing Spotify web API) and measure every stage
+
+    Parameters
+    ----------
+    inputdir : str
+        The path to the directory with the streaming history files
+    outputdir : str
+        The path to the directory to store the export
+    file_format : str, default 'parquet'
+        Format of the export ('parquet', 'feather' or 'csv')
+    n_jobs : int, default None
+        Number of worker processes to load the history files. Uses the
+        number of CPUs if not provided
+
+    Return
+    ------
+    dict
+        Dictionary with the results of every stage (see `measure_stage()`)
+    """
+
+    stages = {}
+    with measure_stage(stages, "load") as stage:
+        df_songs = get_spotify_history(inputdir, n_jobs=n_jobs)
+        stage["rows"] = len(df_songs)
+    with measure_stage(stages, "modify") as stage:
+        df_songs = modify_columns_spotify_history(df_songs, compact=True)
+        stage["rows"] = len(df_songs)
+    with measure_stage(stages, "aggregate"):
+        stats = ListeningStats()
+        stats.update(df_songs)
+        df_songs["c_unique_tr"] = stats.counts("track", df_songs["unique_tr"])
+        df_songs["c_unique_ar"] = stats.counts("artist", df_songs["artist_name"])
+    with measure_stage(stages, "sort"):
+        df_songs = df_songs.sort_values(by=["c_unique_tr"], ascending=False)
+    with measure_stage(stages, "export"):
+        os.makedirs(outputdir, exist_ok=True)
+        export_plays(df_songs, outputdir, "MySpotifyDataTable", file_format)
+    return stages
+
+
+def append_results(path, record):
+    """
+    Append the record of a benchmark run to a JSON lines file
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON lines file
+    record : dict
+        Dictionary with the `benchmark`, `label`, `time`, `params` and
+        `results` of the run
+    """
+
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+
+
+def load_baseline(path, benchmark, params):
+    """
+    Latest run of the same benchmark with the same parameters
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON lines file with the results of previous runs
+    benchmark : str
+        Name of the benchmark ('fetch' or 'pipeline')
+    params : dict
+        Parameters of the benchmark
+
+    Return
+    ------
+    dict or None
+        Record of the latest matching run, None if there is none
+    """
+
+    if not os.path.exists(path):
+        return None
+    baseline = None
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if record["benchmark"] == benchmark and record["params"] == params:
+                baseline = record
+    return baseline
+
+
+def run_fetch_command(args):
+    """
+    Benchmark the fetch modes against the mock server
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the `fetch` command
+
+    Return
+    ------
+    dict
+        Dictionary with the results of every fetch mode
+    """
+
+    server = MockSpotifyAPI(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        token_ttl=args.token_ttl,
+        expires_in=3600.0,
+    )
+    results = {}
+    with server:
+        for mode in args.modes:
+            rate_limiter = None
+            if args.client_rate is not None:
+                rate_limiter = RateLimiter(
+                    rate=args.client_rate,
+                    burst=args.client_rate,
+                    max_rate=args.client_rate,
+                )
+            results[mode] = run_fetch_benchmark(
+                mode,
+                server,
+                n_items=args.items,
+                reference=args.reference,
+                n_uri=args.batch,
+                max_concurrency=args.concurrency,
+                rate_limiter=rate_limiter,
+            )
+            logging.info(
+                "%s: %.1f requests/s, %.1f items/s, p50 %.1f ms, p95 %.1f ms, "
+                "p99 %.1f ms",
+                mode,
+                results[mode]["requests_per_s"],
+                results[mode]["items_per_s"],
+                results[mode]["p50_ms"],
+                results[mode]["p95_ms"],
+                results[mode]["p99_ms"],
+            )
+    return results
+
+
+def run_pipeline_command(args):
+    """
+    Benchmark the stages of the analysis, of the given history or of a
+    synthetic export (see `spotify_analysis.synthetic`)
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments of the `pipeline` command
+
+    Return
+    ------
+    dict
+        Dictionary with the results of every stage
+    """
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inputdir = args.input
+        if inputdir is None:
+            inputdir = os.path.join(tmpdir, "export")
+            n_plays = HISTORY_SIZES[args.size] if args.plays is None else args.plays
+            logging.info("Generating a synthetic history of %d plays", n_plays)
+            write_export(inputdir, n_plays)
+        return run_pipeline_benchmark(
+            inputdir, os.path.join(tmpdir, "output"), args.format, args.jobs
+        )
+
+
+def main(argv=None):
+    """
+    Run a benchmark, optionally store its results and compare them with the
+    previous run with the same parameters
+
+    Parameters
+    ----------
+    argv : list of str, default None
+        Command line arguments, `sys.argv[1:]` if not provided
+
+    Return
+    ------
+    int
+        Exit code, 1 in case of a regression
+    """
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    fetch = subparsers.add_parser("fetch", help="Fetch paths of Spotify web API")
+    fetch.add_argument("--modes", nargs="+", default=list(FETCH_MODES))
+    fetch.add_argument("--items", type=int, default=1000, help="Number of uri's")
+    fetch.add_argument("--reference", type=str, default="tracks")
+    fetch.add_argument("--batch", type=int, default=50, help="Uri's per request")
+    fetch.add_argument("--concurrency", type=int, default=10)
+    fetch.add_argument("--client-rate", type=float, default=None, help="Requests/s")
+    fetch.add_argument("--latency", type=float, default=0.02, help="Seconds")
+    fetch.add_argument("--jitter", type=float, default=0.01, help="Seconds")
+    fetch.add_argument("--rate-limit", type=float, default=None, help="Requests/s")
+    fetch.add_argument("--retry-after", type=float, default=1.0, help="Seconds")
+    fetch.add_argument("--throttle-rate", type=float, default=0.0)
+    fetch.add_argument("--error-rate", type=float, default=0.0)
+    fetch.add_argument("--token-ttl", type=float, default=3600.0, help="Seconds")
+
+    pipeline = subparsers.add_parser("pipeline", help="Loading and analysis")
+    pipeline.add_argument(
+        "input", nargs="?", default=None, help="History directory (else synthetic)"
+    )
+    pipeline.add_argument("--size", choices=list(HISTORY_SIZES), default="100k")
+    pipeline.add_argument("--plays", type=int, default=None, help="Overrides --size")
+    pipeline.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    pipeline.add_argument("--jobs", type=int, default=None, help="Worker processes")
+
+    for subparser in [fetch, pipeline]:
+        subparser.add_argument("--results", type=str, default=None, help=".jsonl")
+        subparser.add_argument("--label", type=str, default="", help="Run label")
+        subparser.add_argument(
+            "--compare", action="store_true", help="Compare with previous run"
+        )
+        subparser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "fetch":
+        results, metrics = run_fetch_command(args), FETCH_METRICS
+    else:
+        results, metrics = run_pipeline_command(args), STAGE_METRICS
+
+    params = {key: val for key, val in vars(args).items() if key not in RUN_ARGUMENTS}
+    baseline = None
+    if args.results is not None:
+        if args.compare:
+            baseline = load_baseline(args.results, args.benchmark, params)
+        append_results(
+            args.results,
+            {
+                "benchmark": args.benchmark,
+                "label": args.label,
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "params": params,
+                "results": results,
+            },
+        )
+    if baseline is None:
+        return 0
+
+    regressions = check_regression(
+        results, baseline["results"], args.tolerance, metrics
+    )
+    for regression in regressions:
+        logging.error("Regression of %s", regression)
+    return int(bool(regressions))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
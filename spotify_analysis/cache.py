@@ -0,0 +1,321 @@
+"""
+Module with a persistent on-disk cache for metadata accessed via Spotify web API
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+# Default time-to-live of a cached entry (30 days)
+DEFAULT_TTL = 30 * 24 * 3600
+
+# Default time-to-live of a tombstone of an uri unknown to Spotify (1 day)
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+
+# Marker of an argument that was not given, as None means "never expires"
+_DEFAULT = object()
+
+# SQLite limits the number of host parameters of a single statement
+MAX_SQL_VARIABLES = 500
+
+
+class MetadataCache:
+    """
+    Persistent SQLite-backed cache for Spotify metadata. Entries are keyed
+    by (reference, uri, requested metadata) so that the same uri requested
+    with different metadata keys is cached separately. Uri's that Spotify
+    returned as null are stored as tombstones (with value None) with a
+    shorter time-to-live, such that they are not requested on every run.
+
+    Attributes
+    ----------
+    path : str
+        The file location of the SQLite database. Use ":memory:" for a
+        cache that only lives as long as the object
+    ttl : float or None, default 30 days
+        Default time-to-live in seconds of a cached entry. None means
+        entries never expire
+    max_entries : int or None, default None
+        Maximum number of entries kept in the cache. The least recently
+        used entries are evicted when the cache grows beyond this size
+    hits : int
+        Number of uri's that were found (and not expired) in the cache
+    misses : int
+        Number of uri's that were not found (or expired) in the cache
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "reference TEXT NOT NULL, uri TEXT NOT NULL, fields TEXT NOT NULL, "
+                "value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL, "
+                "PRIMARY KEY (reference, uri, fields))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    @staticmethod
+    def fields_key(metadata):
+        """
+        Converts the requested metadata keys into the string used as key
+        in the cache
+
+        Parameters
+        ----------
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
+
+        Return
+        ------
+        str
+            Key in json format representing the requested metadata
+        """
+
+        return json.dumps(metadata, separators=(",", ":"))
+
+    def get_many(self, reference, uri_list, metadata):
+        """
+        Look up the cached metadata of a list of uri's. Expired entries are
+        counted as misses. Hits are marked as recently used.
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        uri_list : list of str
+            List of Spotify uri's in string format to look up
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+
+        Return
+        ------
+        dict
+            Dictionary with the cached metadata of the hits, with the uri
+            as keys. The value of a tombstone is None
+        """
+
+        fields = self.fields_key(metadata)
+        now = time.time()
+        unique_uri = list(dict.fromkeys(uri_list))
+
+        found = {}
+        with self._lock:
+            for ibx in range(0, len(unique_uri), MAX_SQL_VARIABLES):
+                uri = unique_uri[ibx : ibx + MAX_SQL_VARIABLES]
+                rows = self._conn.execute(
+                    "SELECT uri, value FROM metadata WHERE reference = ? AND fields = ? "
+                    "AND (expires IS NULL OR expires > ?) "
+                    f"AND uri IN ({','.join('?' * len(uri))})",
+                    [reference, fields, now, *uri],
+                )
+                for key, value in rows:
+                    found[key] = json.loads(value)
+
+            if found:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE metadata SET accessed = ? "
+                        "WHERE reference = ? AND uri = ? AND fields = ?",
+                        [(now, reference, key, fields) for key in found],
+                    )
+
+            self.hits += len(found)
+            self.misses += len(unique_uri) - len(found)
+        return found
+
+    def get(self, reference, uri, metadata):
+        """
+        Look up the cached metadata of a single uri
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        uri : str
+            Spotify uri in string format to look up
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+
+        Return
+        ------
+        dict or None
+            The cached metadata, or None in case of a miss or tombstone
+        """
+
+        return self.get_many(reference, [uri], metadata).get(uri)
+
+    def put_many(self, reference, items, metadata, ttl=_DEFAULT):
+        """
+        Store the metadata of multiple uri's in the cache. Evicts the least
+        recently used entries in case the cache grows beyond `max_entries`
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        items : dict
+            Dictionary with the metadata to be stored, with the uri as keys
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+        ttl : float or None, optional
+            Time-to-live in seconds of these entries, None means they never
+            expire. Uses `self.ttl` if not provided
+        """
+
+        if not items:
+            return
+
+        fields = self.fields_key(metadata)
+        now = time.time()
+        ttl = self.ttl if ttl is _DEFAULT else ttl
+        expires = None if ttl is None else now + ttl
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO metadata "
+                    "(reference, uri, fields, value, expires, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (reference, uri, fields, json.dumps(value), expires, now)
+                        for uri, value in items.items()
+                    ],
+                )
+            self._evict()
+
+    def put(self, reference, uri, metadata, value, ttl=_DEFAULT):
+        """
+        Store the metadata of a single uri in the cache
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        uri : str
+            Spotify uri in string format
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+        value : dict
+            The metadata to be stored
+        ttl : float or None, optional
+            Time-to-live in seconds of this entry, None means it never
+            expires. Uses `self.ttl` if not provided
+        """
+
+        self.put_many(reference, {uri: value}, metadata, ttl)
+
+    def put_missing(self, reference, uri_list, metadata, ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        Store tombstones of uri's that are unknown to Spotify (null in the
+        response), such that they are not requested again until the
+        tombstones expire
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        uri_list : list of str
+            List of Spotify uri's in string format that were null
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+        ttl : float or None, default `DEFAULT_NEGATIVE_TTL`
+            Time-to-live in seconds of the tombstones, None means they
+            never expire
+        """
+
+        self.put_many(reference, dict.fromkeys(uri_list), metadata, ttl)
+
+    def _evict(self):
+        """
+        Remove the least recently used entries beyond `self.max_entries`.
+        Should be called with the lock held
+        """
+
+        if self.max_entries is None:
+            return
+
+        n_entries = self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        if n_entries <= self.max_entries:
+            return
+
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM metadata WHERE rowid IN "
+                "(SELECT rowid FROM metadata ORDER BY accessed ASC LIMIT ?)",
+                (n_entries - self.max_entries,),
+            )
+
+    def purge_expired(self):
+        """
+        Remove all expired entries from the cache
+
+        Return
+        ------
+        int
+            Number of removed entries
+        """
+
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM metadata WHERE expires IS NOT NULL AND expires <= ?",
+                    (time.time(),),
+                )
+        return cursor.rowcount
+
+    def clear(self):
+        """
+        Remove all entries from the cache and reset the hit/miss counters
+        """
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM metadata")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Summary of the cache usage
+
+        Return
+        ------
+        dict
+            Dictionary with number of hits, misses, hit rate and entries
+        """
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        """
+        Close the connection to the SQLite database
+        """
+
+        self._conn.close()
@@ -0,0 +1,614 @@
+"""
+Module with the command line interface, which runs the analysis as
+explicit stages (ingest, normalize, enrich-tracks, enrich-artists,
+aggregate and export). Like make, every stage records the fingerprint of
+its inputs and is skipped when they did not change. Stages that do not
+depend on each other run concurrently
+"""
+import argparse
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+from spotify_analysis.auth import SpotifySession
+from spotify_analysis.cache import MetadataCache
+from spotify_analysis.export import add_export_arguments, export_plays, export_table
+from spotify_analysis.ingest import PlayStore
+from spotify_analysis.metrics import Metrics, get_sink
+from spotify_analysis.pipeline import LINK_FIELDS
+from spotify_analysis.spotify import MAX_IDS, Spotify
+from spotify_analysis.stats import ListeningStats
+from spotify_analysis.utils import find_history_files, modify_columns_spotify_history
+
+
+# Stages with the stages they depend on, in order of execution
+STAGES = {
+    "ingest": [],
+    "normalize": ["ingest"],
+    "enrich-tracks": ["normalize"],
+    "enrich-artists": ["enrich-tracks"],
+    "aggregate": ["normalize"],
+    "export": ["enrich-artists", "aggregate"],
+}
+
+# Artifact (file or directory in the output directory) of every stage
+STAGE_OUTPUTS = {
+    "ingest": "plays",
+    "normalize": "history.feather",
+    "enrich-tracks": "tracks.feather",
+    "enrich-artists": "artists.feather",
+    "aggregate": "stats",
+    "export": "export",
+}
+
+# Metadata that is requested for every track and artist
+TRACK_METADATA = ["name", "duration_ms", "explicit", "popularity"]
+ARTIST_METADATA = ["name", "genres", "popularity", "followers"]
+
+
+def get_downstream(stage):
+    """
+    Stage together with all stages that (indirectly) depend on it
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage
+
+    Return
+    ------
+    list of str
+        List of the stages, in order of execution
+    """
+
+    selected = {stage}
+    for name, deps in STAGES.items():
+        if selected.intersection(deps):
+            selected.add(name)
+    return [name for name in STAGES if name in selected]
+
+
+def hash_path(path, digest, content=True):
+    """
+    Add a file, or all files of a directory, to a fingerprint
+
+    Parameters
+    ----------
+    path : str
+        The path to the file or directory
+    digest : hashlib object
+        Fingerprint to be updated
+    content : bool, default True
+        Whether the content of the files is hashed, otherwise only their
+        size and modification time
+    """
+
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, files in os.walk(path)
+            for name in files
+        )
+    for ifile in paths:
+        digest.update(os.path.relpath(ifile, os.path.dirname(path)).encode())
+        if not os.path.exists(ifile):
+            continue
+        if content:
+            with open(ifile, "rb") as file:
+                for block in iter(functools.partial(file.read, 1 << 20), b""):
+                    digest.update(block)
+        else:
+            stat = os.stat(ifile)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+
+@dataclasses.dataclass
+class StageOptions:
+    """
+    Options of the stages, of which the export options are part of the
+    fingerprint of the export stage
+
+    Attributes
+    ----------
+    secret : str, default None
+        The path to the yaml file with your spotify credentials,
+        `spotify_secret.yaml` in the input directory if not provided
+    n_jobs : int, default None
+        Number of worker processes to load the history, and number of
+        stages that run concurrently. Uses the number of CPUs if not provided
+    export_format : str, default 'parquet'
+        Format of the exported tables ('parquet', 'feather' or 'csv')
+    partition : bool, default False
+        Whether the exported plays are partitioned by year and month
+    metrics : Metrics, default None
+        Metrics of the stages, the history loading and the requests to
+        Spotify web API, emitted to its sinks after every stage
+    """
+
+    secret: str = None
+    n_jobs: int = None
+    export_format: str = "parquet"
+    partition: bool = False
+    metrics: Metrics = None
+
+
+class StageRunner:
+    """
+    Class to run the stages of the analysis of a Spotify streaming history,
+    skipping the stages of which the inputs did not change
+
+    Attributes
+    ----------
+    inputdir : str
+        The path to the input directory where your Spotify streaming
+        history json files are stored
+    outputdir : str
+        The path to the directory with the artifacts of all stages
+    options : StageOptions, default None
+        Credentials, parallelism, export format and metrics of the
+        stages. `StageOptions()` if not provided
+    state : dict
+        Dictionary with the fingerprint of the inputs of every stage that ran
+    """
+
+    def __init__(
+        self,
+        inputdir,
+        outputdir,
+        options=None,
+    ):
+        self.inputdir = inputdir
+        self.outputdir = outputdir
+        self.options = StageOptions() if options is None else options
+        if self.options.secret is None:
+            self.options = dataclasses.replace(
+                self.options, secret=os.path.join(inputdir, "spotify_secret.yaml")
+            )
+
+        os.makedirs(outputdir, exist_ok=True)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                self.state = json.load(file)
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._cache = None
+
+    @property
+    def state_path(self):
+        """
+        The path to the fingerprints of the stages
+        """
+
+        return os.path.join(self.outputdir, "stages.json")
+
+    def get_path(self, stage):
+        """
+        The path to the artifact of a stage
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Return
+        ------
+        str
+            The path to the file or directory of the artifact
+        """
+
+        return os.path.join(self.outputdir, STAGE_OUTPUTS[stage])
+
+    def get_params(self, stage):
+        """
+        Parameters of a stage, which are part of its fingerprint
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Return
+        ------
+        dict
+            Dictionary with the parameters of the stage
+        """
+
+        if stage == "enrich-tracks":
+            return {"metadata": TRACK_METADATA + LINK_FIELDS}
+        if stage == "enrich-artists":
+            return {"metadata": ARTIST_METADATA}
+        if stage == "export":
+            return {
+                "format": self.options.export_format,
+                "partition": self.options.partition,
+            }
+        return {}
+
+    def fingerprint(self, stage):
+        """
+        Fingerprint of the inputs of a stage: the content of the artifacts
+        of the stages it depends on, and its parameters. The history files
+        are fingerprinted by their size and modification time
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Return
+        ------
+        str
+            Hexadecimal sha1 of the inputs
+        """
+
+        digest = hashlib.sha1()
+        digest.update(json.dumps(self.get_params(stage), sort_keys=True).encode())
+        if stage == "ingest":
+            for ifile in find_history_files(self.inputdir):
+                hash_path(ifile, digest, content=False)
+        for dep in STAGES[stage]:
+            hash_path(self.get_path(dep), digest)
+        return digest.hexdigest()
+
+    def is_up_to_date(self, stage):
+        """
+        Whether a stage ran before with the same inputs
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Return
+        ------
+        bool
+            True if the stage can be skipped
+        """
+
+        return os.path.exists(self.get_path(stage)) and self.state.get(
+            stage
+        ) == self.fingerprint(stage)
+
+    def run(self, stages=None, force=False):
+        """
+        Run stages, concurrently as soon as the stages they depend on are
+        done. Stages of which the inputs did not change are skipped
+
+        Parameters
+        ----------
+        stages : list of str, default None
+            List of the stages to run, all stages if not provided. Stages
+            that are not selected are assumed to be done
+        force : bool, default False
+            Whether the selected stages run even if they are up to date
+
+        Return
+        ------
+        list of str
+            List of the stages that ran (i.e. were not skipped)
+        """
+
+        pending = [stage for stage in STAGES if stages is None or stage in stages]
+        done = set(STAGES).difference(pending)
+        executed = []
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.options.n_jobs) as executor:
+                running = {}
+                while pending or running:
+                    for stage in list(pending):
+                        if done.issuperset(STAGES[stage]):
+                            pending.remove(stage)
+                            future = executor.submit(self.run_stage, stage, force)
+                            running[future] = stage
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        stage = running.pop(future)
+                        if future.result():
+                            executed.append(stage)
+                        done.add(stage)
+        finally:
+            if self._session is not None:
+                self._session.close()
+            if self._cache is not None:
+                self._cache.close()
+        return executed
+
+    def run_stage(self, stage, force=False):
+        """
+        Run a single stage if its inputs changed, and record their
+        fingerprint. The fingerprint is not recorded if the stage raises,
+        such that the stage runs again next time
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+        force : bool, default False
+            Whether the stage runs even if it is up to date
+
+        Return
+        ------
+        bool
+            True if the stage ran, False if it was skipped
+        """
+
+        fingerprint = self.fingerprint(stage)
+        if not force and self.is_up_to_date(stage):
+            logging.info("Stage %s is up to date", stage)
+            return False
+
+        logging.info("Running stage %s", stage)
+        if self.options.metrics is None:
+            getattr(self, "stage_" + stage.replace("-", "_"))()
+        else:
+            with self.options.metrics.timer("pipeline_stage_seconds", stage=stage):
+                getattr(self, "stage_" + stage.replace("-", "_"))()
+        with self._lock:
+            self.state[stage] = fingerprint
+            with open(self.state_path, "w", encoding="utf-8") as file:
+                json.dump(self.state, file, indent=1)
+            if self.options.metrics is not None:
+                self.options.metrics.emit()
+        return True
+
+    def get_client(self, reference):
+        """
+        Spotify client of a reference, sharing one session and cache.
+        Raises a FileNotFoundError if the file with the credentials is
+        missing
+
+        Parameters
+        ----------
+        reference : str
+            Spotify reference ('tracks' or 'artists')
+
+        Return
+        ------
+        Spotify
+            Spotify client of the reference
+        """
+
+        with self._lock:
+            if self._session is None:
+                if not os.path.exists(self.options.secret):
+                    raise FileNotFoundError(
+                        f"No Spotify credentials found at {self.options.secret}"
+                    )
+                self._session = SpotifySession(metrics=self.options.metrics)
+                self._session.get_spotify_credentials(self.options.secret)
+                self._cache = MetadataCache(
+                    os.path.join(self.outputdir, "spotify_metadata_cache.sqlite")
+                )
+        return Spotify(reference=reference, session=self._session, cache=self._cache)
+
+    def access_metadata(self, stage, reference, uri_list):
+        """
+        Access the metadata of the uri's of an enrich stage. Raises a
+        RuntimeError if not all metadata could be accessed, such that the
+        stage is not recorded as done (the accessed metadata is cached)
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage ('enrich-tracks' or 'enrich-artists')
+        reference : str
+            Spotify reference ('tracks' or 'artists')
+        uri_list : list of str
+            List of Spotify uri's in string format to be accessed
+
+        Return
+        ------
+        Spotify
+            Spotify client with the accessed metadata
+        """
+
+        client = self.get_client(reference)
+        if not client.access_spotify_api_async(
+            uri_list, self.get_params(stage)["metadata"], MAX_IDS[reference]
+        ):
+            raise RuntimeError(
+                f"Stage {stage} failed to access the metadata of all {reference}"
+            )
+        return client
+
+    def read_artifact(self, stage, columns=None):
+        """
+        Read the (feather) artifact of a stage
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+        columns : list of str, default None
+            Columns to read, all if not provided
+
+        Return
+        ------
+        pandas.DataFrame
+            Content of the artifact
+        """
+
+        return feather.read_table(
+            self.get_path(stage), columns=columns, memory_map=True
+        ).to_pandas()
+
+    def write_artifact(self, stage, table):
+        """
+        Write the (feather) artifact of a stage
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+        table : pandas.DataFrame or pyarrow.Table
+            Content of the artifact
+        """
+
+        if isinstance(table, pd.DataFrame):
+            table = pa.Table.from_pandas(table, preserve_index=False)
+        feather.write_feather(table, self.get_path(stage))
+
+    def stage_ingest(self):
+        """
+        Add the plays of new or changed history files to the play store
+        """
+
+        store = PlayStore(self.get_path("ingest"), metrics=self.options.metrics)
+        store.ingest(self.inputdir, n_jobs=self.options.n_jobs)
+
+    def stage_normalize(self):
+        """
+        Normalize the columns of all plays (see
+        `modify_columns_spotify_history(df, compact=True)`)
+        """
+
+        df_songs = PlayStore(self.get_path("ingest")).load()
+        df_songs = modify_columns_spotify_history(
+            df_songs, compact=True, metrics=self.options.metrics
+        )
+        self.write_artifact("normalize", df_songs.reset_index(drop=True))
+
+    def stage_enrich_tracks(self):
+        """
+        Access the metadata of all tracks (including their artist ids)
+        """
+
+        df_songs = self.read_artifact("normalize", columns=["track_uri"])
+        uri_list = df_songs["track_uri"].dropna().unique().tolist()
+        client = self.access_metadata("enrich-tracks", "tracks", uri_list)
+        self.write_artifact("enrich-tracks", client.metadata.to_arrow("track_uri"))
+
+    def stage_enrich_artists(self):
+        """
+        Access the metadata of all artists of the tracks
+        """
+
+        uri_list = []
+        df_meta_track = self.read_artifact("enrich-tracks")
+        if "artist_ids" in df_meta_track.columns:
+            uri_list = df_meta_track["artist_ids"].explode().dropna().unique().tolist()
+        client = self.access_metadata("enrich-artists", "artists", uri_list)
+        self.write_artifact("enrich-artists", client.metadata.to_arrow("artist_uri"))
+
+    def stage_aggregate(self):
+        """
+        Compute the listening statistics of all plays from scratch
+        """
+
+        stats = ListeningStats()
+        stats.update(self.read_artifact("normalize"))
+        stats.stats_dir = self.get_path("aggregate")
+        os.makedirs(stats.stats_dir, exist_ok=True)
+        stats.save()
+
+    def stage_export(self):
+        """
+        Export the history (sorted by most listened songs) and the track and
+        artist metadata (see `export_plays()` and `export_table()`)
+        """
+
+        path = self.get_path("export")
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        stats = ListeningStats(self.get_path("aggregate"))
+        df_songs = self.read_artifact("normalize")
+        df_songs["c_unique_tr"] = stats.counts("track", df_songs["unique_tr"])
+        df_songs["c_unique_ar"] = stats.counts("artist", df_songs["artist_name"])
+        df_songs = df_songs.sort_values(by=["c_unique_tr"], ascending=False)
+        export_plays(
+            df_songs,
+            path,
+            "MySpotifyDataTable",
+            self.options.export_format,
+            partition=self.options.partition,
+        )
+
+        df_meta_track = self.read_artifact("enrich-tracks")
+        export_table(
+            df_meta_track, path, "TrackMetadataTable", self.options.export_format
+        )
+        df_meta_artist = self.read_artifact("enrich-artists")
+        export_table(
+            df_meta_artist, path, "ArtistMetadataTable", self.options.export_format
+        )
+        if "genres" in df_meta_artist.columns:
+            export_table(
+                df_meta_artist.explode("genres"),
+                path,
+                "ArtistMetadataTable_GenresExpanded",
+                self.options.export_format,
+            )
+
+
+def main(argv=None):
+    """
+    Run the stages of the analysis from the command line
+
+    Parameters
+    ----------
+    argv : list of str, default None
+        Command line arguments, `sys.argv[1:]` if not provided
+
+    Return
+    ------
+    list of str
+        List of the stages that ran
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="spotify_analysis", description="Analyse spotify input in stages"
+    )
+    parser.add_argument("input", type=str, help="Directory with input files")
+    parser.add_argument("output", type=str, help="Directory to store output files")
+    parser.add_argument("--secret", type=str, help="Yaml file with the credentials")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--only", nargs="+", choices=list(STAGES), help="Only run these stages"
+    )
+    selection.add_argument(
+        "--from",
+        dest="start",
+        choices=list(STAGES),
+        help="Run this stage and the stages that depend on it",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Run stages even if up to date"
+    )
+    add_export_arguments(parser)
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        help="File to write metrics to after every stage (.prom or .jsonl)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    stages = args.only
+    if args.start is not None:
+        stages = get_downstream(args.start)
+
+    options = StageOptions(
+        secret=args.secret,
+        n_jobs=args.jobs,
+        export_format=args.export_format,
+        partition=args.partition,
+        metrics=None if args.metrics is None else Metrics([get_sink(args.metrics)]),
+    )
+    runner = StageRunner(args.input, args.output, options)
+    return runner.run(stages, force=args.force)
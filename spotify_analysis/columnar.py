@@ -0,0 +1,446 @@
+"""
+Module with a columnar store for the metadata accessed via Spotify web API
+"""
+from array import array
+from collections.abc import MutableMapping
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+class Column:
+    """
+    Typed, growable buffer of the values of one metadata key. The type is
+    taken from the first non-null value: strings are interned and stored
+    as integer codes, booleans, integers and floats in typed arrays. Other
+    values (e.g. lists or dictionaries), or values that do not match the
+    type, are stored as Python objects. Buffers are shared with the arrays
+    returned by `to_pandas()`, and copied before the next modification.
+
+    Attributes
+    ----------
+    kind : str or None
+        Type of the column ('str', 'bool', 'int', 'float' or 'object'),
+        None as long as only null values were added
+    """
+
+    def __init__(self, n_rows=0):
+        self.kind = None
+        self._n_null = n_rows
+        self._values = None
+        self._mask = None
+        self._categories = []
+        self._codes = {}
+        self._exported = False
+
+    def __len__(self):
+        if self.kind is None:
+            return self._n_null
+        return len(self._values)
+
+    @staticmethod
+    def get_kind(value):
+        """
+        Type of the column that can store this value
+
+        Parameters
+        ----------
+        value : object
+            Non-null value of the metadata
+
+        Return
+        ------
+        str
+            Type of the column
+        """
+
+        if isinstance(value, str):
+            return "str"
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int) and -(2**63) <= value < 2**63:
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        return "object"
+
+    def _start(self, kind):
+        """
+        Create the buffer of the type of the first non-null value, and
+        fill it with the null values added before
+        """
+
+        n_rows = self._n_null
+        self.kind = kind
+        if kind == "str":
+            self._values = array("i", [-1]) * n_rows
+        elif kind == "bool":
+            self._values = array("b", [-1]) * n_rows
+        elif kind == "int":
+            self._values = array("q", [0]) * n_rows
+            self._mask = bytearray(b"\x01") * n_rows
+        elif kind == "float":
+            self._values = array("d", [np.nan]) * n_rows
+        else:
+            self._values = [None] * n_rows
+
+    def _to_object(self):
+        """
+        Convert the buffer to Python objects, in case of mixed types
+        """
+
+        values = [self.get(row) for row in range(len(self))]
+        self.kind = "object"
+        self._values = values
+        self._mask = None
+
+    def _to_float(self):
+        """
+        Convert an integer buffer to floats, in case a float is added
+        """
+
+        values = array(
+            "d",
+            (
+                np.nan if null else value
+                for value, null in zip(self._values, self._mask)
+            ),
+        )
+        self.kind = "float"
+        self._values = values
+        self._mask = None
+
+    def _own(self):
+        """
+        Copy the buffers in case they are shared with an exported array,
+        such that the exported array is not modified
+        """
+
+        if self._exported:
+            self._values = self._values[:]
+            if self._mask is not None:
+                self._mask = bytearray(self._mask)
+            self._exported = False
+
+    def _encode(self, value):
+        """
+        Convert the value into the format stored in the buffer
+        """
+
+        if self.kind == "str":
+            if value is None:
+                return -1
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self._categories)
+                self._categories.append(value)
+            return code
+        if self.kind == "bool":
+            return -1 if value is None else int(value)
+        if self.kind == "int":
+            return 0 if value is None else value
+        if self.kind == "float":
+            return np.nan if value is None else value
+        return value
+
+    def _prepare(self, value):
+        """
+        Make sure the buffer can store the value
+        """
+
+        self._own()
+        if value is None:
+            return
+        kind = self.get_kind(value)
+        if self.kind is None:
+            self._start(kind)
+        elif kind == "int" and self.kind == "float":
+            pass
+        elif kind == "float" and self.kind == "int":
+            self._to_float()
+        elif self.kind not in (kind, "object"):
+            self._to_object()
+
+    def append(self, value):
+        """
+        Add a value to the end of the column
+
+        Parameters
+        ----------
+        value : object
+            Value of the metadata, None for null
+        """
+
+        self._prepare(value)
+        if self.kind is None:
+            self._n_null += 1
+            return
+        self._values.append(self._encode(value))
+        if self.kind == "int":
+            self._mask.append(value is None)
+
+    def set(self, row, value):
+        """
+        Overwrite the value of a row
+
+        Parameters
+        ----------
+        row : int
+            Index of the row
+        value : object
+            Value of the metadata, None for null
+        """
+
+        self._prepare(value)
+        if self.kind is None:
+            return
+        self._values[row] = self._encode(value)
+        if self.kind == "int":
+            self._mask[row] = value is None
+
+    def get(self, row):
+        """
+        Get the value of a row
+
+        Parameters
+        ----------
+        row : int
+            Index of the row
+
+        Return
+        ------
+        object
+            Value of the metadata, None for null
+        """
+
+        if self.kind is None:
+            return None
+        value = self._values[row]
+        if self.kind == "str":
+            return None if value == -1 else self._categories[value]
+        if self.kind == "bool":
+            return None if value == -1 else bool(value)
+        if self.kind == "int":
+            return None if self._mask[row] else value
+        if self.kind == "float":
+            return None if np.isnan(value) else value
+        return value
+
+    def to_pandas(self):
+        """
+        Convert the column into a pandas array. Typed buffers are wrapped
+        without copying, strings become categoricals
+
+        Return
+        ------
+        pandas.api.extensions.ExtensionArray or numpy.ndarray
+            Array with the values of the column
+        """
+
+        if self.kind is None:
+            return np.full(self._n_null, None, dtype=object)
+        self._exported = True
+        if self.kind == "str":
+            codes = np.frombuffer(self._values, dtype=np.int32)
+            return pd.Categorical.from_codes(codes, categories=self._categories)
+        if self.kind == "bool":
+            values = np.frombuffer(self._values, dtype=np.int8)
+            return pd.arrays.BooleanArray(values == 1, values == -1)
+        if self.kind == "int":
+            values = np.frombuffer(self._values, dtype=np.int64)
+            mask = np.frombuffer(self._mask, dtype=np.bool_)
+            return pd.arrays.IntegerArray(values, mask)
+        if self.kind == "float":
+            return np.frombuffer(self._values, dtype=np.float64)
+        values = np.empty(len(self._values), dtype=object)
+        values[:] = self._values
+        return values
+
+    def to_arrow(self):
+        """
+        Convert the column into an Arrow array. Strings become dictionary
+        encoded arrays
+
+        Return
+        ------
+        pyarrow.Array
+            Array with the values of the column
+        """
+
+        if self.kind == "str":
+            self._exported = True
+            codes = np.frombuffer(self._values, dtype=np.int32)
+            return pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes == -1),
+                pa.array(self._categories, pa.string()),
+            )
+        if self.kind in ("bool", "int"):
+            return pa.array(self.to_pandas())
+        if self.kind == "float":
+            return pa.array(self.to_pandas(), from_pandas=True)
+        if self.kind is None:
+            return pa.nulls(self._n_null)
+        return pa.array(self._values)
+
+
+class ColumnarStore(MutableMapping):
+    """
+    Columnar store of metadata, with the uri as keys. Behaves like the
+    dictionary of dictionaries it replaces (`store[uri] = {"name": ...}`),
+    but appends the values into typed column buffers and interns repeated
+    strings. Can be converted into a pandas dataframe or Arrow table.
+
+    Attributes
+    ----------
+    columns : dict
+        Dictionary with the `Column` buffers, with the metadata keys as keys
+    """
+
+    def __init__(self, items=None):
+        self.columns = {}
+        self._uri = []
+        self._rows = {}
+        if items is not None:
+            self.update(items)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._uri)
+
+    def __contains__(self, uri):
+        return uri in self._rows
+
+    def __getitem__(self, uri):
+        row = self._rows[uri]
+        return {name: column.get(row) for name, column in self.columns.items()}
+
+    def __setitem__(self, uri, values):
+        row = self._rows.get(uri)
+        if row is None:
+            row = self._rows[uri] = len(self._uri)
+            self._uri.append(uri)
+            for name, column in self.columns.items():
+                column.append(values.get(name))
+        else:
+            for name, column in self.columns.items():
+                column.set(row, values.get(name))
+
+        for name, value in values.items():
+            if name not in self.columns:
+                column = self.columns[name] = Column(len(self._uri))
+                column.set(row, value)
+
+    def __delitem__(self, uri):
+        raise NotImplementedError("Uri's cannot be removed from a ColumnarStore")
+
+    def to_pandas(self, key="uri"):
+        """
+        Convert the store into a pandas dataframe, with the uri as first
+        column
+
+        Parameters
+        ----------
+        key : str, default 'uri'
+            Name of the column with the uri's
+
+        Return
+        ------
+        pandas.DataFrame
+            Dataframe with one row per uri and one column per metadata key
+        """
+
+        data = {key: np.array(self._uri, dtype=object)}
+        data.update({name: column.to_pandas() for name, column in self.columns.items()})
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self, key="uri"):
+        """
+        Convert the store into an Arrow table, with the uri as first column
+
+        Parameters
+        ----------
+        key : str, default 'uri'
+            Name of the column with the uri's
+
+        Return
+        ------
+        pyarrow.Table
+            Table with one row per uri and one column per metadata key
+        """
+
+        arrays = [pa.array(self._uri, pa.string())]
+        arrays.extend(column.to_arrow() for column in self.columns.values())
+        return pa.Table.from_arrays(arrays, names=[key, *self.columns])
+
+    def merge(self, df, key="uri"):
+        """
+        Merge previously stored metadata (e.g. a metadata table of an
+        earlier run) into the store. Uri's already in the store are kept.
+        Values are converted into Python objects (see `to_python()`), such
+        that typed columns keep their type
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Dataframe with one row per uri, as returned by `to_pandas(key)`
+        key : str, default 'uri'
+            Name of the column with the uri's
+        """
+
+        names = [name for name in df.columns if name != key]
+        columns = [df[name].tolist() for name in names]
+        for uri, *values in zip(df[key].tolist(), *columns):
+            if uri not in self._rows:
+                self[uri] = {
+                    name: to_python(value) for name, value in zip(names, values)
+                }
+
+
+def is_null(value):
+    """
+    Whether a value of a dataframe is null (None, NaN or NA)
+
+    Parameters
+    ----------
+    value : object
+        Value to be checked, can also be a list or dictionary
+
+    Return
+    ------
+    bool
+        True if the value is null
+    """
+
+    return (
+        value is None
+        or value is pd.NA
+        or (isinstance(value, float) and np.isnan(value))
+    )
+
+
+def to_python(value):
+    """
+    Convert a value of a dataframe into a Python object: nulls into None,
+    numpy scalars into Python scalars and arrays (e.g. lists read from
+    Arrow) into lists
+
+    Parameters
+    ----------
+    value : object
+        Value of a dataframe
+
+    Return
+    ------
+    object
+        The value as Python object, None if it is null
+    """
+
+    if is_null(value):
+        return None
+    if isinstance(value, np.ndarray):
+        return [to_python(item) for item in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,228 @@
+"""
+Module to export the streaming history and metadata tables in compressed
+columnar formats (Parquet or Feather), optionally partitioned by year and
+month, or as CSV written in chunks
+"""
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import feather
+import pyarrow.parquet as pq
+
+
+# File extension of every export format
+EXPORT_FORMATS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+
+def add_export_arguments(parser):
+    """
+    Add the command line options of the export format (`--format`) and
+    partitioning (`--partition`) to a parser
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        Parser of the command line arguments
+    """
+
+    parser.add_argument(
+        "--format",
+        dest="export_format",
+        choices=list(EXPORT_FORMATS),
+        default="parquet",
+        help="Format of the exported tables",
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Partition the exported plays by year and month",
+    )
+
+
+def to_arrow(df):
+    """
+    Convert a dataframe into an Arrow table, keeping categoricals as
+    dictionary arrays
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe to be converted
+
+    Return
+    ------
+    pyarrow.Table
+        Table with the columns of the dataframe (without its index)
+    """
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_csv_chunked(frames, path, chunksize=100000):
+    """
+    Write dataframes into a single .csv file, in chunks of at most
+    `chunksize` rows, such that the formatting never holds the full table
+
+    Parameters
+    ----------
+    frames : pandas.DataFrame or iterable of pandas.DataFrame
+        Dataframe, or dataframes with the same columns (e.g. from
+        `iter_spotify_history(inputdir, chunksize)`)
+    path : str
+        The path of the .csv file
+    chunksize : int, default 100000
+        Maximum number of rows formatted at once
+
+    Return
+    ------
+    int
+        Number of rows written
+    """
+
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+
+    n_rows = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        for df in frames:
+            for ibx in range(0, len(df), chunksize):
+                df.iloc[ibx : ibx + chunksize].to_csv(
+                    file, header=n_rows == 0, index=False
+                )
+                n_rows += min(chunksize, len(df) - ibx)
+    return n_rows
+
+
+def export_table(df, outputdir, name, file_format="parquet", compression="zstd"):
+    """
+    Export a table (e.g. the track metadata) into a single file
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Table to be exported
+    outputdir : str
+        The path to the output directory
+    name : str
+        Name of the file, without extension
+    file_format : str, default 'parquet'
+        Format of the file ('parquet', 'feather' or 'csv')
+    compression : str, default 'zstd'
+        Compression of the Parquet or Feather file
+
+    Return
+    ------
+    str
+        The path of the exported file
+    """
+
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}")
+
+    path = os.path.join(outputdir, name + EXPORT_FORMATS[file_format])
+    if file_format == "csv":
+        write_csv_chunked(df, path)
+    elif file_format == "feather":
+        feather.write_feather(to_arrow(df), path, compression=compression)
+    else:
+        pq.write_table(to_arrow(df), path, compression=compression)
+    return path
+
+
+def export_plays(
+    df, outputdir, name, file_format="parquet", *, partition=False, compression="zstd"
+):
+    """
+    Export the plays of the streaming history, optionally as a dataset
+    partitioned (Hive-style) by `year=YYYY/month=M` of `ts`
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with the Spotify streaming history
+    outputdir : str
+        The path to the output directory
+    name : str
+        Name of the file (or directory if partitioned), without extension
+    file_format : str, default 'parquet'
+        Format of the files ('parquet', 'feather' or 'csv')
+    partition : bool, default False
+        Whether the plays are partitioned by year and month. Plays without
+        valid `ts` are stored in the partition of null year and month
+    compression : str, default 'zstd'
+        Compression of the Parquet or Feather files
+
+    Return
+    ------
+    str
+        The path of the exported file or partitioned directory
+    """
+
+    if not partition:
+        return export_table(df, outputdir, name, file_format, compression)
+    if file_format == "csv":
+        raise ValueError("Partitioned exports are only supported for parquet/feather")
+
+    ts = pd.to_datetime(df["ts"], utc=True)
+    table = to_arrow(df).append_column(
+        "year", pa.array(ts.dt.year.astype("Int16"), pa.int16())
+    )
+    table = table.append_column(
+        "month", pa.array(ts.dt.month.astype("Int8"), pa.int8())
+    )
+
+    # Sorted plays are written in large row groups, one file per partition
+    table = table.sort_by([("year", "ascending"), ("month", "ascending")])
+
+    path = os.path.join(outputdir, name)
+    shutil.rmtree(path, ignore_errors=True)
+    if file_format == "feather":
+        file_options = ds.IpcFileFormat().make_write_options(compression=compression)
+    else:
+        file_options = ds.ParquetFileFormat().make_write_options(
+            compression=compression
+        )
+    ds.write_dataset(
+        table,
+        path,
+        format="ipc" if file_format == "feather" else "parquet",
+        partitioning=["year", "month"],
+        partitioning_flavor="hive",
+        file_options=file_options,
+    )
+    return path
+
+
+def read_export(path, filters=None):
+    """
+    Read an exported table or partitioned dataset, with its types (no
+    parsing needed for Parquet and Feather)
+
+    Parameters
+    ----------
+    path : str
+        The path of the exported file or partitioned directory
+    filters : pyarrow.compute.Expression, default None
+        Filter on the rows (e.g. `pc.field("year") == 2023`), which skips
+        the partitions that do not match
+
+    Return
+    ------
+    pandas.DataFrame
+        Exported table
+    """
+
+    if path.endswith(EXPORT_FORMATS["csv"]):
+        return pd.read_csv(path)
+    if path.endswith(EXPORT_FORMATS["feather"]):
+        return feather.read_table(path, memory_map=True).to_pandas()
+    if os.path.isdir(path):
+        file_format = "parquet"
+        for _, _, files in os.walk(path):
+            if any(name.endswith((".arrow", ".feather")) for name in files):
+                file_format = "ipc"
+        dataset = ds.dataset(path, format=file_format, partitioning="hive")
+        return dataset.to_table(filter=filters).to_pandas()
+    return pq.read_table(path, filters=filters).to_pandas()
@@ -0,0 +1,210 @@
+"""
+Module with a compiled, path-based extractor of fields from Spotify's
+metadata in json format
+
+A field spec is a list in which every element requests one field:
+
+- `"name"`: 1-deep key, stored as `name`
+- `["artists", "id"]`: 2-deep key, stored as `id`. In case the first key
+  holds a list only its first element is used (kept for compatibility)
+- `"album.images[0].url"`: path of arbitrary depth, stored as `url`.
+  `[n]` takes the n-th element of a list
+- `"artist_ids=artists[].id"`: `[]` fans out over all elements of a list
+  (e.g. all artists of a track), and `artist_ids=` sets the stored name
+- `{"name": "release", "path": "album.release_date", "default": ""}`:
+  dictionary form, with a default for missing (or null) values
+"""
+import json
+import re
+
+
+_INDEX = re.compile(r"^(?P<key>[^\[\]]*)(?P<index>(\[\d*\])*)$")
+_COMPILED = {}
+
+
+def parse_path(path):
+    """
+    Parse a path like `album.artists[].id` into its steps
+
+    Parameters
+    ----------
+    path : str
+        Dot-separated keys, optionally followed by `[n]` or `[]`
+
+    Return
+    ------
+    list of tuple
+        List of steps, being ("key", str), ("index", int) or ("all", None)
+    """
+
+    steps = []
+    for part in path.split("."):
+        match = _INDEX.match(part)
+        if match is None or (not match.group("key") and not match.group("index")):
+            raise ValueError(f"Invalid field path: {path}")
+        if match.group("key"):
+            steps.append(("key", match.group("key")))
+        for index in re.findall(r"\[(\d*)\]", match.group("index")):
+            steps.append(("index", int(index)) if index else ("all", None))
+    return steps
+
+
+def _compile_steps(steps):
+    """
+    Compile the steps of a path into a single function
+
+    Parameters
+    ----------
+    steps : list of tuple
+        List of steps as returned by `parse_path(path)`
+
+    Return
+    ------
+    function
+        Function returning the value at the path of a json item. Raises
+        KeyError, IndexError or TypeError if the path does not exist
+    """
+
+    if not steps:
+        return lambda value: value
+
+    kind, arg = steps[0]
+    rest = _compile_steps(steps[1:])
+    if kind in ("key", "index"):
+        return lambda value: rest(value[arg])
+    if kind == "first":
+        return lambda value: rest(value[0] if isinstance(value, list) else value)
+
+    def fan_out(value):
+        result = []
+        for element in value:
+            try:
+                result.append(rest(element))
+            except (KeyError, IndexError, TypeError):
+                result.append(None)
+        return result
+
+    return fan_out
+
+
+def _parse_field(field):
+    """
+    Convert one element of a field spec into its name, steps and default
+
+    Parameters
+    ----------
+    field : str, list of str or dict
+        One element of a field spec (see module documentation)
+
+    Return
+    ------
+    tuple
+        Tuple of the stored name, list of steps and default value
+    """
+
+    if isinstance(field, dict):
+        steps = parse_path(field["path"])
+        name = field.get("name") or [arg for kind, arg in steps if kind == "key"][-1]
+        return name, steps, field.get("default")
+
+    if isinstance(field, (list, tuple)):
+        steps = []
+        for key in field[:-1]:
+            steps.extend([("key", key), ("first", None)])
+        steps.append(("key", field[-1]))
+        return field[-1], steps, None
+
+    name, _, path = field.rpartition("=")
+    steps = parse_path(path.strip())
+    name = name.strip() or [arg for kind, arg in steps if kind == "key"][-1]
+    return name, steps, None
+
+
+class FieldExtractor:
+    """
+    Compiled field spec to extract the requested fields from Spotify's
+    metadata in json format. Use `compile_fields(metadata)` to get the
+    (cached) extractor of a field spec.
+
+    Attributes
+    ----------
+    names : list of str
+        Names under which the fields are stored
+    defaults : list
+        Default values of the fields, used if the path does not exist
+        or the value is null
+    """
+
+    def __init__(self, metadata):
+        parsed = [_parse_field(field) for field in metadata]
+        self.names = [name for name, _, _ in parsed]
+        self.defaults = [default for _, _, default in parsed]
+        self._getters = [_compile_steps(steps) for _, steps, _ in parsed]
+        self._fields = list(zip(self.names, self._getters, self.defaults))
+
+    def extract(self, item):
+        """
+        Extract the requested fields of one item
+
+        Parameters
+        ----------
+        item : dict
+            Spotify's metadata of one item (e.g. a track) in json format
+
+        Return
+        ------
+        dict
+            Dictionary with the requested fields, with the names as keys
+        """
+
+        result = {}
+        for name, getter, default in self._fields:
+            try:
+                value = getter(item)
+            except (KeyError, IndexError, TypeError):
+                value = None
+            result[name] = default if value is None else value
+        return result
+
+    def extract_batch(self, items):
+        """
+        Extract the requested fields of all items of a (batch) response in
+        one pass
+
+        Parameters
+        ----------
+        items : list of dict
+            List of Spotify's metadata in json format. Unknown items are
+            null in Spotify's response
+
+        Return
+        ------
+        list of dict or None
+            List with the requested fields of every item, None for null items
+        """
+
+        extract = self.extract
+        return [None if item is None else extract(item) for item in items]
+
+
+def compile_fields(metadata):
+    """
+    Get the compiled extractor of a field spec. Every field spec is only
+    compiled once
+
+    Parameters
+    ----------
+    metadata : list (of list) of str or dict
+        List of the metadata keys that are requested (see module
+        documentation for the syntax)
+
+    Return
+    ------
+    FieldExtractor
+        Compiled extractor of the field spec
+    """
+
+    key = json.dumps(metadata, sort_keys=True)
+    if key not in _COMPILED:
+        _COMPILED[key] = FieldExtractor(metadata)
+    return _COMPILED[key]
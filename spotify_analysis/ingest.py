@@ -0,0 +1,308 @@
+"""
+Module to incrementally ingest (overlapping) Spotify streaming history
+exports into a persistent, deduplicated store of plays
+"""
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+from spotify_analysis.utils import (
+    concat_history,
+    find_history_files,
+    load_history_files,
+    record_rows,
+)
+
+
+# Columns identifying a unique play
+PLAY_KEY = ["username", "ts", "spotify_track_uri", "spotify_episode_uri", "ms_played"]
+
+
+def get_play_keys(df):
+    """
+    Hash the columns identifying a play into a single 64-bit key
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with (part of) the Spotify streaming history
+
+    Return
+    ------
+    numpy.ndarray
+        Array with the uint64 key of every play
+    """
+
+    columns = [col for col in PLAY_KEY if col in df.columns]
+    key = df[columns].astype(object).where(df[columns].notna(), None)
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+
+class PlayStore:
+    """
+    Persistent store of plays, to which new streaming history exports are
+    incrementally added. Plays are deduplicated on `PLAY_KEY`, such that
+    overlapping exports do not produce duplicated plays. Source files that
+    were ingested before are skipped, and per account a high-watermark
+    (latest `ts`) is kept: plays after the watermark are known to be new
+    and are not checked against the stored keys. The keys are stored
+    next to every part, and are only loaded when plays at or before a
+    watermark have to be checked.
+
+    Attributes
+    ----------
+    store_dir : str
+        The path to the directory of the store
+    drop_pii : bool, default False
+        Whether the columns with personally identifiable information are
+        dropped at ingestion
+    stats : ListeningStats, default None
+        Listening statistics that are updated with the new plays
+    metrics : Metrics, default None
+        Metrics of the loaded files and of the plays that were new or
+        duplicated. No metrics are recorded if not provided
+    state : dict
+        Dictionary with the ingested source files, the watermarks per
+        account and the stored parts
+    """
+
+    def __init__(self, store_dir, drop_pii=False, stats=None, metrics=None):
+        self.store_dir = store_dir
+        self.drop_pii = drop_pii
+        self.stats = stats
+        self.metrics = metrics
+
+        os.makedirs(store_dir, exist_ok=True)
+        self.state = {"files": {}, "watermarks": {}, "parts": []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                self.state = json.load(file)
+
+        # Sorted arrays of the stored keys, None until they are needed
+        self._keys = None
+
+    def __len__(self):
+        return sum(
+            len(np.load(self.get_keys_path(part), mmap_mode="r"))
+            for part in self.state["parts"]
+        )
+
+    @property
+    def state_path(self):
+        """
+        The path to the state of the store
+        """
+
+        return os.path.join(self.store_dir, "state.json")
+
+    def get_keys_path(self, part):
+        """
+        The path to the keys of the plays of a stored part
+
+        Parameters
+        ----------
+        part : str
+            File name of the part, e.g. `plays-00042.feather`
+
+        Return
+        ------
+        str
+            The path to the keys, e.g. `keys-00042.npy`
+        """
+
+        number = part.removeprefix("plays-").removesuffix(".feather")
+        return os.path.join(self.store_dir, f"keys-{number}.npy")
+
+    def is_stored(self, keys):
+        """
+        Whether plays are in the store. The keys of all parts are loaded
+        (and sorted) on first use
+
+        Parameters
+        ----------
+        keys : numpy.ndarray
+            Array with the uint64 keys of the plays
+
+        Return
+        ------
+        numpy.ndarray
+            Boolean array that is True for the stored plays
+        """
+
+        if self._keys is None:
+            stored = [np.load(self.get_keys_path(part)) for part in self.state["parts"]]
+            self._keys = [np.sort(np.concatenate(stored))] if stored else []
+
+        found = np.zeros(len(keys), dtype=bool)
+        for sorted_keys in self._keys:
+            pos = np.searchsorted(sorted_keys, keys)
+            pos = np.minimum(pos, len(sorted_keys) - 1)
+            found |= sorted_keys[pos] == keys
+        return found
+
+    @property
+    def watermarks(self):
+        """
+        Dictionary with the latest `ts` of every account
+        """
+
+        return {user: pd.Timestamp(ts) for user, ts in self.state["watermarks"].items()}
+
+    def is_ingested(self, ifile):
+        """
+        Whether a source file was ingested before (and did not change)
+
+        Parameters
+        ----------
+        ifile : str
+            The path to the source file
+
+        Return
+        ------
+        bool
+            True if the file with this size and modification time was ingested
+        """
+
+        entry = self.state["files"].get(os.path.abspath(ifile))
+        stat = os.stat(ifile)
+        return entry == [stat.st_size, stat.st_mtime_ns]
+
+    def select_new(self, df):
+        """
+        Select the plays that are not yet in the store (nor duplicated
+        within the dataframe)
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Dataframe with (part of) the Spotify streaming history
+
+        Return
+        ------
+        tuple
+            Tuple of the dataframe with the new plays and their keys
+        """
+
+        keys = get_play_keys(df)
+        _, first = np.unique(keys, return_index=True)
+        unique = np.zeros(len(df), dtype=bool)
+        unique[first] = True
+
+        # Plays after the watermark of their account (or of an unknown
+        # account) are new for sure. Plays without valid `ts` are checked
+        after = np.zeros(len(df), dtype=bool)
+        if "username" in df.columns and "ts" in df.columns:
+            users = df["username"].astype(object).fillna("")
+            marks = pd.Series(self.watermarks, dtype=df["ts"].dtype).reindex(users)
+            marks.index = df.index
+            after = ((df["ts"] > marks) | (marks.isna() & df["ts"].notna())).to_numpy()
+
+        check = unique & ~after
+        seen = np.zeros(len(df), dtype=bool)
+        if check.any() and self.state["parts"]:
+            seen[check] = self.is_stored(keys[check])
+
+        new = unique & ~seen
+        return df.loc[new].reset_index(drop=True), keys[new]
+
+    def ingest(self, inputdir, n_jobs=None):
+        """
+        Add the plays of new or changed streaming history files to the store
+
+        Parameters
+        ----------
+        inputdir : str
+            The path to the input directory where your Spotify streaming
+            history json files are stored
+        n_jobs : int, default None
+            Number of worker processes. Uses the number of CPUs if not provided
+
+        Return
+        ------
+        int
+            Number of plays that were added to the store
+        """
+
+        input_file = [
+            ifile
+            for ifile in find_history_files(inputdir)
+            if not self.is_ingested(ifile)
+        ]
+
+        n_new, start = 0, time.perf_counter()
+        loaded = load_history_files(input_file, self.drop_pii, n_jobs, self.metrics)
+        for ifile, df in loaded:
+            n_rows = len(df)
+            df, keys = self.select_new(df)
+            if self.metrics is not None:
+                self.metrics.inc("ingest_plays_total", len(df), result="new")
+                self.metrics.inc(
+                    "ingest_plays_total", n_rows - len(df), result="duplicate"
+                )
+            if len(df) > 0:
+                part = f"plays-{len(self.state['parts']):05d}.feather"
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                feather.write_feather(table, os.path.join(self.store_dir, part))
+                np.save(self.get_keys_path(part), keys)
+                self.state["parts"].append(part)
+                if self._keys is not None:
+                    self._keys.append(np.sort(keys))
+                n_new += len(df)
+                self.update_watermarks(df)
+                if self.stats is not None:
+                    self.stats.update(df)
+
+            stat = os.stat(ifile)
+            self.state["files"][os.path.abspath(ifile)] = [
+                stat.st_size,
+                stat.st_mtime_ns,
+            ]
+
+        with open(self.state_path, "w", encoding="utf-8") as file:
+            json.dump(self.state, file, indent=1)
+        if self.stats is not None and self.stats.stats_dir is not None:
+            self.stats.save()
+        if self.metrics is not None:
+            record_rows(self.metrics, "ingest", n_new, time.perf_counter() - start)
+        return n_new
+
+    def update_watermarks(self, df):
+        """
+        Move the watermark of every account to its latest `ts`
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Dataframe with the plays that were added to the store
+        """
+
+        if "ts" not in df.columns or "username" not in df.columns:
+            return
+        latest = (
+            df.groupby(df["username"].astype(object).fillna(""))["ts"].max().dropna()
+        )
+        for user, ts in latest.items():
+            current = self.state["watermarks"].get(user)
+            if current is None or ts > pd.Timestamp(current):
+                self.state["watermarks"][user] = ts.isoformat()
+
+    def load(self):
+        """
+        Load all stored plays (memory-mapped) as pandas dataframe
+
+        Return
+        ------
+        pandas.DataFrame
+            Deduplicated Spotify streaming history
+        """
+
+        df_array = [
+            feather.read_table(
+                os.path.join(self.store_dir, part), memory_map=True
+            ).to_pandas()
+            for part in self.state["parts"]
+        ]
+        return concat_history(df_array)
@@ -0,0 +1,182 @@
+"""
+Module with an append-only journal to checkpoint and resume fetch jobs
+"""
+import json
+import logging
+import os
+import threading
+
+
+class FetchJournal:
+    """
+    Append-only journal in json-lines format of the uri's (and their
+    metadata) that were successfully accessed via Spotify web API. Every
+    processed request is written as one line, such that a crashed or
+    killed run can resume without accessing finished uri's again. Uri's
+    that Spotify returned as null are journaled with None as metadata.
+
+    Attributes
+    ----------
+    path : str
+        The file location of the journal
+    fsync : bool, default False
+        Whether every record is forced to disk (slower, but survives a
+        crash of the operating system and not only of the process)
+    completed : dict
+        Dictionary with the journaled metadata, stored with (reference,
+        requested metadata) as keys and dictionaries with uri as keys as
+        values
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.completed = {}
+
+        self._lock = threading.Lock()
+        needs_newline = self._load()
+        # pylint: disable=consider-using-with
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(len(items) for items in self.completed.values())
+
+    @staticmethod
+    def job_key(reference, metadata):
+        """
+        Key of the job that requested this metadata from this reference
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API is accessed
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
+
+        Return
+        ------
+        tuple
+            Tuple of the reference and requested metadata in json format
+        """
+
+        return reference, json.dumps(metadata, separators=(",", ":"))
+
+    def _load(self):
+        """
+        Read the existing journal into `self.completed`. A last line that
+        was only partially written (because the run was killed) is skipped
+
+        Return
+        ------
+        bool
+            Whether the journal does not end with a newline
+        """
+
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as file:
+            content = file.read()
+
+        for line in content.splitlines():
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning("Skipping incomplete record in %s", self.path)
+                continue
+            key = (record["reference"], record["fields"])
+            self.completed.setdefault(key, {}).update(record["metadata"])
+
+        return bool(content) and not content.endswith("\n")
+
+    def get_completed(self, reference, metadata):
+        """
+        Get the journaled metadata of a job
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API is accessed
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
+
+        Return
+        ------
+        dict
+            Dictionary with the journaled metadata, with the uri as keys
+        """
+
+        return self.completed.get(self.job_key(reference, metadata), {})
+
+    def record(self, reference, metadata, items):
+        """
+        Append the metadata of processed uri's to the journal
+
+        Parameters
+        ----------
+        reference : str
+            String that contains which metadata API was accessed
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+        items : dict
+            Dictionary with the metadata to be stored, with the uri as keys
+        """
+
+        if not items:
+            return
+
+        key = self.job_key(reference, metadata)
+        line = json.dumps({"reference": key[0], "fields": key[1], "metadata": items})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.completed.setdefault(key, {}).update(items)
+
+    def compact(self):
+        """
+        Rewrite the journal with a single record per job, removing
+        duplicated uri's and skipped incomplete records
+        """
+
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                for (reference, fields), items in self.completed.items():
+                    record = {
+                        "reference": reference,
+                        "fields": fields,
+                        "metadata": items,
+                    }
+                    file.write(json.dumps(record) + "\n")
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            # pylint: disable=consider-using-with
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        """
+        Close the journal file
+        """
+
+        self._file.close()
+
+    def discard(self):
+        """
+        Close and remove the journal, e.g. once the job has finished
+        """
+
+        self.close()
+        os.remove(self.path)
+        self.completed = {}
@@ -0,0 +1,399 @@
+"""
+Module with a lightweight registry of metrics (counters, gauges, histograms
+and timers) for the hot paths of fetching and ingesting. Instrumented code
+only records metrics if a `Metrics` object is given, such that disabled
+metrics cost a single `is None` check. Snapshots of the metrics are passed
+to pluggable sinks, i.e. callbacks such as `json_lines_sink(path)` or
+`prometheus_text_sink(path)`
+"""
+import bisect
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+
+# Upper bounds of the histogram buckets of durations in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the histogram buckets of counts (e.g. requests in flight)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Upper bounds of the histogram buckets of ratios
+RATIO_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, which keeps the count, sum and number of
+    observations per bucket (not the observations themselves)
+
+    Attributes
+    ----------
+    buckets : tuple of float
+        Upper bounds of the buckets, in increasing order
+    counts : list of int
+        Number of observations per bucket, the last one for the values
+        above the largest bound
+    count : int
+        Number of observations
+    total : float
+        Sum of the observations
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        """
+        Add an observation
+
+        Parameters
+        ----------
+        value : float
+            The observed value
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self):
+        """
+        Summary of the histogram
+
+        Return
+        ------
+        dict
+            Dictionary with the `count`, `sum` and the cumulative number of
+            observations per upper bound (`buckets`, with 'inf' as last)
+        """
+
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"count": self.count, "sum": self.total, "buckets": cumulative}
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms, identified by their name
+    and labels (e.g. `inc("spotify_requests_total", status="429")`). Safe
+    to use from multiple threads
+
+    Attributes
+    ----------
+    counters : dict
+        Value of every counter, with (name, labels) as keys
+    gauges : dict
+        Value of every gauge, with (name, labels) as keys
+    histograms : dict
+        `Histogram` of every histogram, with (name, labels) as keys
+
+    sinks : list of callable, default None
+        Callbacks to which every snapshot of `emit()` is passed
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter
+        value : float, default 1
+            Amount to be added
+        **labels
+            Labels of the counter
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Set a gauge to a value
+
+        Parameters
+        ----------
+        name : str
+            Name of the gauge
+        value : float
+            New value of the gauge
+        **labels
+            Labels of the gauge
+        """
+
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def add_gauge(self, name, value, **labels):
+        """
+        Add to a gauge, e.g. +1 and -1 around a request in flight
+
+        Parameters
+        ----------
+        name : str
+            Name of the gauge
+        value : float
+            Amount to be added
+        **labels
+            Labels of the gauge
+
+        Return
+        ------
+        float
+            New value of the gauge
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+            return self.gauges[key]
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        Add an observation to a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram
+        value : float
+            The observed value
+        buckets : tuple of float, default `LATENCY_BUCKETS`
+            Upper bounds of the buckets, used when the histogram is created
+        **labels
+            Labels of the histogram
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Observe the seconds spent in the `with` block in a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram
+        **labels
+            Labels of the histogram
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get(self, name, **labels):
+        """
+        Current value of a counter or gauge, or summary of a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric
+        **labels
+            Labels of the metric
+
+        Return
+        ------
+        float or dict or None
+            Value of the counter or gauge, `Histogram.to_dict()` of the
+            histogram, None if the metric was never recorded
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self.histograms:
+                return self.histograms[key].to_dict()
+            return self.counters.get(key, self.gauges.get(key))
+
+    def snapshot(self):
+        """
+        Snapshot of all metrics
+
+        Return
+        ------
+        dict
+            Dictionary with the `time` of the snapshot and a list of the
+            `counters`, `gauges` and `histograms` (each with their `name`,
+            `labels` and value or summary)
+        """
+
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **hist.to_dict()}
+                    for (name, labels), hist in sorted(self.histograms.items())
+                ],
+            }
+
+    def emit(self):
+        """
+        Pass a snapshot of all metrics to every sink
+
+        Return
+        ------
+        dict
+            The snapshot that was passed to the sinks
+        """
+
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink(snapshot)
+        return snapshot
+
+
+def format_labels(labels, **extra):
+    """
+    Labels in the Prometheus text format, e.g. `{reference="tracks"}`
+
+    Parameters
+    ----------
+    labels : dict
+        Labels of the metric
+    **extra
+        Additional labels (e.g. `le` of a histogram bucket)
+
+    Return
+    ------
+    str
+        The formatted labels, empty if there are none
+    """
+
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    values = [f'{key}="{json.dumps(str(val))[1:-1]}"' for key, val in labels.items()]
+    return "{" + ",".join(values) + "}"
+
+
+def to_prometheus_text(snapshot):
+    """
+    Convert a snapshot into the Prometheus text exposition format
+
+    Parameters
+    ----------
+    snapshot : dict
+        Snapshot as returned by `Metrics.snapshot()`
+
+    Return
+    ------
+    str
+        The metrics in the Prometheus text format
+    """
+
+    lines, typed = [], set()
+    for kind in ["counters", "gauges", "histograms"]:
+        for metric in snapshot[kind]:
+            name, labels = metric["name"], metric["labels"]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind[:-1]}")
+            if kind != "histograms":
+                lines.append(f"{name}{format_labels(labels)} {metric['value']}")
+                continue
+            for bound, count in metric["buckets"].items():
+                bound = "+Inf" if bound == "inf" else bound
+                lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {metric['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {metric['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def json_lines_sink(path):
+    """
+    Sink that appends every snapshot as a line to a JSON lines file
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON lines file
+
+    Return
+    ------
+    callable
+        Callback taking a snapshot
+    """
+
+    def sink(snapshot):
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+    return sink
+
+
+def prometheus_text_sink(path):
+    """
+    Sink that writes the latest snapshot in the Prometheus text format, e.g.
+    for the textfile collector of the node exporter. The file is replaced
+    atomically, such that it is never read half-written
+
+    Parameters
+    ----------
+    path : str
+        The path of the .prom file
+
+    Return
+    ------
+    callable
+        Callback taking a snapshot
+    """
+
+    def sink(snapshot):
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(to_prometheus_text(snapshot))
+        os.replace(path + ".tmp", path)
+
+    return sink
+
+
+def get_sink(path):
+    """
+    Sink of a file, chosen by its extension: the Prometheus text format for
+    '.prom' files, JSON lines otherwise
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+
+    Return
+    ------
+    callable
+        Callback taking a snapshot
+    """
+
+    if path.endswith(".prom"):
+        return prometheus_text_sink(path)
+    return json_lines_sink(path)
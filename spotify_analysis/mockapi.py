@@ -0,0 +1,529 @@
+"""
+Module with a local, in-process stand-in for the Spotify accounts service
+and the `/v1/tracks`, `/v1/artists` and `/v1/albums` endpoints of Spotify
+web API. Latency, rate limits, 429/5xx responses and token expiry can be
+configured, such that the fetch paths can be tested and benchmarked offline
+"""
+import asyncio
+import collections
+import random
+import threading
+import time
+import uuid
+import zlib
+from aiohttp import web
+from spotify_analysis.auth import SpotifySession
+from spotify_analysis.spotify import MAX_IDS
+
+
+# Address the server listens to, on a free port
+HOST = "127.0.0.1"
+
+
+def get_seed(uri):
+    """
+    Deterministic number of an uri, used to generate its fake metadata
+
+    Parameters
+    ----------
+    uri : str
+        Spotify uri in string format
+
+    Return
+    ------
+    int
+        Unsigned 32-bit checksum of the uri
+    """
+
+    return zlib.crc32(uri.encode())
+
+
+def make_item(reference, uri, n_artists=1000, n_albums=500):
+    """
+    Fake metadata of a track, artist or album, with the fields of the
+    Spotify web API responses. The same uri always gets the same metadata
+
+    Parameters
+    ----------
+    reference : str
+        Endpoint of the item ('tracks', 'artists' or 'albums')
+    uri : str
+        Spotify uri in string format
+    n_artists : int, default 1000
+        Number of distinct artists the tracks refer to
+    n_albums : int, default 500
+        Number of distinct albums the tracks refer to
+
+    Return
+    ------
+    dict
+        Dictionary with the metadata of the item
+    """
+
+    seed = get_seed(uri)
+    item = {"id": uri, "name": f"name_{uri}", "popularity": seed % 101}
+    if reference == "tracks":
+        artists = dict.fromkeys([seed % n_artists, (seed // 7) % n_artists])
+        item["artists"] = [
+            {"id": f"ar{number}", "name": f"name_ar{number}"} for number in artists
+        ]
+        item["album"] = {"id": f"al{seed % n_albums}", "name": f"name_al{seed}"}
+        item["duration_ms"] = 60000 + seed % 300000
+        item["explicit"] = seed % 5 == 0
+    elif reference == "artists":
+        item["genres"] = [f"genre_{seed % 50}", f"genre_{(seed // 50) % 50}"][
+            : 1 + seed % 2
+        ]
+        item["followers"] = {"href": None, "total": seed % 1000000}
+    else:
+        item["release_date"] = f"{1960 + seed % 65}-01-01"
+        item["total_tracks"] = 1 + seed % 20
+        item["label"] = f"label_{seed % 30}"
+    return item
+
+
+class RollingRateLimit:
+    """
+    Rate limit of the mock server over a rolling window of time
+
+    Attributes
+    ----------
+    rate_limit : float, default None
+        Number of requests per second allowed in a rolling `window`.
+        Requests above the limit get a 429 response. No limit if None
+    window : float, default 1
+        Seconds of the rolling window of the rate limit
+    retry_after : float, default 1
+        Value of the `Retry-After` header of 429 responses
+    """
+
+    def __init__(self, rate_limit=None, window=1.0, retry_after=1.0):
+        self.rate_limit = rate_limit
+        self.window = window
+        self.retry_after = retry_after
+        self._arrivals = collections.deque()
+
+    def admit(self, now):
+        """
+        Record the arrival of a request, and decide whether it is within
+        the rate limit
+
+        Parameters
+        ----------
+        now : float
+            Monotonic time at which the request arrived
+
+        Return
+        ------
+        bool
+            True if the request is allowed
+        """
+
+        self._arrivals.append(now)
+        while self._arrivals[0] <= now - self.window:
+            self._arrivals.popleft()
+        return (
+            self.rate_limit is None
+            or len(self._arrivals) <= self.rate_limit * self.window
+        )
+
+    def reset(self):
+        """
+        Forget the requests in the rolling window
+        """
+
+        self._arrivals.clear()
+
+
+class RandomFaults:
+    """
+    Random latency, throttling and server errors of the mock server
+
+    Attributes
+    ----------
+    latency : float, default 0
+        Seconds every response is delayed
+    jitter : float, default 0
+        Maximum of the random seconds added to `latency`
+    throttle_rate : float, default 0
+        Probability that a request gets a 429 response anyhow
+    error_rate : float, default 0
+        Probability that a request gets a 503 response
+    """
+
+    def __init__(
+        self, latency=0.0, jitter=0.0, *, throttle_rate=0.0, error_rate=0.0, seed=0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def delay(self):
+        """
+        Seconds the next response is delayed
+
+        Return
+        ------
+        float
+            `latency` plus a random jitter
+        """
+
+        return self.latency + self._random.uniform(0, self.jitter)
+
+    def throttled(self):
+        """
+        Whether the next request gets a 429 response anyhow
+
+        Return
+        ------
+        bool
+            True with probability `throttle_rate`
+        """
+
+        return self._random.random() < self.throttle_rate
+
+    def failed(self):
+        """
+        Whether the next request gets a 503 response
+
+        Return
+        ------
+        bool
+            True with probability `error_rate`
+        """
+
+        return self._random.random() < self.error_rate
+
+
+class MockSpotifyAPI:
+    """
+    Local HTTP server that behaves like the Spotify accounts service and
+    the track, artist and album endpoints of Spotify web API. The server
+    runs in an event loop of a background thread, and listens on a free
+    port of `HOST`. Use as context manager, or call `start()` and `stop()`
+
+    Attributes
+    ----------
+    auth_url : str
+        URL of the token endpoint (client credentials flow)
+    base_url : str
+        URL of the mocked web API, to be used as `SpotifySession.base_url`
+    log : list of dict
+        Every handled API request, with the `reference`, number of ids
+        (`n_ids`), `status` and server-side `latency` in seconds
+    tokens : dict
+        Every issued access token, with the time it expires as values
+    port : int
+        Port the server listens to, None if it is not running
+    faults : RandomFaults
+        Random latency, throttling and server errors, of which the
+        settings are given by the arguments below
+    limit : RollingRateLimit
+        Rate limit, of which the settings are given by the arguments below
+
+    latency : float, default 0
+        Seconds every response is delayed
+    jitter : float, default 0
+        Maximum of the random seconds added to `latency`
+    rate_limit : float, default None
+        Number of requests per second allowed in a rolling `window`.
+        Requests above the limit get a 429 response. No limit if None
+    window : float, default 1
+        Seconds of the rolling window of the rate limit
+    retry_after : float, default 1
+        Value of the `Retry-After` header of 429 responses
+    throttle_rate : float, default 0
+        Probability that a request gets a 429 response anyhow
+    error_rate : float, default 0
+        Probability that a request gets a 503 response
+    token_ttl : float, default 3600
+        Seconds after which the server rejects an access token (401)
+    expires_in : float, default None
+        Seconds of validity that are reported to the client. Equal to
+        `token_ttl` if None. A larger value mimics tokens that are revoked
+        (or clocks that are skewed), such that the client only finds out
+        via the 401 response
+    seed : int, default 0
+        Seed of the random latencies and failures
+    """
+
+    def __init__(
+        self,
+        *,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit=None,
+        window=1.0,
+        retry_after=1.0,
+        throttle_rate=0.0,
+        error_rate=0.0,
+        token_ttl=3600.0,
+        expires_in=None,
+        seed=0,
+    ):
+        self.faults = RandomFaults(
+            latency,
+            jitter,
+            throttle_rate=throttle_rate,
+            error_rate=error_rate,
+            seed=seed,
+        )
+        self.limit = RollingRateLimit(rate_limit, window, retry_after)
+        self.token_ttl = token_ttl
+        self.expires_in = token_ttl if expires_in is None else expires_in
+
+        self.log = []
+        self.tokens = {}
+        self._server = None
+
+    @property
+    def port(self):
+        """
+        Port the server listens to, None if it is not running
+        """
+
+        if self._server is None:
+            return None
+        return self._server[2].addresses[0][1]
+
+    @property
+    def auth_url(self):
+        """
+        URL of the token endpoint
+        """
+
+        return f"http://{HOST}:{self.port}/api/token"
+
+    @property
+    def base_url(self):
+        """
+        URL of the mocked web API
+        """
+
+        return f"http://{HOST}:{self.port}/v1/"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Start the server in a background thread, and wait until it listens
+        """
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        runner = asyncio.run_coroutine_threadsafe(self.serve(), loop).result()
+        self._server = (loop, thread, runner)
+
+    async def serve(self):
+        """
+        Set up the routes and listen on a free port of `HOST`
+
+        Return
+        ------
+        aiohttp.web.AppRunner
+            The runner of the server, to be cleaned up when stopping
+        """
+
+        app = web.Application()
+        app.router.add_post("/api/token", self.handle_token)
+        app.router.add_get("/v1/{reference}", self.handle_items)
+        app.router.add_get("/v1/{reference}/{uri}", self.handle_items)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, HOST, 0).start()
+        return runner
+
+    def stop(self):
+        """
+        Stop the server and its background thread
+        """
+
+        if self._server is None:
+            return
+        loop, thread, runner = self._server
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._server = None
+
+    def get_session(self, **kwargs):
+        """
+        Session with (fake) credentials that accesses this server
+
+        Parameters
+        ----------
+        **kwargs
+            Other arguments of `SpotifySession` (e.g. `rate_limiter`)
+
+        Return
+        ------
+        SpotifySession
+            Session of which the token and API requests go to this server
+        """
+
+        return SpotifySession(
+            cred={"CLIENT_ID": "mock_id", "CLIENT_SECRET": "mock_secret"},
+            auth_url=self.auth_url,
+            base_url=self.base_url,
+            **kwargs,
+        )
+
+    def stats(self):
+        """
+        Summary of the handled API requests
+
+        Return
+        ------
+        dict
+            Dictionary with the number of `requests`, the number of
+            `items` returned, the number of `tokens` issued and the number
+            of responses per `status`
+        """
+
+        statuses = collections.Counter(entry["status"] for entry in self.log)
+        return {
+            "requests": len(self.log),
+            "items": sum(e["n_ids"] for e in self.log if e["status"] == 200),
+            "tokens": len(self.tokens),
+            "status": dict(sorted(statuses.items())),
+        }
+
+    def reset(self):
+        """
+        Forget the handled requests, issued tokens and rate-limit window
+        """
+
+        self.log.clear()
+        self.tokens.clear()
+        self.limit.reset()
+
+    async def handle_token(self, request):
+        """
+        Issue an access token for the client credentials flow
+
+        Parameters
+        ----------
+        request : aiohttp.web.Request
+            The token request, with the credentials as form data
+
+        Return
+        ------
+        aiohttp.web.Response
+            JSON response with `access_token` and `expires_in`
+        """
+
+        data = await request.post()
+        if data.get("grant_type") != "client_credentials" or not (
+            data.get("client_id") and data.get("client_secret")
+        ):
+            return web.json_response({"error": "invalid_client"}, status=400)
+
+        access_token = uuid.uuid4().hex
+        self.tokens[access_token] = time.time() + self.token_ttl
+        return web.json_response(
+            {
+                "access_token": access_token,
+                "token_type": "Bearer",
+                "expires_in": self.expires_in,
+            }
+        )
+
+    def check_request(self, request, now):
+        """
+        Decide on the failure of an API request: rejected token, rate
+        limit, or random throttling and server errors
+
+        Parameters
+        ----------
+        request : aiohttp.web.Request
+            The API request
+        now : float
+            Monotonic time at which the request arrived
+
+        Return
+        ------
+        aiohttp.web.Response or None
+            The error response, None if the request succeeds
+        """
+
+        access_token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if self.tokens.get(access_token, 0.0) <= time.time():
+            return web.json_response(
+                {"error": {"status": 401, "message": "The access token expired"}},
+                status=401,
+            )
+
+        admitted = self.limit.admit(now)
+        if self.faults.throttled() or not admitted:
+            return web.json_response(
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                status=429,
+                headers={"Retry-After": str(self.limit.retry_after)},
+            )
+        if self.faults.failed():
+            return web.json_response(
+                {"error": {"status": 503, "message": "Service unavailable"}},
+                status=503,
+            )
+        return None
+
+    async def handle_items(self, request):
+        """
+        Answer a request of one item (`/v1/tracks/{id}`) or of multiple
+        items (`/v1/tracks?ids=...`)
+
+        Parameters
+        ----------
+        request : aiohttp.web.Request
+            The API request
+
+        Return
+        ------
+        aiohttp.web.Response
+            JSON response with the metadata, or with the error
+        """
+
+        now = time.monotonic()
+        reference = request.match_info["reference"]
+        if "uri" in request.match_info:
+            ids = [request.match_info["uri"]]
+        else:
+            ids = [uri for uri in request.query.get("ids", "").split(",") if uri]
+
+        response = self.check_request(request, now)
+        if response is None and reference not in MAX_IDS:
+            response = web.json_response(
+                {"error": {"status": 404, "message": "Service not found"}}, status=404
+            )
+        elif response is None and not 0 < len(ids) <= MAX_IDS[reference]:
+            response = web.json_response(
+                {"error": {"status": 400, "message": "Invalid number of ids"}},
+                status=400,
+            )
+        elif response is None:
+            items = [make_item(reference, uri) for uri in ids]
+            response = web.json_response(
+                items[0] if "uri" in request.match_info else {reference: items}
+            )
+
+        delay = self.faults.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.log.append(
+            {
+                "reference": reference,
+                "n_ids": len(ids),
+                "status": response.status,
+                "latency": time.monotonic() - now,
+            }
+        )
+        return response
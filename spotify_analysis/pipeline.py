@@ -0,0 +1,254 @@
+"""
+Module with a pipelined enrichment of tracks with their artist and album
+metadata via Spotify web API
+"""
+import asyncio
+import itertools
+from tqdm import tqdm
+from spotify_analysis.spotify import MAX_IDS, Spotify
+
+
+# Track metadata linking a track to all its artists and to its album
+LINK_FIELDS = ["artist_ids=artists[].id", "album_id=album.id"]
+
+
+class LinkedStage:
+    """
+    Stage of the pipeline that accesses the metadata of the artists or
+    albums linked to the tracks. Ids are deduplicated, checked against the
+    journal and cache of the client, and packed in full requests as soon
+    as enough ids are found
+
+    Attributes
+    ----------
+    client : Spotify
+        Spotify client of the artists or albums
+    metadata : list (of list) of str
+        List of the metadata keys that are requested to be saved
+    n_uri : int
+        Integer of how many uri's are accessed in the same request
+    seen : set
+        Set of all ids that were added to the stage
+    pending : list of str
+        List of ids that still need to be accessed
+    """
+
+    def __init__(self, client, metadata, n_uri):
+        self.client = client
+        self.metadata = metadata
+        self.n_uri = n_uri
+        self.seen = set()
+        self.pending = []
+
+    def add(self, ids):
+        """
+        Add ids to the stage
+
+        Parameters
+        ----------
+        ids : list of str
+            List of Spotify ids, possibly already seen before
+
+        Return
+        ------
+        list of list of str
+            Full batches of ids that are ready to be accessed
+        """
+
+        new_ids = []
+        for uri in ids:
+            if uri is not None and uri not in self.seen:
+                self.seen.add(uri)
+                new_ids.append(uri)
+        if new_ids:
+            self.pending.extend(self.client.get_cached_metadata(new_ids, self.metadata))
+
+        batches = []
+        while len(self.pending) >= self.n_uri:
+            batches.append(self.pending[: self.n_uri])
+            self.pending = self.pending[self.n_uri :]
+        return batches
+
+    def flush(self):
+        """
+        Take the remaining ids, which do not fill a complete request
+
+        Return
+        ------
+        list of list of str
+            Batch with the remaining ids (if any)
+        """
+
+        batches = [self.pending] if self.pending else []
+        self.pending = []
+        return batches
+
+
+class EnrichmentPipeline:
+    """
+    Class to access the metadata of tracks, together with the metadata of
+    their artists (and optionally albums), in a single pass. Artist and
+    album ids found in the track responses are directly put on
+    deduplicating stages, of which the requests run concurrently with the
+    remaining track requests, and take precedence over them. All requests
+    share the session, connection pool and concurrency limit.
+
+    Attributes
+    ----------
+    tracks : Spotify
+        Spotify client of the tracks. `tracks.metadata` also contains the
+        `artist_ids` and `album_id` of every track
+    artists : Spotify
+        Spotify client of the artists
+    albums : Spotify or None
+        Spotify client of the albums, None if no album metadata requested
+
+    track_metadata : list of str
+        List of the track metadata keys that are requested
+    artist_metadata : list (of list) of str
+        List of the artist metadata keys that are requested
+    album_metadata : list (of list) of str, default None
+        List of the album metadata keys that are requested. Albums are not
+        accessed if not provided
+    session : SpotifySession, default None
+        Session shared by all clients of the pipeline
+    max_concurrency : int, default 10
+        Integer of maximum number of requests in flight over all stages
+    cache : MetadataCache, default None
+        Persistent cache shared by all clients of the pipeline
+    journal : FetchJournal, default None
+        Checkpoint journal shared by all clients of the pipeline
+    """
+
+    def __init__(
+        self,
+        track_metadata,
+        artist_metadata,
+        album_metadata=None,
+        *,
+        session=None,
+        max_concurrency=10,
+        cache=None,
+        journal=None,
+    ):
+        self.track_metadata = list(track_metadata) + LINK_FIELDS
+        self.artist_metadata = artist_metadata
+        self.album_metadata = album_metadata
+        self.max_concurrency = max_concurrency
+
+        kwargs = {"cache": cache, "journal": journal}
+        self.tracks = Spotify(reference="tracks", session=session, **kwargs)
+        session = self.tracks.session
+        self.artists = Spotify(reference="artists", session=session, **kwargs)
+        self.albums = None
+        if album_metadata is not None:
+            self.albums = Spotify(reference="albums", session=session, **kwargs)
+
+    def run(self, uri_list):
+        """
+        Access the metadata of the tracks and their artists (and albums)
+
+        Parameters
+        ----------
+        uri_list : list of str
+            List of Spotify track uri's in string format to be accessed
+
+        Return
+        ------
+        bool
+            Boolean if accessing metadata was successful for all uri's
+        """
+
+        return asyncio.run(self.run_async(uri_list))
+
+    async def run_async(self, uri_list):
+        """
+        Asynchronous version of `run(uri_list)`, to be used from a running
+        event loop
+
+        Parameters
+        ----------
+        uri_list : list of str
+            List of Spotify track uri's in string format to be accessed
+
+        Return
+        ------
+        bool
+            Boolean if accessing metadata was successful for all uri's
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        stages = {
+            "artist_ids": LinkedStage(
+                self.artists, self.artist_metadata, MAX_IDS["artists"]
+            )
+        }
+        if self.albums is not None:
+            stages["album_id"] = LinkedStage(
+                self.albums, self.album_metadata, MAX_IDS["albums"]
+            )
+
+        uri_list = list(dict.fromkeys(uri_list))
+        to_access = self.tracks.get_cached_metadata(uri_list, self.track_metadata)
+        n_uri = MAX_IDS["tracks"]
+
+        # Batches of the linked stages go before the remaining track batches
+        queue = asyncio.PriorityQueue()
+        order = itertools.count()
+        results = []
+
+        def schedule(spotify, metadata, batches, priority=0):
+            for batch in batches:
+                queue.put_nowait((priority, next(order), spotify, batch, metadata))
+
+        def link(track_uris):
+            for field, stage in stages.items():
+                ids = []
+                for uri in track_uris:
+                    value = self.tracks.metadata.get(uri, {}).get(field)
+                    ids.extend(value if isinstance(value, list) else [value])
+                schedule(stage.client, stage.metadata, stage.add(ids))
+
+        async with self.tracks.session.client() as client:
+            with tqdm(total=len(uri_list), desc="tracks") as progress:
+                progress.update(len(uri_list) - len(to_access))
+
+                async def work():
+                    while True:
+                        _, _, spotify, batch, metadata = await queue.get()
+                        try:
+                            results.append(
+                                await spotify.fetch_batch(
+                                    client, semaphore, batch, metadata
+                                )
+                            )
+                            if spotify is self.tracks:
+                                progress.update(len(batch))
+                                link(batch)
+                        finally:
+                            queue.task_done()
+
+                async with asyncio.TaskGroup() as group:
+                    workers = [
+                        group.create_task(work()) for _ in range(self.max_concurrency)
+                    ]
+                    link([uri for uri in uri_list if uri in self.tracks.metadata])
+                    schedule(
+                        self.tracks,
+                        self.track_metadata,
+                        [
+                            to_access[ibx : ibx + n_uri]
+                            for ibx in range(0, len(to_access), n_uri)
+                        ],
+                        priority=1,
+                    )
+                    await queue.join()
+
+                    # Only when all tracks are known the incomplete batches are accessed
+                    for stage in stages.values():
+                        schedule(stage.client, stage.metadata, stage.flush())
+                    await queue.join()
+                    for worker in workers:
+                        worker.cancel()
+
+        return all(results)
@@ -0,0 +1,288 @@
+"""
+Module with an adaptive rate limiter for requests to Spotify web API
+"""
+import asyncio
+import email.utils
+import math
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket of which the refill rate can be changed at any time. The
+    bucket is allowed to go into debt, and can be paused as a whole
+
+    Attributes
+    ----------
+    rate : float, default 10
+        Number of tokens added to the bucket per second
+    burst : float, default 10
+        Maximum number of tokens in the bucket, i.e. number of requests
+        that can be made at once after an idle period
+    lock : threading.RLock
+        Lock guarding the tokens, which is also held while the rate is
+        changed
+    """
+
+    def __init__(self, rate=10.0, burst=10.0):
+        self.rate = rate
+        self.burst = burst
+
+        self.lock = threading.RLock()
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+
+    def reserve(self):
+        """
+        Take a token from the bucket. The bucket is allowed to go into
+        debt, such that concurrent callers are spaced by `1 / self.rate`
+
+        Return
+        ------
+        float
+            Number of seconds the caller should wait before making the
+            request
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= 1
+
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def pause(self, seconds):
+        """
+        Make every caller wait at least this number of seconds from now
+
+        Parameters
+        ----------
+        seconds : float
+            Number of seconds during which no tokens are handed out
+        """
+
+        with self.lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed request
+
+    Attributes
+    ----------
+    max_retries : int, default 5
+        Number of times a failed request is retried
+    backoff_base : float, default 1
+        Seconds of the first backoff, doubled for every next attempt
+    backoff_max : float, default 60
+        Maximum number of seconds of a single backoff
+    """
+
+    def __init__(self, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Number of seconds to wait before retrying a failed request. Uses
+        the `Retry-After` header if provided, otherwise an exponential
+        backoff with full jitter
+
+        Parameters
+        ----------
+        attempt : int
+            Number of the attempt that failed, starting at 0
+        retry_after : str, default None
+            Value of the `Retry-After` header of the response
+
+        Return
+        ------
+        float
+            Number of seconds to wait
+        """
+
+        seconds = self.parse_retry_after(retry_after)
+        if seconds is not None:
+            return seconds + random.uniform(0, self.backoff_base)
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    @staticmethod
+    def is_retryable(status):
+        """
+        Whether a request with this response is worth retrying
+
+        Parameters
+        ----------
+        status : int or None
+            HTTP status code of the response, None if there was none
+
+        Return
+        ------
+        bool
+            True for rate-limit errors, server errors and missing responses
+        """
+
+        return status is None or status == 429 or status >= 500
+
+    @staticmethod
+    def parse_retry_after(retry_after):
+        """
+        Convert the value of a `Retry-After` header into seconds
+
+        Parameters
+        ----------
+        retry_after : str or None
+            Value of the header, either in seconds or as HTTP date
+
+        Return
+        ------
+        float or None
+            Number of seconds to wait, None if no (valid) value was given
+        """
+
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter of which the refill rate is adapted with
+    additive-increase/multiplicative-decrease (AIMD). Healthy responses
+    slowly ramp up the rate, rate-limit (429) and server errors halve it
+    and `Retry-After` headers pause all requests. The rate is halved at
+    most once per congestion window: failures of requests that were sent
+    before the last decrease do not decrease it again. The same limiter can be
+    used by the requests and aiohttp paths, and shared between threads.
+
+    Attributes
+    ----------
+    bucket : TokenBucket
+        Bucket with the current number of requests per second that is
+        allowed as refill rate
+    min_rate : float, default 0.5
+        Lower bound on the number of requests per second
+    max_rate : float, default 50
+        Upper bound on the number of requests per second
+    increase : float, default 0.5
+        Requests per second added to the rate after a healthy response
+    decrease : float, default 0.5
+        Factor applied to the rate after a rate-limit or server error
+    retry : RetryPolicy
+        Number of retries and backoff of failed requests. `RetryPolicy()`
+        if not provided
+    """
+
+    def __init__(
+        self,
+        rate=10.0,
+        burst=10.0,
+        *,
+        min_rate=0.5,
+        max_rate=50.0,
+        increase=0.5,
+        decrease=0.5,
+        retry=None,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.retry = RetryPolicy() if retry is None else retry
+        self._last_cut = -math.inf
+
+    @property
+    def rate(self):
+        """
+        Current number of requests per second that is allowed
+        """
+
+        return self.bucket.rate
+
+    @rate.setter
+    def rate(self, value):
+        self.bucket.rate = value
+
+    def reserve(self):
+        """
+        Take a token from the bucket, see `TokenBucket.reserve`
+
+        Return
+        ------
+        float
+            Number of seconds the caller should wait before making the
+            request
+        """
+
+        return self.bucket.reserve()
+
+    def acquire(self):
+        """
+        Block until a request is allowed to be made
+        """
+
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Wait asynchronously until a request is allowed to be made
+        """
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update(self, status, retry_after=None, sent_at=None):
+        """
+        Adapt the rate based on the response of a request
+
+        Parameters
+        ----------
+        status : int or None
+            HTTP status code of the response. None in case the request
+            failed without response (e.g. connection error or timeout)
+        retry_after : str, default None
+            Value of the `Retry-After` header of the response
+        sent_at : float, default None
+            `time.monotonic()` at which the request was sent. If not
+            provided, the request counts as sent `Retry-After` seconds ago
+            (or now, without header)
+        """
+
+        with self.bucket.lock:
+            if RetryPolicy.is_retryable(status):
+                now = time.monotonic()
+                seconds = RetryPolicy.parse_retry_after(retry_after)
+                if sent_at is None:
+                    sent_at = now - (seconds or 0.0)
+                # Requests in flight during the last decrease hit the same
+                # congestion, so their failures do not decrease it again
+                if sent_at >= self._last_cut:
+                    self.bucket.rate = max(self.min_rate, self.rate * self.decrease)
+                    self._last_cut = now
+                if seconds is not None:
+                    self.bucket.pause(seconds)
+            elif status < 400:
+                self.bucket.rate = min(self.max_rate, self.rate + self.increase)
@@ -0,0 +1,314 @@
+"""
+Module with an integer-keyed star schema of the Spotify streaming history:
+the plays as fact table, and tracks, artists, albums and genres as
+dimensions. Joins are array lookups with the integer keys
+"""
+import numpy as np
+import pandas as pd
+
+
+# Columns of the (modified) streaming history that move to the track dimension
+TRACK_COLUMNS = ["track_uri", "track_name", "artist_name", "album_name"]
+
+
+def encode(values, keys):
+    """
+    Integer key of every value. Categorical values are only looked up once
+    per category
+
+    Parameters
+    ----------
+    values : pandas.Series
+        Values to be encoded (e.g. the track uri of every play)
+    keys : pandas.Index
+        Unique values, of which the position is the integer key
+
+    Return
+    ------
+    numpy.ndarray
+        Array with the int32 key of every value, -1 if unknown (or null)
+    """
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        lookup = keys.get_indexer(values.cat.categories)
+        return np.where(codes >= 0, lookup[codes], -1).astype(np.int32)
+    return keys.get_indexer(values).astype(np.int32)
+
+
+def take(values, codes, fill_value=None):
+    """
+    Values of a dimension column at the integer keys (an array lookup)
+
+    Parameters
+    ----------
+    values : pandas.Series
+        Column of a dimension, with the integer key as position
+    codes : numpy.ndarray
+        Integer keys, -1 for unknown
+    fill_value : object, default None
+        Value for unknown keys, null if not provided
+
+    Return
+    ------
+    pandas.api.extensions.ExtensionArray or numpy.ndarray
+        Values at the keys, `fill_value` for unknown keys
+    """
+
+    return pd.api.extensions.take(
+        values.array, codes, allow_fill=True, fill_value=fill_value
+    )
+
+
+class StarSchema:
+    """
+    Star schema of the Spotify streaming history. The track, artist, album
+    and genre dimensions have their integer key as index (`track_id`,
+    `artist_id`, `album_id` and `genre_id`), and the plays refer to the
+    track by `track_id`. Tracks refer to their first artist and album,
+    all artists of a track and all genres of an artist are stored in
+    bridge tables
+
+    Attributes
+    ----------
+    plays : pandas.DataFrame
+        Fact table, the plays with a `track_id` instead of track columns
+    tracks : pandas.DataFrame
+        Track dimension, with the track columns of the history, the track
+        metadata, `artist_id` (first artist) and `album_id`
+    artists : pandas.DataFrame
+        Artist dimension, with `artist_uri` and the artist metadata
+    albums : pandas.DataFrame
+        Album dimension, with `album_uri` and the album metadata
+    genres : pandas.DataFrame
+        Genre dimension, with the `genre` names
+    track_artists : pandas.DataFrame
+        Bridge table with `track_id`, `artist_id` and the `position` of the
+        artist on the track
+    artist_genres : pandas.DataFrame
+        Bridge table with `artist_id` and `genre_id`
+    """
+
+    def __init__(
+        self, plays, track_metadata=None, artist_metadata=None, album_metadata=None
+    ):
+        self.tracks = self.get_track_dimension(plays, track_metadata)
+        track_id = encode(plays["track_uri"], pd.Index(self.tracks["track_uri"]))
+
+        self.plays = plays.drop(
+            columns=[col for col in TRACK_COLUMNS + ["unique_tr"] if col in plays]
+        )
+        self.plays.insert(0, "track_id", track_id)
+
+        # Artists of the tracks, in order of appearance on the track
+        artist_uris = self.tracks.get("artist_ids", pd.Series(dtype=object))
+        bridge = artist_uris.explode().dropna().rename("artist_uri").reset_index()
+        bridge = bridge.rename(columns={"index": "track_id"})
+        self.artists = self.get_dimension(
+            bridge["artist_uri"], artist_metadata, "artist_uri", "artist_id"
+        )
+        self.track_artists = pd.DataFrame(
+            {
+                "track_id": bridge["track_id"].to_numpy(np.int32),
+                "artist_id": encode(
+                    bridge["artist_uri"], pd.Index(self.artists["artist_uri"])
+                ),
+                "position": bridge.groupby("track_id").cumcount().to_numpy(np.int16),
+            }
+        )
+        first = self.track_artists[self.track_artists["position"] == 0]
+        self.tracks["artist_id"] = np.full(len(self.tracks), -1, dtype=np.int32)
+        self.tracks.loc[first["track_id"].to_numpy(), "artist_id"] = first[
+            "artist_id"
+        ].to_numpy()
+
+        album_uris = self.tracks.get("album_uri", pd.Series(dtype=object))
+        self.albums = self.get_dimension(
+            album_uris, album_metadata, "album_uri", "album_id"
+        )
+        self.tracks["album_id"] = encode(
+            album_uris.reindex(self.tracks.index), pd.Index(self.albums["album_uri"])
+        )
+        self.tracks = self.tracks.drop(columns="artist_ids", errors="ignore")
+
+        genres = self.artists.get("genres", pd.Series(dtype=object))
+        genres = genres.explode().dropna()
+        self.genres = pd.DataFrame({"genre": genres.unique()})
+        self.genres.index.name = "genre_id"
+        self.artist_genres = pd.DataFrame(
+            {
+                "artist_id": genres.index.to_numpy(np.int32),
+                "genre_id": encode(genres, pd.Index(self.genres["genre"])),
+            }
+        )
+
+    @staticmethod
+    def get_track_dimension(plays, track_metadata):
+        """
+        Build the track dimension: the track columns of the history of every
+        played track, joined with the track metadata (with `artist_ids` and
+        `album_id` as accessed via `EnrichmentPipeline`)
+
+        Parameters
+        ----------
+        plays : pandas.DataFrame
+            Streaming history as modified by `modify_columns_spotify_history()`
+        track_metadata : pandas.DataFrame or None
+            Track metadata, with `track_uri` as the first column
+
+        Return
+        ------
+        pandas.DataFrame
+            Track dimension, with `track_id` as index
+        """
+
+        columns = [col for col in TRACK_COLUMNS if col in plays.columns]
+        tracks = plays[columns].drop_duplicates("track_uri").dropna(subset="track_uri")
+        tracks = tracks.astype({col: object for col in columns})
+        if track_metadata is not None:
+            track_metadata = track_metadata.rename(columns={"album_id": "album_uri"})
+            tracks = tracks.merge(
+                track_metadata.astype({"track_uri": object}),
+                on="track_uri",
+                how="left",
+            )
+        tracks = tracks.reset_index(drop=True)
+        tracks.index.name = "track_id"
+        return tracks
+
+    @staticmethod
+    def get_dimension(uris, metadata, uri_column, key):
+        """
+        Build an artist or album dimension: the metadata of the uri's,
+        extended with the uri's without metadata
+
+        Parameters
+        ----------
+        uris : pandas.Series
+            Uri's referred to by the tracks
+        metadata : pandas.DataFrame or None
+            Metadata, with the uri's as the first column
+        uri_column : str
+            Name of the column with the uri's
+        key : str
+            Name of the integer key
+
+        Return
+        ------
+        pandas.DataFrame
+            Dimension, with the integer key as index
+        """
+
+        if metadata is None:
+            metadata = pd.DataFrame({uri_column: pd.Series(dtype=object)})
+        metadata = metadata.rename(columns={metadata.columns[0]: uri_column})
+        known = pd.Index(metadata[uri_column])
+        missing = pd.Index(uris.dropna().unique()).difference(known)
+        dimension = pd.concat(
+            [metadata, pd.DataFrame({uri_column: missing.to_numpy(object)})],
+            ignore_index=True,
+        )
+        dimension.index.name = key
+        return dimension
+
+    def get_keys(self, dimension):
+        """
+        Integer key of the dimension of every play
+
+        Parameters
+        ----------
+        dimension : str
+            Name of the dimension ('tracks', 'artists' or 'albums')
+
+        Return
+        ------
+        numpy.ndarray
+            Array with the key of every play (first artist for 'artists'),
+            -1 if unknown
+        """
+
+        track_id = self.plays["track_id"].to_numpy()
+        if dimension == "tracks":
+            return track_id
+        column = {"artists": "artist_id", "albums": "album_id"}[dimension]
+        return np.asarray(take(self.tracks[column], track_id, fill_value=-1))
+
+    def lookup(self, dimension, column):
+        """
+        Value of a dimension column for every play
+
+        Parameters
+        ----------
+        dimension : str
+            Name of the dimension ('tracks', 'artists' or 'albums')
+        column : str
+            Name of the column of the dimension
+
+        Return
+        ------
+        pandas.Series
+            Value of every play, null if unknown
+        """
+
+        keys = self.get_keys(dimension)
+        table = getattr(self, dimension)
+        return pd.Series(take(table[column], keys), index=self.plays.index, name=column)
+
+    def join(self, **columns):
+        """
+        Plays together with columns of the dimensions, e.g.
+        `join(tracks=["duration_ms"], artists=["genres"])`. Columns are
+        prefixed with the dimension, e.g. `track_duration_ms`
+
+        Parameters
+        ----------
+        **columns : list of str
+            Columns per dimension ('tracks', 'artists' or 'albums')
+
+        Return
+        ------
+        pandas.DataFrame
+            Plays with the requested dimension columns
+        """
+
+        df = self.plays.copy(deep=False)
+        for dimension, names in columns.items():
+            for name in names:
+                df[f"{dimension[:-1]}_{name}"] = self.lookup(dimension, name)
+        return df
+
+    def completion_ratio(self):
+        """
+        Fraction of the track that was played (`ms_played / duration_ms`)
+
+        Return
+        ------
+        pandas.Series
+            Completion ratio of every play, null if the duration is unknown
+        """
+
+        duration = self.lookup("tracks", "duration_ms").astype("Float64")
+        ratio = self.plays["ms_played"].astype("Float64") / duration.where(duration > 0)
+        return ratio.rename("completion_ratio")
+
+    def genre_plays(self):
+        """
+        Number of plays per genre (of the first artist of the track)
+
+        Return
+        ------
+        pandas.Series
+            Number of plays with the genre names as index, in descending order
+        """
+
+        artist_id = self.get_keys("artists")
+        per_artist = np.bincount(artist_id[artist_id >= 0], minlength=len(self.artists))
+        per_genre = np.bincount(
+            self.artist_genres["genre_id"],
+            weights=per_artist[self.artist_genres["artist_id"]],
+            minlength=len(self.genres),
+        )
+        counts = pd.Series(
+            per_genre.astype(np.int64), index=self.genres["genre"], name="plays"
+        )
+        return counts.sort_values(ascending=False, kind="stable")
@@ -0,0 +1,172 @@
+"""
+Module to group the plays of the Spotify streaming history into listening
+sessions, using vectorized operations over the play timeline
+"""
+import numpy as np
+import pandas as pd
+
+
+def get_play_timeline(df, max_gap="30min", split_on_platform=True):
+    """
+    Sort the plays by account and `ts`, and mark the plays that start a
+    new session. The `ts` of a play is the moment it stopped, so it
+    started at `ts - ms_played`. A new session starts if the idle gap
+    since the end of the previous play is larger than `max_gap`, or
+    (optionally) if the platform changes
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with the Spotify streaming history
+    max_gap : str or pandas.Timedelta, default '30min'
+        Maximum idle time between two plays of the same session
+    split_on_platform : bool, default True
+        Whether a change of platform starts a new session
+
+    Return
+    ------
+    dict
+        Dictionary with the arrays of the sorted plays (with valid `ts`):
+        `order` (positions in `df`), `user` (codes), `users` (categories),
+        `start` and `end` (ns since epoch) and `new` (start of session)
+    """
+
+    ts = pd.to_datetime(df["ts"], utc=True)
+    valid = ts.notna().to_numpy()
+    end = ts.to_numpy(dtype="datetime64[ns]")[valid].view(np.int64)
+    ms_played = df["ms_played"].to_numpy(dtype=np.float64, na_value=0)[valid]
+    start = end - (ms_played * 1e6).astype(np.int64)
+
+    if "username" in df.columns:
+        user, users = pd.factorize(df["username"])
+        user = user[valid]
+    else:
+        user, users = np.zeros(len(end), dtype=np.int64), pd.Index([None])
+
+    order = np.lexsort((end, user))
+    user, start, end = user[order], start[order], end[order]
+
+    new = np.empty(len(end), dtype=bool)
+    new[:1] = True
+    new[1:] = (user[1:] != user[:-1]) | (
+        start[1:] - end[:-1] > pd.Timedelta(max_gap).value
+    )
+    if split_on_platform and "platform" in df.columns:
+        platform, _ = pd.factorize(df["platform"])
+        platform = platform[valid][order]
+        new[1:] |= platform[1:] != platform[:-1]
+
+    return {
+        "order": np.flatnonzero(valid)[order],
+        "user": user,
+        "users": users,
+        "start": start,
+        "end": end,
+        "new": new,
+    }
+
+
+def to_timestamps(values):
+    """
+    Convert nanoseconds since epoch into UTC timestamps (without parsing)
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array with int64 nanoseconds since epoch
+
+    Return
+    ------
+    pandas.DatetimeIndex
+        UTC timestamps
+    """
+
+    return pd.DatetimeIndex(values.view("datetime64[ns]")).tz_localize("UTC")
+
+
+def assign_sessions(df, max_gap="30min", split_on_platform=True):
+    """
+    Session number of every play (see `get_play_timeline(df)`)
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with the Spotify streaming history
+    max_gap : str or pandas.Timedelta, default '30min'
+        Maximum idle time between two plays of the same session
+    split_on_platform : bool, default True
+        Whether a change of platform starts a new session
+
+    Return
+    ------
+    pandas.Series
+        Session number of every play, with the index of `df`. Null for
+        plays without valid `ts`
+    """
+
+    timeline = get_play_timeline(df, max_gap, split_on_platform)
+    session = np.zeros(len(df), dtype=np.int64)
+    mask = np.ones(len(df), dtype=bool)
+    session[timeline["order"]] = np.cumsum(timeline["new"]) - 1
+    mask[timeline["order"]] = False
+    return pd.Series(pd.arrays.IntegerArray(session, mask), index=df.index)
+
+
+def get_sessions(df, max_gap="30min", split_on_platform=True):
+    """
+    Table of the listening sessions in the streaming history, with their
+    start, end, duration, number of (track) plays and skip ratio
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with the Spotify streaming history
+    max_gap : str or pandas.Timedelta, default '30min'
+        Maximum idle time between two plays of the same session
+    split_on_platform : bool, default True
+        Whether a change of platform starts a new session
+
+    Return
+    ------
+    pandas.DataFrame
+        Dataframe with one row per session, numbered as in
+        `assign_sessions(df)`
+    """
+
+    timeline = get_play_timeline(df, max_gap, split_on_platform)
+    order = timeline["order"]
+    first = np.flatnonzero(timeline["new"])
+
+    def per_session(ufunc, values):
+        if len(values) == 0:
+            return np.zeros(0, dtype=values.dtype)
+        return ufunc.reduceat(values, first)
+
+    start = per_session(np.minimum, timeline["start"])
+    end = per_session(np.maximum, timeline["end"])
+    n_plays = np.diff(np.append(first, len(timeline["end"])))
+    ms_played = df["ms_played"].to_numpy(dtype=np.int64, na_value=0)
+    skipped = np.zeros(len(df), dtype=np.int64)
+    if "skipped" in df.columns:
+        skipped = df["skipped"].to_numpy(dtype=np.int64, na_value=0)
+    is_track = np.ones(len(df), dtype=np.int64)
+    if "spotify_track_uri" in df.columns:
+        is_track = df["spotify_track_uri"].notna().to_numpy().astype(np.int64)
+
+    sessions = pd.DataFrame(
+        {
+            "username": timeline["users"].take(timeline["user"][first]),
+            "start": to_timestamps(start),
+            "end": to_timestamps(end),
+            "duration": pd.to_timedelta(end - start),
+            "n_plays": n_plays,
+            "n_tracks": per_session(np.add, is_track[order]),
+            "ms_played": per_session(np.add, ms_played[order]),
+            "n_skips": per_session(np.add, skipped[order]),
+        }
+    )
+    if "platform" in df.columns:
+        sessions["platform"] = df["platform"].take(order[first]).to_numpy()
+    sessions["skip_ratio"] = sessions["n_skips"] / sessions["n_plays"]
+    sessions.index.name = "session"
+    return sessions
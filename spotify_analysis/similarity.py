@@ -0,0 +1,509 @@
+"""
+Module with sparse artist x genre and user x artist matrices of the star
+schema, and cosine-similarity and top-k nearest-neighbor queries on them.
+Artists are compared by their genres, genres by their artists, and users
+by the genres of the artists they listen to
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Weights of the plays in the user x artist matrix
+PLAY_WEIGHTS = ["plays", "ms_played"]
+
+
+def get_artist_genre_matrix(schema, idf=False):
+    """
+    Sparse artist x genre matrix, with the integer keys of the star schema
+    as row and column numbers
+
+    Parameters
+    ----------
+    schema : StarSchema
+        Star schema with the artist and genre dimensions
+    idf : bool, default False
+        Whether genres are weighted by their inverse document frequency,
+        i.e. `log(n_artists / n_artists_with_genre)`, such that broad
+        genres count less than niche genres
+
+    Return
+    ------
+    scipy.sparse.csr_array
+        Float32 matrix of shape (number of artists, number of genres), with
+        a 1 (or the idf weight) if the artist has the genre
+    """
+
+    artist_id = schema.artist_genres["artist_id"].to_numpy()
+    genre_id = schema.artist_genres["genre_id"].to_numpy()
+    valid = (artist_id >= 0) & (genre_id >= 0)
+    matrix = sparse.csr_array(
+        (
+            np.ones(valid.sum(), dtype=np.float32),
+            (artist_id[valid], genre_id[valid]),
+        ),
+        shape=(len(schema.artists), len(schema.genres)),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1.0
+    if idf and matrix.nnz > 0:
+        n_artists = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        weights = np.log(max(matrix.shape[0], 1) / np.maximum(n_artists, 1))
+        matrix.data *= weights[matrix.indices].astype(np.float32)
+        matrix.eliminate_zeros()
+    return matrix
+
+
+def get_user_artist_matrix(schema, weight="plays"):
+    """
+    Sparse user x artist matrix with the play weights (of the first artist
+    of every track), with the integer keys of the artists as columns
+
+    Parameters
+    ----------
+    schema : StarSchema
+        Star schema with the plays and the artist dimension
+    weight : str, default 'plays'
+        Weight of a play, 'plays' (1 per play) or 'ms_played'
+
+    Return
+    ------
+    tuple
+        Tuple of the float32 matrix of shape (number of users, number of
+        artists), and a pandas.Index with the username of every row (a
+        single empty username if the usernames were dropped)
+    """
+
+    if weight not in PLAY_WEIGHTS:
+        raise ValueError(f"Unknown weight {weight}, use one of {PLAY_WEIGHTS}")
+
+    artist_id = schema.get_keys("artists")
+    if "username" in schema.plays.columns:
+        user_id, users = pd.factorize(schema.plays["username"].astype(object))
+    else:
+        user_id, users = np.zeros(len(artist_id), dtype=np.int64), pd.Index([""])
+    if weight == "plays":
+        values = np.ones(len(artist_id), dtype=np.float32)
+    else:
+        values = schema.plays["ms_played"].fillna(0).to_numpy(np.float32)
+
+    valid = (artist_id >= 0) & (user_id >= 0)
+    matrix = sparse.csr_array(
+        (values[valid], (user_id[valid], artist_id[valid])),
+        shape=(len(users), len(schema.artists)),
+    )
+    matrix.sum_duplicates()
+    return matrix, pd.Index(users, name="username")
+
+
+def normalize_rows(matrix):
+    """
+    Scale the rows of a sparse matrix to unit (L2) length, such that the dot
+    product of two rows is their cosine similarity
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_array
+        Matrix of which the rows are normalized
+
+    Return
+    ------
+    scipy.sparse.csr_array
+        Float32 matrix with normalized rows (empty rows stay empty)
+    """
+
+    matrix = sparse.csr_array(matrix, dtype=np.float32, copy=True)
+    norms = np.sqrt(
+        np.bincount(
+            np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr)),
+            weights=matrix.data.astype(np.float64) ** 2,
+            minlength=matrix.shape[0],
+        )
+    )
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    matrix.data *= np.repeat(scale, np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+def get_top_k(scores, k):
+    """
+    Top-k columns of every row of a dense score matrix, vectorized over the
+    rows via `numpy.argpartition`
+
+    Parameters
+    ----------
+    scores : numpy.ndarray
+        Scores of shape (number of queries, number of items)
+    k : int
+        Number of items per query
+
+    Return
+    ------
+    tuple
+        Tuple of the item ids and scores, both of shape (number of queries,
+        k), sorted by descending score. Ids are -1 where the score is not
+        positive (no overlap with the query)
+    """
+
+    n_queries, n_items = scores.shape
+    k_part = min(k, n_items)
+    if k_part == 0:
+        ids = np.zeros((n_queries, 0), dtype=np.int32)
+    elif k_part < n_items:
+        ids = np.argpartition(-scores, k_part - 1, axis=1)[:, :k_part]
+    else:
+        ids = np.broadcast_to(np.arange(n_items), (n_queries, n_items))
+    top = np.take_along_axis(scores, ids, axis=1)
+    order = np.lexsort((ids, -top), axis=1)
+    ids = np.take_along_axis(ids, order, axis=1).astype(np.int32)
+    top = np.take_along_axis(top, order, axis=1).astype(np.float32)
+
+    if k_part < k:
+        ids = np.pad(ids, ((0, 0), (0, k - k_part)), constant_values=-1)
+        top = np.pad(top, ((0, 0), (0, k - k_part)))
+    ids[~(top > 0)] = -1
+    top[ids < 0] = 0.0
+    return ids, top
+
+
+class SimilarityIndex:
+    """
+    Index for cosine-similarity and top-k nearest-neighbor queries on the
+    rows of a sparse matrix (e.g. artists described by their genres). The
+    rows are normalized once, and the transposed matrix is kept in CSR
+    format, such that scoring a query against all items is a single sparse
+    product. The nearest neighbors of every item can be precomputed, such
+    that `neighbors()` is an array lookup
+
+    Attributes
+    ----------
+    vectors : scipy.sparse.csr_array
+        Normalized float32 vectors of the items, one row per item
+    vectors_t : scipy.sparse.csr_array
+        Transpose of `vectors` in CSR format (features x items)
+    neighbor_ids : numpy.ndarray or None
+        Precomputed ids of the nearest neighbors of every item, shape
+        (number of items, k), -1 if the item has less neighbors
+    neighbor_scores : numpy.ndarray or None
+        Cosine similarity of the precomputed neighbors
+
+    matrix : scipy.sparse.sparray
+        Matrix with a row per item and a column per feature
+    """
+
+    def __init__(self, matrix):
+        self.vectors = normalize_rows(matrix)
+        self.vectors_t = sparse.csr_array(self.vectors.T)
+        self.neighbor_ids = None
+        self.neighbor_scores = None
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def get_scores(self, queries):
+        """
+        Cosine similarity of query vectors with every item
+
+        Parameters
+        ----------
+        queries : scipy.sparse.sparray or numpy.ndarray
+            Query vectors, shape (number of queries, number of features)
+
+        Return
+        ------
+        numpy.ndarray
+            Float32 scores of shape (number of queries, number of items)
+        """
+
+        if not sparse.issparse(queries):
+            queries = np.atleast_2d(queries)
+        queries = normalize_rows(sparse.csr_array(queries))
+        return (queries @ self.vectors_t).toarray()
+
+    def query(self, queries, k=10, exclude=None):
+        """
+        Nearest items of query vectors
+
+        Parameters
+        ----------
+        queries : scipy.sparse.sparray or numpy.ndarray
+            Query vectors, shape (number of queries, number of features)
+        k : int, default 10
+            Number of items per query
+        exclude : scipy.sparse.sparray or numpy.ndarray, default None
+            Matrix of shape (number of queries, number of items), of which
+            the non-zero entries are excluded from the results (e.g. the
+            artists a user already listens to)
+
+        Return
+        ------
+        tuple
+            Tuple of the item ids and scores, both of shape (number of
+            queries, k), see `get_top_k()`
+        """
+
+        scores = self.get_scores(queries)
+        if exclude is not None:
+            exclude = sparse.coo_array(exclude)
+            scores[exclude.row, exclude.col] = -np.inf
+        return get_top_k(scores, k)
+
+    def precompute_neighbors(self, k=10, block_size=256):
+        """
+        Precompute the nearest neighbors of every item (itself excluded),
+        scoring `block_size` items at a time to bound the memory
+
+        Parameters
+        ----------
+        k : int, default 10
+            Number of neighbors per item
+        block_size : int, default 256
+            Number of items scored per block
+        """
+
+        ids, scores = [], []
+        for start in range(0, len(self), block_size):
+            block = self.vectors[start : start + block_size]
+            block_scores = (block @ self.vectors_t).toarray()
+            rows = np.arange(block.shape[0])
+            block_scores[rows, start + rows] = -np.inf
+            block_ids, block_top = get_top_k(block_scores, k)
+            ids.append(block_ids)
+            scores.append(block_top)
+        self.neighbor_ids = np.concatenate(ids) if ids else np.zeros((0, k), np.int32)
+        self.neighbor_scores = (
+            np.concatenate(scores) if scores else np.zeros((0, k), np.float32)
+        )
+
+    def neighbors(self, item_ids, k=10):
+        """
+        Nearest neighbors of items (the items themselves excluded), taken
+        from the precomputed neighbors if available for `k`
+
+        Parameters
+        ----------
+        item_ids : int or array-like of int
+            Ids (row numbers) of the items
+        k : int, default 10
+            Number of neighbors per item
+
+        Return
+        ------
+        tuple
+            Tuple of the neighbor ids and scores, both of shape (number of
+            items, k), see `get_top_k()`
+        """
+
+        item_ids = np.atleast_1d(np.asarray(item_ids, dtype=np.int64))
+        if self.neighbor_ids is not None and k <= self.neighbor_ids.shape[1]:
+            return self.neighbor_ids[item_ids, :k], self.neighbor_scores[item_ids, :k]
+        exclude = sparse.csr_array(
+            (np.ones(len(item_ids)), (np.arange(len(item_ids)), item_ids)),
+            shape=(len(item_ids), len(self)),
+        )
+        return self.query(self.vectors[item_ids], k, exclude)
+
+
+class ArtistSimilarity:
+    """
+    Similar artists and genres, and the artists and genres closest to what
+    a user listens to. Artists are compared by their genres, genres by
+    their artists, and a user is described by the genres of the artists
+    they listen to (weighted by the plays)
+
+    Attributes
+    ----------
+    artist_genre : scipy.sparse.csr_array
+        Artist x genre matrix, see `get_artist_genre_matrix()`
+    user_artist : scipy.sparse.csr_array
+        User x artist matrix, see `get_user_artist_matrix()`
+    users : pandas.Index
+        Username of every row of `user_artist`
+    artists : SimilarityIndex
+        Index of the artists in genre space
+    genres : SimilarityIndex
+        Index of the genres in artist space
+
+    schema : StarSchema
+        Star schema with the plays, artists and genres
+    weight : str, default 'plays'
+        Weight of a play, 'plays' or 'ms_played'
+    idf : bool, default True
+        Whether genres are weighted by their inverse document frequency
+    k : int, default None
+        Number of neighbors that are precomputed per artist and genre, such
+        that `similar_artists()` and `similar_genres()` are array lookups.
+        Neighbors are computed per query if None
+    """
+
+    def __init__(self, schema, weight="plays", idf=True, k=None):
+        self.schema = schema
+        self.artist_genre = get_artist_genre_matrix(schema, idf=idf)
+        self.user_artist, self.users = get_user_artist_matrix(schema, weight)
+        self.artists = SimilarityIndex(self.artist_genre)
+        self.genres = SimilarityIndex(self.artist_genre.T)
+        if k is not None:
+            self.artists.precompute_neighbors(k)
+            self.genres.precompute_neighbors(k)
+
+    def to_frame(self, dimension, ids, scores):
+        """
+        Neighbors as a table with the names of the artists or genres
+
+        Parameters
+        ----------
+        dimension : str
+            Dimension of the ids ('artists' or 'genres')
+        ids : numpy.ndarray
+            Ids of a single query, -1 for no neighbor
+        scores : numpy.ndarray
+            Scores of a single query
+
+        Return
+        ------
+        pandas.DataFrame
+            Table with the integer key as index, the artist `name` (or
+            `artist_uri` if unknown) or `genre`, and the `score`
+        """
+
+        table = getattr(self.schema, dimension)
+        column = "genre" if dimension == "genres" else "artist_uri"
+        if dimension == "artists" and "name" in table.columns:
+            column = "name"
+        keep = ids >= 0
+        df = table.loc[ids[keep], [column]].copy()
+        df["score"] = scores[keep]
+        return df
+
+    def get_artist_id(self, artist):
+        """
+        Integer key of an artist
+
+        Parameters
+        ----------
+        artist : str
+            Artist uri, or the artist name if the metadata has names
+
+        Return
+        ------
+        int
+            The integer key of the artist
+        """
+
+        for column in ["artist_uri", "name"]:
+            if column in self.schema.artists.columns:
+                matches = np.flatnonzero(self.schema.artists[column] == artist)
+                if len(matches) > 0:
+                    return int(matches[0])
+        raise KeyError(f"Unknown artist {artist}")
+
+    def similar_artists(self, artist, k=10):
+        """
+        Artists with the most similar genres
+
+        Parameters
+        ----------
+        artist : str
+            Artist uri or name
+        k : int, default 10
+            Maximum number of artists
+
+        Return
+        ------
+        pandas.DataFrame
+            Similar artists with their cosine similarity, see `to_frame()`
+        """
+
+        ids, scores = self.artists.neighbors(self.get_artist_id(artist), k)
+        return self.to_frame("artists", ids[0], scores[0])
+
+    def similar_genres(self, genre, k=10):
+        """
+        Genres shared with the most similar sets of artists
+
+        Parameters
+        ----------
+        genre : str
+            Name of the genre
+        k : int, default 10
+            Maximum number of genres
+
+        Return
+        ------
+        pandas.DataFrame
+            Similar genres with their cosine similarity, see `to_frame()`
+        """
+
+        matches = np.flatnonzero(self.schema.genres["genre"] == genre)
+        if len(matches) == 0:
+            raise KeyError(f"Unknown genre {genre}")
+        ids, scores = self.genres.neighbors(matches[0], k)
+        return self.to_frame("genres", ids[0], scores[0])
+
+    def get_user_profile(self, username=""):
+        """
+        Genre profile of a user: the genre vectors of the artists summed
+        with the play weights of the user
+
+        Parameters
+        ----------
+        username : str, default ''
+            Username, the empty string if the usernames were dropped
+
+        Return
+        ------
+        tuple
+            Tuple of the user x artist row (1 x artists) and the genre
+            profile (1 x genres), both sparse
+        """
+
+        if username not in self.users:
+            raise KeyError(f"Unknown user {username}")
+        row = self.user_artist[[self.users.get_loc(username)]]
+        return row, row @ self.artist_genre
+
+    def artists_for_user(self, username="", k=10, exclude_played=True):
+        """
+        Artists of which the genres are closest to the genre profile of a
+        user
+
+        Parameters
+        ----------
+        username : str, default ''
+            Username, the empty string if the usernames were dropped
+        k : int, default 10
+            Maximum number of artists
+        exclude_played : bool, default True
+            Whether the artists the user already listened to are excluded
+
+        Return
+        ------
+        pandas.DataFrame
+            Closest artists with their cosine similarity, see `to_frame()`
+        """
+
+        row, profile = self.get_user_profile(username)
+        ids, scores = self.artists.query(profile, k, row if exclude_played else None)
+        return self.to_frame("artists", ids[0], scores[0])
+
+    def genres_for_user(self, username="", k=10):
+        """
+        Genres with the largest weight in the genre profile of a user
+
+        Parameters
+        ----------
+        username : str, default ''
+            Username, the empty string if the usernames were dropped
+        k : int, default 10
+            Maximum number of genres
+
+        Return
+        ------
+        pandas.DataFrame
+            Genres with their share of the (normalized) profile as score,
+            see `to_frame()`
+        """
+
+        _, profile = self.get_user_profile(username)
+        ids, scores = get_top_k(normalize_rows(profile).toarray(), k)
+        return self.to_frame("genres", ids[0], scores[0])
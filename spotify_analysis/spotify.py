@@ -2,17 +2,20 @@
 Module to handle all access requests to Spotify web API
 """
 import asyncio
-import time
 import json
 import logging
-import yaml
+import time
 import requests
 from tqdm import tqdm
-from aiohttp import ClientSession
+from aiohttp import ClientError
+from spotify_analysis.auth import SpotifySession
+from spotify_analysis.columnar import ColumnarStore
+from spotify_analysis.fields import compile_fields
+from spotify_analysis.metrics import COUNT_BUCKETS, RATIO_BUCKETS
 
 
-AUTH_URL = "https://accounts.spotify.com/api/token"
-BASE_URL = "https://api.spotify.com/v1/"
+# Maximum number of ids that can be accessed in the same request
+MAX_IDS = {"tracks": 50, "artists": 50, "albums": 20}
 
 
 class Spotify:
@@ -23,42 +26,122 @@ class Spotify:
     ----------
     cred : dict
         Dictionary containing the credentials to connect to
-        Spotify's web API (`CLIENT_ID` and `CLIENT_SECRET`)
+        Spotify's web API (`CLIENT_ID` and `CLIENT_SECRET`).
+        Stored in (and shared via) `self.session`
     access_token : str
         String with access token containing credentials and
         permissions to access Spotify resources. Valid for
-        3600 seconds
+        3600 seconds, refreshed automatically by `self.session`
     headers : dict
         Dictionary containing header with access token to be
         included in Spotify API calls
-    metadata : dict
-        Dictionary containing the requested metadata stored
-        with the uri as keys
+    metadata : ColumnarStore
+        Columnar store containing the requested metadata stored
+        with the uri as keys (behaves like a dictionary)
 
     reference : str, default 'tracks'
         String that contains which metadata API should access.
         Example: 'tracks', 'artists', ...
-    batch_size : int, default 200
-        Integer of size of batch that is processed in one go
-        with asyncio (to avoid timeouts of Spotify API)
-    sec_wait : int, default 5
-        Integer of how many seconds one should wait between
-        different batches of uri's (to avoid timeout of API)
+    session : SpotifySession, default None
+        Credentials, access token and connection pools that can be
+        shared by multiple clients. The requests, cache hits and batch
+        fill ratio are recorded to its metrics (if any). A new
+        `SpotifySession()` is created if not provided
+    max_concurrency : int, default 10
+        Integer of maximum number of asyncio requests in flight
+    rate_limiter : RateLimiter, default None
+        Adaptive rate limiter shared by the requests and aiohttp
+        paths, which also decides on retries of failed requests.
+        The limiter of `self.session` is used if not provided
+    cache : MetadataCache, default None
+        Persistent cache that is checked before any request is made,
+        and filled with the metadata of all processed uri's
+    journal : FetchJournal, default None
+        Append-only journal to which every processed request is
+        checkpointed. Uri's completed in a previous (crashed) run
+        are taken from the journal instead of being requested again
     """
 
-    def __init__(self, reference="tracks", batch_size=200, sec_wait=5):
-        self.cred = {}
-        self.access_token = None
-        self.headers = {}
-        self.metadata = {}
-
-        self.batch_size = batch_size
-        self.sec_wait = sec_wait
+    def __init__(
+        self,
+        reference="tracks",
+        *,
+        session=None,
+        max_concurrency=10,
+        rate_limiter=None,
+        cache=None,
+        journal=None,
+    ):
+        self.metadata = ColumnarStore()
+
+        self.session = SpotifySession() if session is None else session
+        self.rate_limiter = (
+            self.session.rate_limiter if rate_limiter is None else rate_limiter
+        )
+        self.max_concurrency = max_concurrency
         self.reference = reference
+        self.cache = cache
+        self.journal = journal
+
+    @property
+    def cred(self):
+        """
+        Credentials of `self.session`
+        """
+
+        return self.session.cred
+
+    @cred.setter
+    def cred(self, cred):
+        self.session.cred = cred
+
+    @property
+    def access_token(self):
+        """
+        Access token of `self.session`
+        """
+
+        return self.session.access_token
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self.session.access_token = access_token
+
+    @property
+    def headers(self):
+        """
+        Headers with the access token of `self.session`. Setting headers
+        with an `Authorization: Bearer <token>` header sets the token
+        """
+
+        return self.session.headers
+
+    @headers.setter
+    def headers(self, headers):
+        authorization = headers.get("Authorization", "")
+        self.session.access_token = authorization.removeprefix("Bearer ") or None
+
+    def to_dataframe(self, key="uri"):
+        """
+        Convert the accessed metadata into a pandas dataframe
+
+        Parameters
+        ----------
+        key : str, default 'uri'
+            Name of the first column, which contains the uri's
+
+        Return
+        ------
+        pandas.DataFrame
+            Dataframe with one row per uri and one column per metadata key
+        """
+
+        return self.metadata.to_pandas(key)
 
     def get_spotify_credentials(self, secret_yaml_file):
         """
         Loads your spotify credentials from a yaml configuration file
+        into `self.session`
 
         Parameters
         ----------
@@ -67,37 +150,25 @@ class Spotify:
             your `CLIENT_ID` and `CLIENT_SECRET`
         """
 
-        with open(secret_yaml_file, "r", encoding="utf-8") as file:
-            self.cred = yaml.safe_load(file)
+        self.session.get_spotify_credentials(secret_yaml_file)
 
     def get_spotify_access_token(self):
         """
-        Store spotify access token and headers to access Spotify's
+        Store spotify access token in `self.session` to access Spotify's
         resources via calls to web API.
 
         See https://developer.spotify.com/documentation/web-api/concepts/access-token
         """
 
-        auth_response = requests.post(
-            AUTH_URL,
-            {
-                "grant_type": "client_credentials",
-                "client_id": self.cred["CLIENT_ID"],
-                "client_secret": self.cred["CLIENT_SECRET"],
-            },
-            timeout=10,
-        )
-        auth_response_data = auth_response.json()
-        self.access_token = auth_response_data["access_token"]
-
-        self.headers = {"Authorization": f"Bearer {self.access_token}"}
+        self.session.get_spotify_access_token()
 
     def access_spotify_api(self, uri_list, metadata, n_uri=50):
         """
         Access Spotify metadata via `requests` (i.e. non asynchronous)
 
-        Might be the best option, since too many requests to Spotify API
-        will block it because API rate limit exceeded.
+        Requests are paced by `self.rate_limiter`, which adapts to the
+        API rate limit. Failed requests are retried, and uri's of which
+        the request kept failing are skipped.
 
         Parameters
         ----------
@@ -106,30 +177,286 @@ class Spotify:
         metadata : list of str
             List of the metadata keys that are requested to be saved
         n_uri : int
-            Integer of how many uri's are accessed in the same request
+            Integer of how many uri's are accessed in the same request.
+            Clamped to `MAX_IDS[self.reference]`
+
+        Return
+        ------
+        bool
+            Boolean if accessing metadata was successful for all uri's
         """
 
+        succes = True
+        n_uri = min(n_uri, MAX_IDS.get(self.reference, 50))
+        uri_list = self.get_cached_metadata(uri_list, metadata)
         for ibx in tqdm(range(0, len(uri_list), n_uri)):
             uri = uri_list[ibx : ibx + n_uri]
+            res = self.make_request_sync(self.get_request_url(uri))
+            succes &= self.process_response(res, uri, metadata)
+        return succes
 
-            if len(uri) == 1:
-                url = BASE_URL + self.reference + "/" + uri[0]
-            else:
-                url = BASE_URL + self.reference + "?ids=" + "%2C".join(uri)
-            res = requests.get(url, headers=self.headers, timeout=10)
+    def make_request_sync(self, url):
+        """
+        Makes an HTTP GET request to the specified URL using the pooled
+        requests session of `self.session`. The request waits for
+        `self.rate_limiter` and is retried with backoff in case of
+        rate-limit or server errors, or with a refreshed access token in
+        case the token was rejected.
 
+        Parameters
+        ----------
+        url : str
+            The URL to which the GET request is made.
+
+        Return
+        ------
+        dict
+            Dictionary with the response text, status and original URL
+        """
+
+        for attempt in range(self.rate_limiter.retry.max_retries + 1):
+            self.rate_limiter.acquire()
+            headers = self.session.get_headers()
+            start = time.monotonic()
             try:
-                output = res.json()
-                self.fill_metadata_dictionary(output, uri, metadata)
-            except AttributeError:
-                logging.warning("API request not successful!")
-                logging.warning(res)
-                break
+                res = self.session.http.get(url, headers=headers, timeout=10)
+                result = {"response": res.text, "status": res.status_code, "url": url}
+                retry_after = res.headers.get("Retry-After")
+            except requests.RequestException as err:
+                result = {"response": str(err), "status": None, "url": url}
+                retry_after = None
+            if self.session.metrics is not None:
+                self.record_request(result, time.monotonic() - start, attempt)
+
+            wait = self.get_retry_wait(
+                result["status"], retry_after, attempt, headers, start
+            )
+            if wait is None:
+                return result
+            time.sleep(wait)
+        return result
+
+    def record_request(self, result, seconds, attempt):
+        """
+        Record the metrics of a single attempt of a request
+
+        Parameters
+        ----------
+        result : dict
+            Dictionary with the response text, status and original URL
+        seconds : float
+            Number of seconds until the response (or error) was received
+        attempt : int
+            Number of the attempt, starting at 0
+        """
+
+        status = str(result["status"])
+        self.session.metrics.observe(
+            "spotify_request_seconds", seconds, reference=self.reference
+        )
+        self.session.metrics.inc(
+            "spotify_requests_total", reference=self.reference, status=status
+        )
+        self.session.metrics.inc(
+            "spotify_response_bytes_total",
+            len(result["response"].encode()),
+            reference=self.reference,
+        )
+        if attempt > 0:
+            self.session.metrics.inc("spotify_retries_total", reference=self.reference)
+        if status == "429":
+            self.session.metrics.inc(
+                "spotify_rate_limited_total", reference=self.reference
+            )
+
+    def get_retry_wait(self, status, retry_after, attempt, headers, sent_at):
+        """
+        Feed the response to `self.rate_limiter` and decide whether the
+        request should be retried. A rejected access token is invalidated,
+        such that the retry is done with a refreshed token
+
+        Parameters
+        ----------
+        status : int or None
+            HTTP status code of the response, None if there was none
+        retry_after : str or None
+            Value of the `Retry-After` header of the response
+        attempt : int
+            Number of the attempt, starting at 0
+        headers : dict
+            Headers (with access token) that were used for the request
+        sent_at : float
+            `time.monotonic()` at which the request was sent
+
+        Return
+        ------
+        float or None
+            Number of seconds to wait before the retry, None in case the
+            request should not be retried
+        """
+
+        self.rate_limiter.update(status, retry_after, sent_at)
+        if attempt == self.rate_limiter.retry.max_retries:
+            return None
+        if status == 401 and self.session.can_refresh():
+            self.session.invalidate_token(
+                headers.get("Authorization", "").removeprefix("Bearer ")
+            )
+            return 0.0
+        if not self.rate_limiter.retry.is_retryable(status):
+            return None
+        return self.rate_limiter.retry.backoff(attempt, retry_after)
+
+    def process_response(self, res, uri, metadata):
+        """
+        Fill the metadata dictionary (and cache) from a response
+
+        Parameters
+        ----------
+        res : dict
+            Dictionary with the response text, status and original URL
+        uri : list of str
+            List of Spotify uri's in string format that were requested
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
+
+        Return
+        ------
+        bool
+            Boolean if the response was successfully processed
+        """
+
+        if self.session.metrics is not None:
+            self.session.metrics.observe(
+                "spotify_batch_fill_ratio",
+                len(uri) / MAX_IDS.get(self.reference, 50),
+                buckets=RATIO_BUCKETS,
+                reference=self.reference,
+            )
+        try:
+            if res["status"] != 200:
+                raise ValueError(f"HTTP status {res['status']}")
+            output = json.loads(res["response"])
+            self.fill_metadata_dictionary(output, uri, metadata)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            logging.warning("API request not successful!")
+            logging.warning(res)
+            return False
+        self.store_cached_metadata(uri, metadata)
+        return True
+
+    def get_request_url(self, uri):
+        """
+        Build the URL to access the metadata of one or multiple uri's. A
+        single uri uses the single-item endpoint, multiple uri's (up to
+        `MAX_IDS[self.reference]`) the `?ids=` endpoint
+
+        Parameters
+        ----------
+        uri : list of str
+            List of Spotify uri's in string format to be accessed
+
+        Return
+        ------
+        str
+            URL of the request
+        """
+
+        max_ids = MAX_IDS.get(self.reference, 50)
+        if len(uri) > max_ids:
+            raise ValueError(
+                f"At most {max_ids} {self.reference} can be accessed per request, "
+                f"got {len(uri)}"
+            )
+
+        if len(uri) == 1:
+            return self.session.base_url + self.reference + "/" + uri[0]
+        return self.session.base_url + self.reference + "?ids=" + "%2C".join(uri)
+
+    def get_cached_metadata(self, uri_list, metadata):
+        """
+        Fill the metadata dictionary with the uri's that were already
+        completed according to `self.journal`, or found in `self.cache`.
+        Uri's with a tombstone (unknown to Spotify) are not accessed again,
+        but are not added to the metadata dictionary either
+
+        Parameters
+        ----------
+        uri_list : list of str
+            List of Spotify uri's in string format to be accessed
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
+
+        Return
+        ------
+        list of str
+            List of Spotify uri's that are not (or no longer) cached and
+            still need to be accessed
+        """
+
+        n_uri = len(uri_list)
+        if self.journal is not None:
+            completed = self.journal.get_completed(self.reference, metadata)
+            self.metadata.update(
+                {
+                    uri: completed[uri]
+                    for uri in uri_list
+                    if completed.get(uri) is not None
+                }
+            )
+            uri_list = [uri for uri in uri_list if uri not in completed]
+
+        if self.cache is not None:
+            cached = self.cache.get_many(self.reference, uri_list, metadata)
+            self.metadata.update(
+                {uri: value for uri, value in cached.items() if value is not None}
+            )
+            uri_list = [uri for uri in uri_list if uri not in cached]
+
+        if self.session.metrics is not None:
+            for result, count in [
+                ("hit", n_uri - len(uri_list)),
+                ("miss", len(uri_list)),
+            ]:
+                self.session.metrics.inc(
+                    "metadata_cache_lookups_total",
+                    count,
+                    reference=self.reference,
+                    result=result,
+                )
+        return uri_list
+
+    def store_cached_metadata(self, uri_list, metadata):
+        """
+        Store the metadata of processed uri's in `self.journal` and
+        `self.cache`. Uri's without metadata were null in the response
+        (unknown to Spotify), and are stored as tombstones
+
+        Parameters
+        ----------
+        uri_list : list of str
+            List of Spotify uri's in string format that were processed
+        metadata : list (of list) of str
+            List of the metadata keys that were requested to be saved
+        """
+
+        items = {uri: self.metadata.get(uri) for uri in uri_list}
+        if self.journal is not None:
+            self.journal.record(self.reference, metadata, items)
+        if self.cache is not None:
+            found = {uri: value for uri, value in items.items() if value is not None}
+            self.cache.put_many(self.reference, found, metadata)
+            self.cache.put_missing(
+                self.reference, [uri for uri in items if uri not in found], metadata
+            )
 
     def fill_metadata_dictionary(self, output, list_uri, metadata):
         """
-        Fill the metadata dictionary from processed uri. Metadata can
-        be 1-deep or 2-deep, and all should (so far) have the same deepness.
+        Fill the metadata dictionary from processed uri. Metadata is
+        extracted with the compiled field spec (see `spotify_analysis.fields`),
+        which supports paths of arbitrary depth, fan-out over lists and
+        defaults. Uri's that are unknown to Spotify (null in the response)
+        are skipped.
 
         Parameters
         ----------
@@ -138,46 +465,31 @@ class Spotify:
         list_uri : list of str or str
             Spotify uri's in string format to be accessed. List in case
             when multiple uri's are accessed by same request.
-        metadata : list of str
+        metadata : list (of list) of str
             List of the metadata keys that are requested to be saved
         """
 
-        # Create correct output dictionary in case of 1 processed uri
-        if len(list_uri) == 1:
-            output = {self.reference: [output]}
+        if isinstance(list_uri, str):
+            list_uri = [list_uri]
 
-        # Get metadata 1-deep
-        if not isinstance(metadata[0], list):
-            for n_uri, uri in enumerate(list_uri):
-                self.metadata[uri] = dict.fromkeys(metadata)
-                for mdata in metadata:
-                    self.metadata[uri][mdata] = output[self.reference][n_uri][mdata]
-            return
+        # The single-item endpoint returns the item itself
+        items = [output] if len(list_uri) == 1 else output[self.reference]
 
-        # Metadata 2-deep
-        if len(metadata[0]) != 2:
-            logging.fatal("Can only process metadata that is 1- or 2-deep!")
+        extracted = compile_fields(metadata).extract_batch(items)
+        for uri, values in zip(list_uri, extracted):
+            if values is not None:
+                self.metadata[uri] = values
 
-        for n_uri, uri in enumerate(list_uri):
-            metadata_1 = [sublist[0] for sublist in metadata]
-            metadata_2 = [sublist[-1] for sublist in metadata]
-            self.metadata[uri] = dict.fromkeys(metadata_2)
-            for imd, mdata in enumerate(metadata_2):
-                output_new = output[self.reference][n_uri][metadata_1[imd]]
-                if not isinstance(output_new, list):
-                    self.metadata[uri][mdata] = output_new[mdata]
-                else:
-                    self.metadata[uri][mdata] = output_new[0][mdata]
-
-    def access_spotify_api_async(self, uri_list, metadata):
+    def access_spotify_api_async(self, uri_list, metadata, n_uri=50):
         """
         Access Spotify metadata via `aiohttp` (i.e. asynchronous).
-        First function to process the input in batches
+        All requests share the pooled `ClientSession` of `self.session`,
+        uri's are packed together in requests of up to `n_uri` ids, and
+        the number of requests in flight is capped at `self.max_concurrency`
 
-        Note that too many requests to Spotify API will block the
-        script because the API rate limit exceeded. This can be
-        controlled by `self.batch_size` and `self.sec_wait`. Function
-        will terminate in case one API request was not successful.
+        Requests are paced by `self.rate_limiter`, which adapts to the
+        API rate limit. Failed requests are retried, and uri's of which
+        the request kept failing are skipped.
 
         Parameters
         ----------
@@ -186,24 +498,26 @@ class Spotify:
         metadata : list (of list) of str
             List of the metadata keys that are requested to be saved
             In case of double list the requested data is two-layer deep
-        """
+        n_uri : int, default 50
+            Integer of how many uri's are accessed in the same request.
+            Clamped to `MAX_IDS[self.reference]`
 
-        # TODO: Add option to access n<=50 ids at once
+        Return
+        ------
+        bool
+            Boolean if accessing metadata was successful for all uri's
+        """
 
-        total_size = len(uri_list)
-        for ibx in tqdm(range(0, total_size, self.batch_size)):
-            succes = asyncio.run(
-                self.get_metadata_api(uri_list[ibx : ibx + self.batch_size], metadata)
-            )
-            if not succes:
-                break
-            time.sleep(self.sec_wait)
+        uri_list = self.get_cached_metadata(uri_list, metadata)
+        return asyncio.run(self.get_metadata_api(uri_list, metadata, n_uri))
 
-    async def get_metadata_api(self, uri_list, metadata):
+    async def get_metadata_api(self, uri_list, metadata, n_uri=50):
         """
         Access Spotify metadata via `aiohttp` (i.e. asynchronous)
-        Actual code to access metadata. Should be called in batches
-        by `access_spotify_api_async(uri_list, metadata)`
+        Actual code to access metadata. Uses the pooled session of
+        `self.session` for all requests and processes each response as
+        soon as it arrives.
+        Should be called by `access_spotify_api_async(uri_list, metadata)`
 
         Parameters
         ----------
@@ -212,56 +526,135 @@ class Spotify:
         metadata : list of str
             List of the metadata keys that are requested to be saved
             In case of double list the requested data is two-layer deep
+        n_uri : int, default 50
+            Integer of how many uri's are accessed in the same request.
+            Clamped to `MAX_IDS[self.reference]`
 
         Return
         ------
         bool
-            Boolean if accessing metadata was successful. Stop process in
-            case of error (typically because API rate limit exceeded)
+            Boolean if accessing metadata was successful for all uri's
         """
 
-        base_url = "https://api.spotify.com/v1/"
+        n_uri = min(n_uri, MAX_IDS.get(self.reference, 50))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(client, uri, progress):
+            succes = await self.fetch_batch(client, semaphore, uri, metadata)
+            progress.update(len(uri))
+            return succes
+
+        async with self.session.client() as client:
+            with tqdm(total=len(uri_list)) as progress:
+                async with asyncio.TaskGroup() as group:
+                    tasks = [
+                        group.create_task(
+                            fetch(client, uri_list[ibx : ibx + n_uri], progress)
+                        )
+                        for ibx in range(0, len(uri_list), n_uri)
+                    ]
+        return all(task.result() for task in tasks)
+
+    async def fetch_batch(self, client, semaphore, uri, metadata):
+        """
+        Access and process the metadata of one batch of uri's, which are
+        accessed in the same request. Can be used to schedule requests of
+        different clients in the same event loop
 
-        results = []
-        queue = asyncio.Queue()
-        async with asyncio.TaskGroup() as group:
-            for uri in uri_list:
-                url = base_url + self.reference + "/" + uri
-                group.create_task(self.make_request(url, queue))
+        Parameters
+        ----------
+        client : aiohttp.ClientSession
+            The pooled session of `self.session` used for all requests
+        semaphore : asyncio.Semaphore
+            Semaphore capping the number of requests in flight
+        uri : list of str
+            List of (at most 50) Spotify uri's in string format
+        metadata : list (of list) of str
+            List of the metadata keys that are requested to be saved
 
-        while not queue.empty():
-            results.append(await queue.get())
+        Return
+        ------
+        bool
+            Boolean if accessing metadata was successful
+        """
 
-        for res in results:
-            try:
-                output = json.loads(res["response"])
-                uri = res["url"].split("/")[-1]
-                self.fill_metadata_dictionary(output, uri, metadata)
-            except AttributeError:
-                logging.warning("API request not successful!")
-                logging.warning(res)
-                return False
-        return True
+        res = await self.make_request(client, semaphore, self.get_request_url(uri))
+        return self.process_response(res, uri, metadata)
 
-    async def make_request(self, url, queue: asyncio.Queue):
+    async def make_request(self, client, semaphore, url):
         """
         Asynchronously makes an HTTP GET request to the specified URL
-        using the aiohttp library. The ClientSession with custom headers
-        created by `get_spotify_access_token()`. The response is stored
-        in a dictionary along with the original URL and put into the
-        specified asyncio queue. A small sleep of 0.01 seconds is
-        introduced to avoid potential blocking issues.
+        using the aiohttp library. The headers with a valid access token
+        are taken from `self.session` for every attempt. The number of
+        concurrent requests is limited by the semaphore, the request
+        rate by `self.rate_limiter`. The token of the rate limiter is only
+        taken once inside the semaphore, such that at most
+        `self.max_concurrency` reservations are outstanding and the rate
+        increases of healthy responses apply to the next requests.
+        Requests are retried with backoff in case of rate-limit or server
+        errors, or with a refreshed access token in case the token was
+        rejected.
 
         Parameters
         ----------
+        client : aiohttp.ClientSession
+            The pooled session of `self.session` used for all requests
+        semaphore : asyncio.Semaphore
+            Semaphore capping the number of requests in flight
         url : str
             The URL to which the GET request is made.
-        queue : asyncio.Queue
-            An asyncio queue to store the results of the request.
+
+        Return
+        ------
+        dict
+            Dictionary with the response text, status and original URL
         """
 
-        async with ClientSession(headers=self.headers) as session:
-            async with session.get(url) as response:
-                result = {"response": await response.text(), "url": url}
-                await queue.put(result)
-                await asyncio.sleep(0.01)
+        for attempt in range(self.rate_limiter.retry.max_retries + 1):
+            async with semaphore:
+                await self.rate_limiter.acquire_async()
+                headers = await self.session.get_headers_async()
+                start = time.monotonic()
+                if self.session.metrics is not None:
+                    self.record_in_flight(1)
+                try:
+                    async with client.get(url, headers=headers) as response:
+                        result = {
+                            "response": await response.text(),
+                            "status": response.status,
+                            "url": url,
+                        }
+                        retry_after = response.headers.get("Retry-After")
+                except (ClientError, asyncio.TimeoutError) as err:
+                    result = {"response": str(err), "status": None, "url": url}
+                    retry_after = None
+                finally:
+                    if self.session.metrics is not None:
+                        self.record_in_flight(-1)
+            if self.session.metrics is not None:
+                self.record_request(result, time.monotonic() - start, attempt)
+
+            wait = self.get_retry_wait(
+                result["status"], retry_after, attempt, headers, start
+            )
+            if wait is None:
+                return result
+            await asyncio.sleep(wait)
+        return result
+
+    def record_in_flight(self, change):
+        """
+        Update the number of requests in flight (over all clients of the
+        metrics), and record the concurrency seen by new requests
+
+        Parameters
+        ----------
+        change : int
+            +1 when a request is sent, -1 when its response is received
+        """
+
+        in_flight = self.session.metrics.add_gauge("spotify_requests_in_flight", change)
+        if change > 0:
+            self.session.metrics.observe(
+                "spotify_requests_concurrency", in_flight, buckets=COUNT_BUCKETS
+            )
@@ -0,0 +1,225 @@
+"""
+Module with materialized listening statistics of the Spotify streaming
+history, which are updated incrementally when new plays are added
+"""
+import os
+import pandas as pd
+from spotify_analysis.utils import combine_categoricals
+
+
+# Column of the (modified) streaming history on which each level is grouped
+STATS_LEVELS = {
+    "track": "unique_tr",
+    "artist": "artist_name",
+    "album": "album_name",
+    "day": "day",
+}
+
+# Aggregates that are kept per entity of every level
+STATS_COLUMNS = ["plays", "ms_played", "skips"]
+
+
+def prepare_plays(df):
+    """
+    Select the tracks of (part of) the streaming history, with the columns
+    needed for the statistics. Accepts the history as loaded by
+    `get_spotify_history(inputdir)` or as modified by
+    `modify_columns_spotify_history(df)`
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with (part of) the Spotify streaming history
+
+    Return
+    ------
+    pandas.DataFrame
+        Dataframe with one row per played track and a column per level,
+        `ms_played` and `skips`
+    """
+
+    def column(name):
+        for prefix in ["", "master_metadata_album_", "master_metadata_"]:
+            if prefix + name in df.columns:
+                return df[prefix + name]
+        return pd.Series(None, index=df.index, dtype=object)
+
+    # Remove the non-tracks from history (e.g. podcasts)
+    if "spotify_track_uri" in df.columns:
+        df = df.loc[df["spotify_track_uri"].notna().to_numpy()]
+
+    plays = pd.DataFrame(
+        {
+            "artist_name": column("artist_name").astype("category"),
+            "album_name": column("album_name").astype("category"),
+            "ms_played": column("ms_played").fillna(0).astype("int64"),
+            "skips": column("skipped").fillna(False).astype("int64"),
+        },
+        index=df.index,
+    )
+    if "unique_tr" in df.columns:
+        plays["unique_tr"] = df["unique_tr"]
+    else:
+        plays["unique_tr"] = combine_categoricals(
+            plays["artist_name"], column("track_name")
+        )
+    plays["day"] = pd.to_datetime(column("ts"), utc=True).dt.floor("D")
+    return plays
+
+
+class ListeningStats:
+    """
+    Materialized play counts, total `ms_played` and skip counts per track,
+    artist, album and day. New plays are aggregated on their own and added
+    to the stored aggregates, such that queries never rescan the plays.
+
+    Attributes
+    ----------
+    stats_dir : str or None
+        The path to the directory where the aggregates are stored, None if
+        they are only kept in memory
+    aggregates : dict
+        Dictionary with a dataframe per level (with the entity as index and
+        `STATS_COLUMNS` as columns)
+    """
+
+    def __init__(self, stats_dir=None):
+        self.stats_dir = stats_dir
+        self.aggregates = {
+            level: pd.DataFrame(
+                {col: pd.Series(dtype="int64") for col in STATS_COLUMNS},
+                index=pd.Index([], name=level),
+            )
+            for level in STATS_LEVELS
+        }
+
+        if stats_dir is not None:
+            os.makedirs(stats_dir, exist_ok=True)
+            for level in STATS_LEVELS:
+                path = self.get_path(level)
+                if os.path.exists(path):
+                    self.aggregates[level] = pd.read_feather(path).set_index(level)
+
+    def get_path(self, level):
+        """
+        The path to the stored aggregates of a level
+
+        Parameters
+        ----------
+        level : str
+            Level of the aggregates ('track', 'artist', 'album' or 'day')
+
+        Return
+        ------
+        str
+            The path to the feather file of the level
+        """
+
+        return os.path.join(self.stats_dir, f"{level}.feather")
+
+    def update(self, df):
+        """
+        Add new plays to the aggregates. Only the new plays are grouped, and
+        the aggregates of entities that were seen before are updated in
+        place. Entities that are seen for the first time are appended, which
+        copies the aggregates of the level (once per update)
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Dataframe with the new plays of the Spotify streaming history
+        """
+
+        plays = prepare_plays(df)
+        for level, key in STATS_LEVELS.items():
+            grouped = plays.groupby(key, observed=True, sort=False)
+            new = grouped[["ms_played", "skips"]].sum()
+            new.insert(0, "plays", grouped.size())
+            new.index = pd.Index(new.index.to_numpy(), name=level)
+
+            new = new[STATS_COLUMNS].astype("int64")
+            old = self.aggregates[level]
+            if len(old) == 0:
+                self.aggregates[level] = new
+                continue
+
+            positions = old.index.get_indexer(new.index)
+            seen = positions >= 0
+            if seen.any():
+                rows = positions[seen]
+                old.iloc[rows] = old.iloc[rows].to_numpy() + new[seen].to_numpy()
+            if not seen.all():
+                self.aggregates[level] = pd.concat([old, new[~seen]])
+
+    def save(self):
+        """
+        Store the aggregates of all levels in `stats_dir`
+        """
+
+        for level, aggregate in self.aggregates.items():
+            aggregate.reset_index().to_feather(self.get_path(level))
+
+    def top(self, level, n=20, by="plays"):
+        """
+        Entities with the highest aggregate
+
+        Parameters
+        ----------
+        level : str
+            Level of the aggregates ('track', 'artist', 'album' or 'day')
+        n : int, default 20
+            Number of entities to return
+        by : str, default 'plays'
+            Aggregate to rank on ('plays', 'ms_played' or 'skips')
+
+        Return
+        ------
+        pandas.DataFrame
+            Aggregates of the top `n` entities, in descending order
+        """
+
+        return self.aggregates[level].nlargest(n, by)
+
+    def get(self, level, entity):
+        """
+        Aggregates of a single entity
+
+        Parameters
+        ----------
+        level : str
+            Level of the aggregates ('track', 'artist', 'album' or 'day')
+        entity : str or pandas.Timestamp
+            The entity (e.g. artist name, or day for level 'day')
+
+        Return
+        ------
+        dict
+            Dictionary with the aggregates, zero if the entity is unknown
+        """
+
+        aggregate = self.aggregates[level]
+        if entity not in aggregate.index:
+            return dict.fromkeys(STATS_COLUMNS, 0)
+        return {col: int(value) for col, value in aggregate.loc[entity].items()}
+
+    def counts(self, level, values, by="plays"):
+        """
+        Aggregate of the entities of every play, e.g. to add the play count
+        of the track to each play
+
+        Parameters
+        ----------
+        level : str
+            Level of the aggregates ('track', 'artist', 'album' or 'day')
+        values : pandas.Series
+            Entity of every play
+        by : str, default 'plays'
+            Aggregate to return ('plays', 'ms_played' or 'skips')
+
+        Return
+        ------
+        pandas.Series
+            Aggregate of the entity of every play
+        """
+
+        return values.map(self.aggregates[level][by]).astype("Int64")
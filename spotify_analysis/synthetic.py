@@ -0,0 +1,394 @@
+"""
+Module to generate synthetic (but realistic) extended streaming history
+exports of any size: multiple `Streaming_History_Audio_*.json` files with
+Zipf-distributed track and artist popularity, skips, podcast episodes and
+null values, such that the loading and analysis can be tested and
+benchmarked at scale
+
+Run as `python -m spotify_analysis.synthetic --help`
+"""
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+
+# Number of plays of the named export sizes
+HISTORY_SIZES = {"100k": 100000, "1M": 1000000, "10M": 10000000}
+
+# Columns of the extended streaming history, in the order of the exports
+HISTORY_COLUMNS = [
+    "ts",
+    "username",
+    "platform",
+    "ms_played",
+    "conn_country",
+    "ip_addr_decrypted",
+    "user_agent_decrypted",
+    "master_metadata_track_name",
+    "master_metadata_album_artist_name",
+    "master_metadata_album_album_name",
+    "spotify_track_uri",
+    "episode_name",
+    "episode_show_name",
+    "spotify_episode_uri",
+    "reason_start",
+    "reason_end",
+    "shuffle",
+    "skipped",
+    "offline",
+    "offline_timestamp",
+    "incognito_mode",
+]
+
+PLATFORMS = ["android", "ios", "osx", "windows", "web_player", "cast_to_device"]
+COUNTRIES = ["NL", "CH", "DE", "FR", "US", "GB"]
+REASONS_START = ["trackdone", "clickrow", "fwdbtn", "backbtn", "playbtn", "appload"]
+BASE62 = np.array(
+    list("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+)
+
+
+def get_zipf_cdf(n_items, exponent, offset=0.0):
+    """
+    Cumulative distribution of a Zipf(-Mandelbrot) law over `n_items`
+    ranks, i.e. the probability of rank `k` is proportional to
+    `1 / (k + offset) ** exponent`
+
+    Parameters
+    ----------
+    n_items : int
+        Number of items
+    exponent : float
+        Exponent of the Zipf law, larger values concentrate the plays on
+        fewer items
+    offset : float, default 0
+        Offset of the ranks, which flattens the head of the distribution
+
+    Return
+    ------
+    numpy.ndarray
+        Cumulative probability of every rank, to be used with
+        `numpy.searchsorted`
+    """
+
+    weights = 1.0 / (np.arange(1, n_items + 1) + offset) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def make_uris(rng, n_items, kind):
+    """
+    Random Spotify uri's (22 base62 characters)
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        Random generator
+    n_items : int
+        Number of uri's
+    kind : str
+        Kind of item, e.g. 'track' or 'episode'
+
+    Return
+    ------
+    numpy.ndarray
+        Object array with uri's like `spotify:track:6rqhFgbbKwnb9MLmUQDhG6`
+    """
+
+    chars = BASE62[rng.integers(0, len(BASE62), (n_items, 22))]
+    ids = chars.view("U22").ravel()
+    return np.char.add(f"spotify:{kind}:", ids).astype(object)
+
+
+class SyntheticCatalog:
+    """
+    Catalog of tracks, artists, albums and podcast episodes from which the
+    synthetic plays are drawn. Tracks are assigned to artists and plays to
+    tracks with Zipf-distributed popularity
+
+    Attributes
+    ----------
+    tracks : pandas.DataFrame
+        Track name, artist name, album name, uri and `duration_ms`
+    episodes : pandas.DataFrame
+        Episode name, show name, uri and `duration_ms`
+
+    n_tracks : int
+        Number of distinct tracks
+    n_artists : int, default None
+        Number of distinct artists, `n_tracks // 3` if not provided
+    n_episodes : int, default 500
+        Number of distinct podcast episodes
+    exponent : float, default 0.8
+        Exponent of the Zipf law of the popularity of tracks and artists
+    offset : float, default 20
+        Rank offset of the Zipf law, such that the most played track has
+        a few permille of the plays (as in real histories)
+    seed : int, default 0
+        Seed of the random generator
+    """
+
+    def __init__(
+        self,
+        n_tracks,
+        n_artists=None,
+        *,
+        n_episodes=500,
+        exponent=0.8,
+        offset=20.0,
+        seed=0,
+    ):
+        rng = np.random.default_rng(seed)
+        n_artists = max(1, n_tracks // 3) if n_artists is None else n_artists
+
+        # Popular artists have more tracks
+        artist = np.searchsorted(
+            get_zipf_cdf(n_artists, exponent, offset), rng.random(n_tracks)
+        )
+        number = np.arange(n_tracks)
+        self.tracks = pd.DataFrame(
+            {
+                "track_name": np.char.add("Track ", number.astype(str)).astype(object),
+                "artist_name": np.char.add("Artist ", artist.astype(str)).astype(
+                    object
+                ),
+                "album_name": np.char.add(
+                    np.char.add("Album ", artist.astype(str)),
+                    np.char.add("-", (number % 4).astype(str)),
+                ).astype(object),
+                "track_uri": make_uris(rng, n_tracks, "track"),
+                "duration_ms": rng.integers(90000, 360000, n_tracks),
+            }
+        )
+        # Some names are not ascii
+        self.tracks.loc[number % 10 == 0, "track_name"] += " – Café Version"
+
+        show = rng.integers(0, max(1, n_episodes // 20), n_episodes)
+        self.episodes = pd.DataFrame(
+            {
+                "episode_name": np.char.add(
+                    "Episode ", np.arange(n_episodes).astype(str)
+                ).astype(object),
+                "episode_show_name": np.char.add("Show ", show.astype(str)).astype(
+                    object
+                ),
+                "episode_uri": make_uris(rng, n_episodes, "episode"),
+                "duration_ms": rng.integers(600000, 7200000, n_episodes),
+            }
+        )
+        self._cdf = get_zipf_cdf(n_tracks, exponent, offset)
+
+    def sample_tracks(self, rng, n_plays):
+        """
+        Draw the tracks of plays according to their popularity
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator
+            Random generator
+        n_plays : int
+            Number of plays
+
+        Return
+        ------
+        numpy.ndarray
+            Position in `self.tracks` of the track of every play
+        """
+
+        return np.searchsorted(self._cdf, rng.random(n_plays))
+
+    def generate(
+        self,
+        rng,
+        n_plays,
+        start,
+        end,
+        *,
+        username="synthetic_user",
+        podcast_fraction=0.05,
+        null_fraction=0.01,
+    ):
+        """
+        Generate plays between `start` and `end`, sorted by time
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator
+            Random generator
+        n_plays : int
+            Number of plays
+        start : pandas.Timestamp
+            Start of the period of the plays
+        end : pandas.Timestamp
+            End of the period of the plays
+        username : str, default 'synthetic_user'
+            Username of all plays
+        podcast_fraction : float, default 0.05
+            Fraction of plays that are podcast episodes
+        null_fraction : float, default 0.01
+            Fraction of plays without track or episode metadata (e.g. local
+            files, or tracks that were removed from Spotify)
+
+        Return
+        ------
+        pandas.DataFrame
+            Plays with the columns of the extended streaming history
+        """
+
+        seconds = np.sort(
+            rng.integers(start.value // 10**9, end.value // 10**9, n_plays)
+        )
+        ts = seconds.astype("datetime64[s]").astype(str).astype(object) + "Z"
+        kind = rng.random(n_plays)
+        is_episode = kind < podcast_fraction
+        is_null = (kind >= podcast_fraction) & (kind < podcast_fraction + null_fraction)
+        is_track = ~(is_episode | is_null)
+
+        tracks = self.tracks.iloc[self.sample_tracks(rng, n_plays)]
+        tracks = tracks.reset_index(drop=True)
+        tracks.loc[~is_track] = None
+        episodes = self.episodes.iloc[
+            rng.integers(0, len(self.episodes), n_plays)
+        ].reset_index(drop=True)
+        episodes.loc[~is_episode] = None
+
+        # A quarter of the plays is skipped within 30 seconds
+        duration = np.where(
+            is_episode,
+            episodes["duration_ms"].to_numpy(float),
+            tracks["duration_ms"].to_numpy(float),
+        )
+        duration = np.nan_to_num(duration, nan=180000.0)
+        skipped = rng.random(n_plays) < 0.25
+        ms_played = np.where(
+            skipped,
+            rng.integers(0, 30000, n_plays),
+            (duration * rng.uniform(0.5, 1.0, n_plays) ** 0.2).astype(np.int64),
+        )
+        # Older exports have no skipped flag
+        skipped_flag = pd.array(skipped, dtype="boolean")
+        skipped_flag[rng.random(n_plays) < 0.3] = pd.NA
+
+        return pd.DataFrame(
+            {
+                "ts": ts,
+                "username": username,
+                "platform": rng.choice(
+                    PLATFORMS, n_plays, p=[0.4, 0.2, 0.2, 0.1, 0.05, 0.05]
+                ),
+                "ms_played": ms_played,
+                "conn_country": rng.choice(
+                    COUNTRIES, n_plays, p=[0.7, 0.1, 0.05, 0.05, 0.05, 0.05]
+                ),
+                "ip_addr_decrypted": np.char.add(
+                    "192.0.2.", rng.integers(1, 255, n_plays).astype(str)
+                ).astype(object),
+                "user_agent_decrypted": "unknown",
+                "master_metadata_track_name": tracks["track_name"],
+                "master_metadata_album_artist_name": tracks["artist_name"],
+                "master_metadata_album_album_name": tracks["album_name"],
+                "spotify_track_uri": tracks["track_uri"],
+                "episode_name": episodes["episode_name"],
+                "episode_show_name": episodes["episode_show_name"],
+                "spotify_episode_uri": episodes["episode_uri"],
+                "reason_start": rng.choice(REASONS_START, n_plays),
+                "reason_end": np.where(skipped, "fwdbtn", "trackdone"),
+                "shuffle": rng.random(n_plays) < 0.4,
+                "skipped": skipped_flag,
+                "offline": rng.random(n_plays) < 0.02,
+                "offline_timestamp": seconds,
+                "incognito_mode": False,
+            }
+        )
+
+
+def write_export(
+    outputdir,
+    n_plays,
+    *,
+    plays_per_file=15000,
+    start="2015-01-01",
+    end="2024-12-31",
+    seed=0,
+    **kwargs,
+):
+    """
+    Write a synthetic extended streaming history export: multiple
+    `Streaming_History_Audio_<years>_<number>.json` files, each with the
+    plays of a consecutive period (like the exports of Spotify). The
+    plays are generated per file, so the export can be larger than memory
+
+    Parameters
+    ----------
+    outputdir : str
+        The path to the directory of the export
+    n_plays : int
+        Total number of plays
+    plays_per_file : int, default 15000
+        Number of plays per file
+    start : str, default '2015-01-01'
+        Start of the period of the plays
+    end : str, default '2024-12-31'
+        End of the period of the plays
+    seed : int, default 0
+        Seed of the random generators, the same seed gives the same export
+    **kwargs
+        Other arguments of `SyntheticCatalog.generate()` (e.g.
+        `podcast_fraction` or `null_fraction`)
+
+    Return
+    ------
+    list of str
+        The paths of the written files
+    """
+
+    os.makedirs(outputdir, exist_ok=True)
+    catalog = SyntheticCatalog(n_tracks=max(100, int(n_plays**0.8)), seed=seed)
+    n_files = max(1, -(-n_plays // plays_per_file))
+    edges = pd.date_range(start, end, periods=n_files + 1, tz="UTC")
+
+    paths = []
+    for ifile in range(n_files):
+        rng = np.random.default_rng([seed, ifile])
+        size = min(plays_per_file, n_plays - ifile * plays_per_file)
+        df = catalog.generate(rng, size, edges[ifile], edges[ifile + 1], **kwargs)
+        name = f"Streaming_History_Audio_{edges[ifile].year}-{edges[ifile + 1].year}"
+        paths.append(os.path.join(outputdir, f"{name}_{ifile}.json"))
+        df.to_json(paths[-1], orient="records", force_ascii=False)
+    return paths
+
+
+def main(argv=None):
+    """
+    Write a synthetic extended streaming history export
+
+    Parameters
+    ----------
+    argv : list of str, default None
+        Command line arguments, `sys.argv[1:]` if not provided
+    """
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic history")
+    parser.add_argument("output", type=str, help="Directory of the export")
+    parser.add_argument(
+        "--size", type=str, default="100k", help=f"One of {list(HISTORY_SIZES)}"
+    )
+    parser.add_argument("--plays", type=int, default=None, help="Overrides --size")
+    parser.add_argument("--plays-per-file", type=int, default=15000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n_plays = HISTORY_SIZES[args.size] if args.plays is None else args.plays
+    paths = write_export(
+        args.output, n_plays, plays_per_file=args.plays_per_file, seed=args.seed
+    )
+    logging.info("Wrote %d plays in %d files to %s", n_plays, len(paths), args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
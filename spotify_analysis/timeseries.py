@@ -0,0 +1,189 @@
+"""
+Module with a time-indexed view of the Spotify streaming history, with
+precomputed daily, weekly and monthly rollups and fast range slicing
+"""
+import numpy as np
+import pandas as pd
+
+
+# Frequency of the rollups, with weeks starting on Monday
+ROLLUP_FREQS = {"day": "D", "week": "W-MON", "month": "MS"}
+
+
+def get_period_start(index, level):
+    """
+    Start of the day, week or month of every timestamp
+
+    Parameters
+    ----------
+    index : pandas.DatetimeIndex
+        Sorted UTC timestamps
+    level : str
+        Level of the rollup ('day', 'week' or 'month')
+
+    Return
+    ------
+    pandas.DatetimeIndex
+        Start of the period (UTC) of every timestamp
+    """
+
+    day = index.floor("D")
+    if level == "day":
+        return day
+    if level == "week":
+        return day - pd.to_timedelta(day.dayofweek, unit="D")
+    return day - pd.to_timedelta(day.day - 1, unit="D")
+
+
+class ListeningTimeline:
+    """
+    Time-indexed Spotify streaming history. `ts` is parsed and sorted once,
+    and the rollups per day, week and month are precomputed: minutes
+    played, number of plays, distinct tracks and artists, and the number
+    and rate of newly discovered artists. Date ranges are selected with a
+    binary search on the sorted index, so a query costs O(log n + k).
+
+    Attributes
+    ----------
+    plays : pandas.DataFrame
+        Plays with a valid `ts`, with the sorted UTC `ts` as index
+    rollups : dict
+        Dictionary with a dataframe per level ('day', 'week' and 'month'),
+        with the start of every period as index
+    """
+
+    def __init__(self, df):
+        ts = pd.to_datetime(df["ts"], utc=True)
+        valid = ts.notna().to_numpy()
+        order = np.argsort(ts.to_numpy(dtype="datetime64[ns]")[valid], kind="stable")
+        positions = np.flatnonzero(valid)[order]
+
+        self.plays = df.drop(columns="ts").take(positions)
+        self.plays.index = pd.DatetimeIndex(ts.take(positions), name="ts").as_unit("ns")
+
+        self.rollups = {level: self.get_rollup(level) for level in ROLLUP_FREQS}
+
+    def get_rollup(self, level):
+        """
+        Compute the rollup of a level from the plays
+
+        Parameters
+        ----------
+        level : str
+            Level of the rollup ('day', 'week' or 'month')
+
+        Return
+        ------
+        pandas.DataFrame
+            Dataframe with one row per period (also without plays)
+        """
+
+        period = get_period_start(self.plays.index, level)
+        plays = pd.DataFrame(
+            {
+                "minutes_played": self.plays["ms_played"].to_numpy() / 60000,
+                "track": self.plays["unique_tr"].to_numpy(),
+                "artist": self.plays["artist_name"].to_numpy(),
+                # Plays are sorted, so the first play of an artist is its discovery
+                "new_artist": (
+                    ~self.plays["artist_name"].duplicated()
+                    & self.plays["artist_name"].notna()
+                ).to_numpy(),
+            },
+            index=period,
+        )
+
+        grouped = plays.groupby(level=0, sort=False)
+        rollup = pd.DataFrame(
+            {
+                "minutes_played": grouped["minutes_played"].sum(),
+                "plays": grouped.size(),
+                "tracks": grouped["track"].nunique(),
+                "artists": grouped["artist"].nunique(),
+                "new_artists": grouped["new_artist"].sum(),
+            }
+        )
+        if len(rollup) > 0:
+            periods = pd.date_range(
+                rollup.index[0], rollup.index[-1], freq=ROLLUP_FREQS[level]
+            )
+            rollup = rollup.reindex(periods, fill_value=0)
+        rollup["discovery_rate"] = (
+            rollup["new_artists"] / rollup["artists"].where(rollup["artists"] > 0)
+        ).fillna(0.0)
+        rollup.index.name = level
+        return rollup
+
+    @staticmethod
+    def search(index, start=None, end=None):
+        """
+        Positions of the range [start, end) in a sorted DatetimeIndex,
+        found with a binary search
+
+        Parameters
+        ----------
+        index : pandas.DatetimeIndex
+            Sorted UTC timestamps
+        start : str or pandas.Timestamp, default None
+            Start of the range (inclusive), from the first timestamp if None
+        end : str or pandas.Timestamp, default None
+            End of the range (exclusive), up to the last timestamp if None
+
+        Return
+        ------
+        slice
+            Slice of the positions in the range
+        """
+
+        ns = index.as_unit("ns").asi8
+
+        def position(value, default):
+            if value is None:
+                return default
+            value = pd.Timestamp(value)
+            if value.tzinfo is None:
+                value = value.tz_localize("UTC")
+            return int(np.searchsorted(ns, value.value, side="left"))
+
+        return slice(position(start, 0), position(end, len(index)))
+
+    def slice(self, start=None, end=None):
+        """
+        Plays in the range [start, end)
+
+        Parameters
+        ----------
+        start : str or pandas.Timestamp, default None
+            Start of the range (inclusive), naive timestamps are UTC
+        end : str or pandas.Timestamp, default None
+            End of the range (exclusive), naive timestamps are UTC
+
+        Return
+        ------
+        pandas.DataFrame
+            Plays in the range, sorted by `ts`
+        """
+
+        return self.plays.iloc[self.search(self.plays.index, start, end)]
+
+    def rollup(self, level="day", start=None, end=None):
+        """
+        Rollup of the periods that start in the range [start, end)
+
+        Parameters
+        ----------
+        level : str, default 'day'
+            Level of the rollup ('day', 'week' or 'month')
+        start : str or pandas.Timestamp, default None
+            Start of the range (inclusive), naive timestamps are UTC
+        end : str or pandas.Timestamp, default None
+            End of the range (exclusive), naive timestamps are UTC
+
+        Return
+        ------
+        pandas.DataFrame
+            Rollup with one row per period
+        """
+
+        rollup = self.rollups[level]
+        return rollup.iloc[self.search(rollup.index, start, end)]
@@ -0,0 +1,365 @@
+"""
+Module with streaming top-k (heavy-hitters) of tracks, artists and albums,
+for streaming histories that do not fit in memory
+
+Two bounded-memory sketches are combined:
+
+- Space-Saving keeps `capacity` counters. Every count overestimates the
+  true count by at most its `error`, and `error <= N / capacity` with `N`
+  the number of plays seen. Every item with more than `N / capacity`
+  plays is monitored, so the top-k is exact as long as the k-th count is
+  well above this bound
+- Count-Min keeps `depth` x `width` counters. An estimate overestimates
+  the true count by at most `e / width * N`, with probability at least
+  `1 - exp(-depth)`. It tightens the Space-Saving counts
+
+The exact mode counts every distinct item (memory grows with the number
+of distinct items), and is meant for validation.
+"""
+import numpy as np
+import pandas as pd
+from spotify_analysis.stats import STATS_LEVELS, prepare_plays
+from spotify_analysis.utils import iter_spotify_history
+
+
+# Levels of which the heavy-hitters are kept
+TOPK_LEVELS = ["track", "artist", "album"]
+
+
+def count_values(values):
+    """
+    Exact counts of the non-null values of a chunk
+
+    Parameters
+    ----------
+    values : pandas.Series
+        Values of a chunk (e.g. artist names)
+
+    Return
+    ------
+    pandas.Series
+        Counts with the distinct values (as objects) as index
+    """
+
+    counts = values.value_counts(sort=False, dropna=True)
+    counts = counts[counts.to_numpy() > 0].astype("int64")
+    counts.index = pd.Index(counts.index.to_numpy(dtype=object))
+    return counts
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary with at most `capacity` counters. Chunks are
+    counted exactly and merged into the summary (mergeable summaries of
+    Agarwal et al.), which keeps the bound `error <= N / capacity`
+
+    Attributes
+    ----------
+    capacity : int
+        Maximum number of monitored items
+    counts : pandas.Series
+        Estimated (over)counts of the monitored items
+    errors : pandas.Series
+        Maximum overestimation of the counts
+    n_seen : int
+        Number of values seen
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+        self.errors = pd.Series(dtype="int64")
+        self.n_seen = 0
+
+    @property
+    def min_count(self):
+        """
+        Upper bound of the count of every item that is not monitored
+        """
+
+        if len(self.counts) < self.capacity:
+            return 0
+        return int(self.counts.min())
+
+    def update(self, values):
+        """
+        Add the values of a chunk to the summary
+
+        Parameters
+        ----------
+        values : pandas.Series
+            Values of a chunk (e.g. artist names), nulls are skipped
+        """
+
+        chunk = count_values(values)
+        self.n_seen += int(chunk.sum())
+
+        # Items that are not monitored could have had up to `min_count` plays
+        min_count = self.min_count
+        index = self.counts.index.union(chunk.index, sort=False)
+        counts = self.counts.reindex(index, fill_value=min_count) + chunk.reindex(
+            index, fill_value=0
+        )
+        errors = self.errors.reindex(index, fill_value=min_count)
+
+        counts = counts.nlargest(self.capacity, keep="first")
+        self.counts = counts
+        self.errors = errors.reindex(counts.index)
+
+    @property
+    def error_bound(self):
+        """
+        Maximum overestimation of every count, `N / capacity`
+        """
+
+        return self.n_seen / self.capacity
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch of `depth` rows with `width` counters. Values are
+    hashed once to 64 bits, and every row uses its own multiply-shift hash
+
+    Attributes
+    ----------
+    width : int
+        Number of counters per row
+    depth : int
+        Number of rows
+    table : numpy.ndarray
+        Array of shape (depth, width) with the counters
+    """
+
+    def __init__(self, width=2**16, depth=4, seed=0):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        self._mult = rng.integers(1, 2**63, size=depth, dtype=np.uint64) | 1
+        self._add = rng.integers(0, 2**63, size=depth, dtype=np.uint64)
+
+    @classmethod
+    def from_error(cls, epsilon, delta, seed=0):
+        """
+        Sketch of which an estimate overestimates by at most `epsilon * N`
+        with probability at least `1 - delta`
+
+        Parameters
+        ----------
+        epsilon : float
+            Relative error of the estimates
+        delta : float
+            Probability that an estimate exceeds the error
+        seed : int, default 0
+            Seed of the hash functions
+
+        Return
+        ------
+        CountMinSketch
+            Empty sketch with the required width and depth
+        """
+
+        width = int(np.ceil(np.e / epsilon))
+        depth = int(np.ceil(np.log(1 / delta)))
+        return cls(width, depth, seed)
+
+    def get_buckets(self, values):
+        """
+        Counter of every value in every row
+
+        Parameters
+        ----------
+        values : pandas.Series or pandas.Index
+            Non-null values (e.g. artist names)
+
+        Return
+        ------
+        numpy.ndarray
+            Array of shape (depth, len(values)) with the counter indices
+        """
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Only the categories are hashed
+            categories = pd.util.hash_array(values.cat.categories.to_numpy(object))
+            hashes = categories[values.cat.codes.to_numpy()]
+        else:
+            hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        mixed = hashes[None, :] * self._mult[:, None] + self._add[:, None]
+        return ((mixed >> np.uint64(32)) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, values):
+        """
+        Add the values of a chunk to the sketch
+
+        Parameters
+        ----------
+        values : pandas.Series
+            Values of a chunk (e.g. artist names), nulls are skipped
+        """
+
+        values = values.dropna()
+        for row, buckets in enumerate(self.get_buckets(values)):
+            self.table[row] += np.bincount(buckets, minlength=self.width)
+
+    def query(self, items):
+        """
+        Estimated counts of items
+
+        Parameters
+        ----------
+        items : pandas.Index
+            Items (e.g. artist names)
+
+        Return
+        ------
+        numpy.ndarray
+            Estimated (over)counts of the items
+        """
+
+        if len(items) == 0:
+            return np.zeros(0, dtype=np.int64)
+        buckets = self.get_buckets(items)
+        return np.take_along_axis(self.table, buckets, axis=1).min(axis=0)
+
+
+class StreamingTopK:
+    """
+    Streaming top-k of tracks, artists and albums, which consumes chunks
+    of the streaming history (e.g. from `iter_spotify_history(inputdir,
+    chunksize)`) with constant memory. See the module documentation for
+    the error bounds
+
+    Attributes
+    ----------
+    k : int, default 20
+        Number of heavy-hitters that is requested
+    capacity : int, default None
+        Number of Space-Saving counters per level, `50 * k` if not provided
+    exact : bool, default False
+        Whether all items are counted exactly, for validation
+    summaries : dict
+        Dictionary with the `SpaceSaving` summary of every level
+    sketches : dict
+        Dictionary with the `CountMinSketch` of every level
+    """
+
+    def __init__(self, k=20, capacity=None, exact=False, width=2**16, depth=4):
+        self.k = k
+        self.capacity = 50 * k if capacity is None else capacity
+        self.exact = exact
+        self.summaries = {level: SpaceSaving(self.capacity) for level in TOPK_LEVELS}
+        self.sketches = {
+            level: CountMinSketch(width, depth, seed)
+            for seed, level in enumerate(TOPK_LEVELS)
+        }
+        self.counts = {level: pd.Series(dtype="int64") for level in TOPK_LEVELS}
+
+    def update(self, df):
+        """
+        Add a chunk of the streaming history
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Chunk of the Spotify streaming history
+        """
+
+        plays = prepare_plays(df)
+        for level in TOPK_LEVELS:
+            values = plays[STATS_LEVELS[level]]
+            if self.exact:
+                self.counts[level] = self.counts[level].add(
+                    count_values(values), fill_value=0
+                )
+            else:
+                self.summaries[level].update(values)
+                self.sketches[level].update(values)
+
+    def top(self, level, n=None):
+        """
+        Heavy-hitters of a level
+
+        Parameters
+        ----------
+        level : str
+            Level of the heavy-hitters ('track', 'artist' or 'album')
+        n : int, default None
+            Number of heavy-hitters, `k` if not provided
+
+        Return
+        ------
+        pandas.DataFrame
+            Dataframe with the estimated `plays` and a guaranteed lower
+            bound (`min_plays`) of the top items, in descending order
+        """
+
+        n = self.k if n is None else n
+        if self.exact:
+            counts = self.counts[level].astype("int64")
+            top = counts.sort_values(ascending=False, kind="stable").head(n)
+            return pd.DataFrame({"plays": top, "min_plays": top})
+
+        summary = self.summaries[level]
+        plays = np.minimum(
+            summary.counts.to_numpy(), self.sketches[level].query(summary.counts.index)
+        )
+        top = pd.DataFrame(
+            {
+                "plays": plays,
+                "min_plays": (summary.counts - summary.errors).to_numpy(),
+            },
+            index=summary.counts.index,
+        )
+        return top.sort_values("plays", ascending=False, kind="stable").head(n)
+
+    def error_bound(self, level):
+        """
+        Maximum overestimation of the Space-Saving counts of a level
+
+        Parameters
+        ----------
+        level : str
+            Level of the heavy-hitters ('track', 'artist' or 'album')
+
+        Return
+        ------
+        float
+            Bound `N / capacity`, zero in exact mode
+        """
+
+        if self.exact:
+            return 0.0
+        return self.summaries[level].error_bound
+
+
+def get_top_streaming(inputdir, k=20, chunksize=100000, exact=False, n_jobs=None):
+    """
+    Top-k tracks, artists and albums of a streaming history that is too
+    large to be loaded at once
+
+    Parameters
+    ----------
+    inputdir : str
+        The path to the input directory where your Spotify streaming
+        history json files are stored
+    k : int, default 20
+        Number of heavy-hitters per level
+    chunksize : int, default 100000
+        Maximum number of plays processed at once
+    exact : bool, default False
+        Whether all items are counted exactly, for validation
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+
+    Return
+    ------
+    StreamingTopK
+        Top-k of all chunks of the history
+    """
+
+    topk = StreamingTopK(k=k, exact=exact)
+    for df in iter_spotify_history(
+        inputdir, chunksize=chunksize, drop_pii=True, n_jobs=n_jobs
+    ):
+        topk.update(df)
+    return topk
@@ -1,14 +1,45 @@
 """
 Module with some utility functions
 """
+import hashlib
+import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+from pyarrow import feather
+import pyarrow.parquet as pq
 
 
-def get_spotify_history(inputdir):
+# Explicit types of the columns of the (extended) streaming history
+HISTORY_DTYPES = {
+    "platform": "category",
+    "ms_played": "int64",
+    "conn_country": "category",
+    "reason_start": "category",
+    "reason_end": "category",
+    "shuffle": "boolean",
+    "skipped": "boolean",
+    "offline": "boolean",
+    "offline_timestamp": "Int64",
+    "incognito_mode": "boolean",
+}
+
+# Columns with personally identifiable information
+PII_COLUMNS = [
+    "ip_addr",
+    "ip_addr_decrypted",
+    "user_agent_decrypted",
+]
+
+
+def find_history_files(inputdir):
     """
-    Loads the .json files containing your Spotify streaming history and
-    converts them to a single pandas dataframe
+    Find the .json files containing your Spotify streaming history
 
     Parameters
     ----------
@@ -18,33 +49,602 @@ def get_spotify_history(inputdir):
 
     Return
     ------
-    pandas.Series
-        Full Spotify streaming history
+    list of str
+        Sorted list with the paths of the streaming history files
     """
 
-    # Find the input files
     input_file = []
     for filename in os.listdir(inputdir):
         if filename.endswith(".json") and filename.startswith("Streaming"):
             input_file.append(os.path.join(inputdir, filename))
+    return sorted(input_file)
+
+
+def apply_history_dtypes(df, drop_pii=False):
+    """
+    Convert the columns of a streaming history dataframe to their explicit
+    types: `ts` to datetime, repeated strings to categoricals and flags to
+    nullable booleans
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dataframe with (part of) the Spotify streaming history
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+
+    Return
+    ------
+    pandas.DataFrame
+        Dataframe with explicit types
+    """
+
+    if drop_pii:
+        df = df.drop(columns=[col for col in PII_COLUMNS if col in df.columns])
+
+    if "ts" in df.columns:
+        df["ts"] = pd.to_datetime(df["ts"], utc=True, errors="coerce", format="ISO8601")
+    dtypes = {col: dtype for col, dtype in HISTORY_DTYPES.items() if col in df.columns}
+    return df.astype(dtypes)
+
+
+def load_history_file(ifile, drop_pii=False):
+    """
+    Load a single .json file of the Spotify streaming history with explicit
+    types (see `apply_history_dtypes(df)`)
+
+    Parameters
+    ----------
+    ifile : str
+        The path to the streaming history json file
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+
+    Return
+    ------
+    pandas.DataFrame
+        Streaming history of this file
+    """
+
+    df = pd.read_json(ifile, dtype=False, convert_dates=False)
+    return apply_history_dtypes(df, drop_pii)
+
+
+def concat_history(df_array):
+    """
+    Concatenate streaming history dataframes, keeping categorical columns
+    categorical by taking the union of their categories
+
+    Parameters
+    ----------
+    df_array : list of pandas.DataFrame
+        Streaming history dataframes with explicit types
+
+    Return
+    ------
+    pandas.DataFrame
+        Single streaming history dataframe
+    """
+
+    df_array = [df for df in df_array if len(df.columns) > 0]
+    for col in df_array[0].columns if df_array else []:
+        if not all(
+            col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)
+            for df in df_array
+        ):
+            continue
+        categories = union_categoricals([df[col] for df in df_array]).categories
+        for df in df_array:
+            df[col] = df[col].cat.set_categories(categories)
+
+    return pd.concat(df_array, ignore_index=True)
+
+
+def record_rows(metrics, stage, n_rows, seconds):
+    """
+    Record the number of rows processed by a stage of the history loading
+    or normalizing, and its throughput
+
+    Parameters
+    ----------
+    metrics : Metrics
+        Metrics to which the rows are added
+    stage : str
+        Name of the stage, e.g. 'load' or 'normalize'
+    n_rows : int
+        Number of rows processed
+    seconds : float
+        Number of seconds spent (so far) by the stage
+    """
+
+    metrics.inc("history_rows_total", n_rows, stage=stage)
+    metrics.observe("history_stage_seconds", seconds, stage=stage)
+    if seconds > 0:
+        metrics.set_gauge("history_rows_per_second", n_rows / seconds, stage=stage)
+
+
+def iter_spotify_history(
+    inputdir, chunksize=None, drop_pii=False, n_jobs=None, metrics=None
+):
+    """
+    Loads the .json files containing your Spotify streaming history and
+    yields them as pandas dataframes, without materialising the whole
+    history. Files are parsed in parallel over a process pool, with at
+    most `n_jobs` files loaded ahead of the consumer
+
+    Parameters
+    ----------
+    inputdir : str
+        The path to the input directory where your Spotify streaming
+        history json files are stored
+    chunksize : int, default None
+        Maximum number of rows of a yielded dataframe. One dataframe per
+        file is yielded if not provided
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+    metrics : Metrics, default None
+        Metrics of the loaded files, bytes and rows (see
+        `load_history_files()`)
+
+    Yield
+    -----
+    pandas.DataFrame
+        Part of the Spotify streaming history with explicit types
+    """
+
+    input_file = find_history_files(inputdir)
+    for _, df in load_history_files(input_file, drop_pii, n_jobs, metrics):
+        if chunksize is None:
+            yield df
+            continue
+        for ibx in range(0, len(df), chunksize):
+            yield df.iloc[ibx : ibx + chunksize].reset_index(drop=True)
+
+
+def load_history_files(input_file, drop_pii=False, n_jobs=None, metrics=None):
+    """
+    Load streaming history files in parallel over a process pool, with at
+    most `n_jobs` files loaded ahead of the consumer
+
+    Parameters
+    ----------
+    input_file : list of str
+        List with the paths of the streaming history files
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+    metrics : Metrics, default None
+        Metrics to which the number of files, bytes parsed and rows (and
+        rows per second) are added. No metrics are recorded if not provided
+
+    Yield
+    -----
+    tuple
+        Tuple of the path of the file and its streaming history, in the
+        order of `input_file`
+    """
+
+    loaded = parse_history_files(input_file, drop_pii, n_jobs)
+    if metrics is None:
+        yield from loaded
+        return
+
+    start, n_rows = time.perf_counter(), 0
+    for ifile, df in loaded:
+        n_rows += len(df)
+        metrics.inc("history_files_total")
+        metrics.inc("history_bytes_parsed_total", os.path.getsize(ifile))
+        metrics.inc("history_rows_total", len(df), stage="load")
+        metrics.set_gauge(
+            "history_rows_per_second",
+            n_rows / max(time.perf_counter() - start, 1e-9),
+            stage="load",
+        )
+        yield ifile, df
+    metrics.observe("history_stage_seconds", time.perf_counter() - start, stage="load")
+
+
+def parse_history_files(input_file, drop_pii=False, n_jobs=None):
+    """
+    Parse streaming history files over a process pool (see
+    `load_history_files()`)
+
+    Parameters
+    ----------
+    input_file : list of str
+        List with the paths of the streaming history files
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+
+    Yield
+    -----
+    tuple
+        Tuple of the path of the file and its streaming history, in the
+        order of `input_file`
+    """
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(input_file))
+    if n_jobs <= 1:
+        for ifile in input_file:
+            yield ifile, load_history_file(ifile, drop_pii)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for ifile in input_file:
+            pending.append((ifile, executor.submit(load_history_file, ifile, drop_pii)))
+            if len(pending) > n_jobs:
+                ifile_done, future = pending.popleft()
+                yield ifile_done, future.result()
+        while pending:
+            ifile_done, future = pending.popleft()
+            yield ifile_done, future.result()
+
+
+def get_spotify_history(
+    inputdir, drop_pii=False, n_jobs=None, cache_dir=None, metrics=None
+):
+    """
+    Loads the .json files containing your Spotify streaming history and
+    converts them to a single pandas dataframe. Files are parsed in
+    parallel and with explicit types (see `apply_history_dtypes(df)`).
+    With `cache_dir`, only new or changed files are parsed and the others
+    are loaded from a columnar cache (see `HistoryCache`)
+
+    Parameters
+    ----------
+    inputdir : str
+        The path to the input directory where your Spotify streaming
+        history json files are stored
+    drop_pii : bool, default False
+        Whether to drop the columns with personally identifiable information
+    n_jobs : int, default None
+        Number of worker processes. Uses the number of CPUs if not provided
+    cache_dir : str, default None
+        The path to the directory of the columnar cache. No cache is used
+        if not provided
+    metrics : Metrics, default None
+        Metrics of the parsed files, bytes and rows (see
+        `load_history_files()`)
+
+    Return
+    ------
+    pandas.Series
+        Full Spotify streaming history
+    """
 
-    # Convert json files to pandas dataframes
-    df_array = []
-    for ifile in input_file:
-        df_array.append(pd.read_json(ifile))
+    if cache_dir is not None:
+        cache = HistoryCache(cache_dir, drop_pii)
+        cache.update(inputdir, n_jobs, metrics)
+        return cache.load()
 
     # Merge into single pandas dataframe
-    df = pd.concat(df_array, ignore_index=True)
+    return concat_history(
+        list(iter_spotify_history(inputdir, None, drop_pii, n_jobs, metrics))
+    )
 
-    return df
 
+class HistoryCache:
+    """
+    Columnar cache of the normalised streaming history, with one Feather
+    (or Parquet) file per source file. Source files are keyed by their
+    path, size and modification time (and optionally their content hash),
+    such that only new or changed files are parsed again. Feather files
+    are memory-mapped when loaded.
+
+    Attributes
+    ----------
+    cache_dir : str
+        The path to the directory of the cache
+    drop_pii : bool, default False
+        Whether the columns with personally identifiable information are
+        dropped. Changing this invalidates the cache
+    use_hash : bool, default False
+        Whether files of which only the modification time changed are
+        compared by their content hash, instead of being parsed again
+    file_format : str, default 'feather'
+        Format of the cached files: 'feather' (memory-mapped) or 'parquet'
+    manifest : dict
+        Dictionary describing the cached source files
+    """
+
+    def __init__(
+        self, cache_dir, drop_pii=False, use_hash=False, file_format="feather"
+    ):
+        self.cache_dir = cache_dir
+        self.drop_pii = drop_pii
+        self.use_hash = use_hash
+        self.file_format = file_format
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = {"drop_pii": drop_pii, "format": file_format, "files": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest["drop_pii"] == drop_pii and manifest["format"] == file_format:
+                self.manifest = manifest
+
+    @property
+    def manifest_path(self):
+        """
+        The path to the manifest of the cache
+        """
+
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    @staticmethod
+    def get_file_hash(ifile):
+        """
+        Content hash of a source file
+
+        Parameters
+        ----------
+        ifile : str
+            The path to the file
+
+        Return
+        ------
+        str
+            SHA-256 hash of the content of the file
+        """
+
+        sha = hashlib.sha256()
+        with open(ifile, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def is_cached(self, ifile):
+        """
+        Whether the cached version of a source file is up-to-date
+
+        Parameters
+        ----------
+        ifile : str
+            The path to the source file
+
+        Return
+        ------
+        bool
+            True if the file did not change since it was cached
+        """
+
+        entry = self.manifest["files"].get(os.path.abspath(ifile))
+        if entry is None or not os.path.exists(
+            os.path.join(self.cache_dir, entry["part"])
+        ):
+            return False
+
+        stat = os.stat(ifile)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if self.use_hash and self.get_file_hash(ifile) == entry.get("sha256"):
+            entry["mtime_ns"] = stat.st_mtime_ns
+            return True
+        return False
+
+    def update(self, inputdir, n_jobs=None, metrics=None):
+        """
+        Parse the new and changed streaming history files into the cache,
+        and remove the files that no longer exist
+
+        Parameters
+        ----------
+        inputdir : str
+            The path to the input directory where your Spotify streaming
+            history json files are stored
+        n_jobs : int, default None
+            Number of worker processes. Uses the number of CPUs if not provided
+        metrics : Metrics, default None
+            Metrics of the parsed files, bytes and rows (see
+            `load_history_files()`)
+
+        Return
+        ------
+        list of str
+            List with the paths of the files that were (re)parsed
+        """
+
+        input_file = find_history_files(inputdir)
+        changed = [ifile for ifile in input_file if not self.is_cached(ifile)]
+
+        for ifile, df in load_history_files(changed, self.drop_pii, n_jobs, metrics):
+            path = os.path.abspath(ifile)
+            part = (
+                hashlib.sha1(path.encode("utf-8")).hexdigest() + "." + self.file_format
+            )
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.file_format == "parquet":
+                pq.write_table(table, os.path.join(self.cache_dir, part))
+            else:
+                feather.write_feather(
+                    table,
+                    os.path.join(self.cache_dir, part),
+                    compression="uncompressed",
+                )
+
+            stat = os.stat(ifile)
+            self.manifest["files"][path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": self.get_file_hash(ifile) if self.use_hash else None,
+                "part": part,
+            }
+
+        # Remove the files that no longer exist in the input directory
+        existing = {os.path.abspath(ifile) for ifile in input_file}
+        for path in [path for path in self.manifest["files"] if path not in existing]:
+            part = os.path.join(
+                self.cache_dir, self.manifest["files"].pop(path)["part"]
+            )
+            if os.path.exists(part):
+                os.remove(part)
+
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=1)
+        return changed
+
+    def load_table(self):
+        """
+        Load the cached streaming history as Arrow table. Feather files are
+        memory-mapped
+
+        Return
+        ------
+        pyarrow.Table
+            Full Spotify streaming history, ordered by source file
+        """
+
+        tables = []
+        for path in sorted(self.manifest["files"]):
+            part = os.path.join(self.cache_dir, self.manifest["files"][path]["part"])
+            if self.file_format == "parquet":
+                tables.append(pq.read_table(part, memory_map=True))
+            else:
+                tables.append(feather.read_table(part, memory_map=True))
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    def load(self):
+        """
+        Load the cached streaming history as pandas dataframe
+
+        Return
+        ------
+        pandas.DataFrame
+            Full Spotify streaming history, ordered by source file
+        """
+
+        return self.load_table().to_pandas()
+
+
+def factorize_track_uri(uri):
+    """
+    Extract the track uri's without prefix (`spotify:track:`) as categorical.
+    The uri's are only split once per unique value
+
+    Parameters
+    ----------
+    uri : pandas.Series
+        Series with the `spotify_track_uri` of the plays
+
+    Return
+    ------
+    pandas.Categorical
+        Track uri's without prefix, null for non-tracks (e.g. podcasts)
+    """
+
+    uri = uri.astype("category")
+    track_uri = uri.cat.categories.str.split(":").str[2]
+    remap, categories = pd.factorize(track_uri)
 
-def modify_columns_spotify_history(df):
+    codes = uri.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def combine_categoricals(first, second, sep=" : "):
+    """
+    Combine two columns into a categorical key (e.g. artist + track). The
+    strings of the key are only built once per unique combination
+
+    Parameters
+    ----------
+    first : pandas.Series
+        First column of the key
+    second : pandas.Series
+        Second column of the key
+    sep : str, default ' : '
+        Separator between the values of both columns
+
+    Return
+    ------
+    pandas.Categorical
+        Combined key, null if one of both values is null
+    """
+
+    first = first.astype("category")
+    second = second.astype("category")
+    first_codes = first.cat.codes.to_numpy().astype(np.int64)
+    second_codes = second.cat.codes.to_numpy().astype(np.int64)
+    valid = (first_codes >= 0) & (second_codes >= 0)
+
+    # Integer key of every (first, second) combination
+    n_second = len(second.cat.categories)
+    pairs, unique_pairs = pd.factorize(
+        first_codes[valid] * n_second + second_codes[valid]
+    )
+    names = (
+        first.cat.categories.take(unique_pairs // n_second).astype(str)
+        + sep
+        + second.cat.categories.take(unique_pairs % n_second).astype(str)
+    )
+    remap, categories = pd.factorize(names)
+
+    codes = np.full(len(first), -1, dtype=np.int64)
+    codes[valid] = remap[pairs]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def modify_columns_spotify_history(df, compact=False, metrics=None):
     """
     Modifies some of the default names of the Spotify streaming history
     Includes a unique track ID column (consisting out of artist and track)
     Stores the single uri in a separate column
 
+    Parameters
+    ----------
+    df : pandas.Series
+        Pandas dataframe containing the full Spotify streaming history as
+        loaded by `get_spotify_history(inputdir)`
+    compact : bool, default False
+        Whether artist, track, album, uri's and the unique track ID are stored
+        as categoricals. Strings are then only processed once per unique
+        value, and the non-tracks are removed before adding columns
+    metrics : Metrics, default None
+        Metrics to which the number of rows normalized (and rows per second)
+        are added. No metrics are recorded if not provided
+
+    Return
+    ------
+    pandas.Series
+        Updated Pandas dataframe with Spotify streaming history
+    """
+
+    start, n_rows = time.perf_counter(), len(df)
+    if compact:
+        df = modify_columns_compact(df)
+    else:
+        # Remove some prefixes for easier naming
+        df.columns = df.columns.str.replace("master_metadata_album_", "")
+        df.columns = df.columns.str.replace("master_metadata_", "")
+
+        # Define unique track ID (artist + track)
+        df["unique_tr"] = df["artist_name"] + " : " + df["track_name"]
+
+        # Store track_uri without prefix
+        df["track_uri"] = df["spotify_track_uri"].str.split(":", expand=True)[2]
+
+        # Remove the non-tracks from history (e.g. podcasts)
+        df = df.loc[df["track_uri"].notnull()]
+
+    if metrics is not None:
+        record_rows(metrics, "normalize", n_rows, time.perf_counter() - start)
+    return df
+
+
+def modify_columns_compact(df):
+    """
+    Memory-compact version of `modify_columns_spotify_history(df)`, which
+    stores artist, track, album, uri's and the unique track ID as
+    categoricals
+
     Parameters
     ----------
     df : pandas.Series
@@ -58,16 +658,27 @@ def modify_columns_spotify_history(df):
     """
 
     # Remove some prefixes for easier naming
-    df.columns = df.columns.str.replace("master_metadata_album_", "")
-    df.columns = df.columns.str.replace("master_metadata_", "")
+    df = df.rename(
+        columns=lambda col: col.replace("master_metadata_album_", "").replace(
+            "master_metadata_", ""
+        )
+    )
 
-    # Define unique track ID (artist + track)
-    df["unique_tr"] = df["artist_name"] + " : " + df["track_name"]
+    # Remove the non-tracks from history (e.g. podcasts), before new columns
+    # are added, such that the dataframe is only copied once
+    track_uri = factorize_track_uri(df["spotify_track_uri"])
+    is_track = track_uri.codes >= 0
+    if not is_track.all():
+        df = df.loc[is_track]
+        track_uri = track_uri[is_track]
 
-    # Store track_uri without prefix
-    df["track_uri"] = df["spotify_track_uri"].str.split(":", expand=True)[2]
+    categories = ["artist_name", "track_name", "album_name", "spotify_track_uri"]
+    df = df.astype({col: "category" for col in categories if col in df.columns})
 
-    # Remove the non-tracks from history (e.g. podcasts)
-    df = df.loc[df["track_uri"].notnull()]
+    # Define unique track ID (artist + track), only built per unique pair
+    df["unique_tr"] = combine_categoricals(df["artist_name"], df["track_name"])
+
+    # Store track_uri without prefix
+    df["track_uri"] = track_uri
 
     return df
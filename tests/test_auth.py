@@ -0,0 +1,132 @@
+"""
+Module used to test the shared session with automatic token refresh
+"""
+
+import time
+import pytest
+import requests
+from spotify_analysis.auth import SpotifySession
+from spotify_analysis.ratelimit import RateLimiter, RetryPolicy
+from spotify_analysis.spotify import Spotify
+
+
+# pylint: disable=too-few-public-methods
+class FakeResponse:
+    """
+    Minimal stand-in for `requests.Response`
+    """
+
+    def __init__(self, data, status_code=200, text=""):
+        self.data = data
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        """
+        Return the json content of the response
+        """
+
+        return self.data
+
+
+def test_spotify_session(monkeypatch):
+    """
+    Testing the refresh of the access token shared by multiple clients
+    """
+
+    tokens = []
+
+    # pylint: disable=unused-argument
+    def fake_post(self, url, data, timeout):
+        tokens.append(f"token_{len(tokens)}")
+        return FakeResponse({"access_token": tokens[-1], "expires_in": 3600})
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    session = SpotifySession(cred={"CLIENT_ID": "id", "CLIENT_SECRET": "secret"})
+    spotify_track = Spotify(reference="tracks", session=session)
+    spotify_artist = Spotify(reference="artists", session=session)
+    assert spotify_artist.rate_limiter is spotify_track.rate_limiter
+
+    # Token is requested on first use and reused afterwards
+    assert session.get_headers() == {"Authorization": "Bearer token_0"}
+    assert spotify_artist.headers == spotify_track.headers
+    assert len(tokens) == 1
+
+    # Token is refreshed shortly before it expires
+    session.expires_at = time.time() + 30
+    assert session.get_headers() == {"Authorization": "Bearer token_1"}
+
+    # Rejected tokens are only invalidated once
+    session.invalidate_token("token_0")
+    assert not session.needs_refresh()
+    session.invalidate_token("token_1")
+    assert spotify_track.access_token == "token_1"
+    assert session.get_headers() == {"Authorization": "Bearer token_2"}
+
+    # Tokens set by hand (without credentials) are never refreshed
+    manual = SpotifySession()
+    manual.expires_at = time.time() - 1
+    manual.access_token = "manual"
+    assert manual.expires_at is None
+    assert not manual.needs_refresh()
+    assert manual.get_headers() == {"Authorization": "Bearer manual"}
+
+
+def test_spotify_refreshes_rejected_token(monkeypatch):
+    """
+    Testing that a request rejected because of the token is retried with
+    a refreshed token
+    """
+
+    fname = "./tests/Spotify_Response_Sample_Track.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        response = f.read()
+
+    # pylint: disable=unused-argument
+    def fake_post(self, url, data, timeout):
+        return FakeResponse({"access_token": "new", "expires_in": 3600})
+
+    def fake_get(self, url, headers, timeout):
+        if headers["Authorization"] == "Bearer old":
+            return FakeResponse({}, 401)
+        return FakeResponse({}, 200, response)
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    monkeypatch.setattr("requests.Session.get", fake_get)
+    session = SpotifySession(cred={"CLIENT_ID": "id", "CLIENT_SECRET": "secret"})
+    session.access_token = "old"
+    spotify_api = Spotify(reference="tracks", session=session)
+    assert spotify_api.access_spotify_api(["2up3OPMp9Tb4dAKM2erWXQ"], ["name"])
+    assert spotify_api.access_token == "new"
+
+
+def test_failed_token_request(monkeypatch):
+    """
+    Testing that failed token requests are retried when transient, and
+    otherwise raise an error with the response
+    """
+
+    responses = [
+        requests.ConnectionError("connection reset"),
+        FakeResponse({}, 503, "Service unavailable"),
+        FakeResponse({"access_token": "token", "expires_in": 3600}),
+        FakeResponse({}, 400, '{"error": "invalid_client"}'),
+    ]
+
+    # pylint: disable=unused-argument
+    def fake_post(self, url, data, timeout):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    limiter = RateLimiter(retry=RetryPolicy(backoff_base=0.01))
+    cred = {"CLIENT_ID": "id", "CLIENT_SECRET": "secret"}
+    session = SpotifySession(cred=cred, rate_limiter=limiter)
+    assert session.get_headers() == {"Authorization": "Bearer token"}
+
+    with pytest.raises(RuntimeError, match="status 400.*invalid_client"):
+        session.get_spotify_access_token()
+    assert not responses
@@ -0,0 +1,75 @@
+"""
+Module used to test the batch processing of the exports of many users
+"""
+
+import json
+import os
+import pytest
+from spotify_analysis.batch import get_jobs, run_batch
+from spotify_analysis.export import read_export
+from spotify_analysis.pipeline import EnrichmentPipeline
+from spotify_analysis.spotify import Spotify
+from tests.test_pipeline import make_fake_request
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    """
+    Testing that tracks shared by users are only accessed once
+    """
+
+    fname = "./tests/Streaming_History_Audio_Example.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        template = json.load(f)[0]
+
+    # Every export has the same directory name
+    inputdirs = []
+    for user, tracks in enumerate([range(0, 60), range(30, 90), range(0, 90)]):
+        inputdir = tmp_path / f"user_{user}" / "my_spotify_data"
+        inputdir.mkdir(parents=True)
+        plays = [
+            dict(
+                template,
+                master_metadata_track_name=f"track_{i}",
+                spotify_track_uri=f"spotify:track:tr_{i}",
+            )
+            for i in tracks
+        ]
+        path = inputdir / "Streaming_History_Audio_2023.json"
+        path.write_text(json.dumps(plays), encoding="utf-8")
+        inputdirs.append(str(inputdir))
+    jobs = get_jobs(inputdirs, str(tmp_path / "output"))
+    assert [os.path.basename(path) for path in jobs.values()] == [
+        f"{user}_my_spotify_data" for user in range(3)
+    ]
+
+    urls = []
+    monkeypatch.setattr(Spotify, "make_request", make_fake_request(urls))
+    pipeline = EnrichmentPipeline(["name"], ["name", "popularity"])
+    with pytest.raises(ValueError):
+        run_batch(dict.fromkeys(inputdirs, str(tmp_path / "output")), pipeline)
+    result = run_batch(jobs, pipeline, n_jobs=2)
+
+    assert result == {"users": 3, "uris": 210, "unique_uris": 90}
+    # 2 track requests (50 + 40 uri's) and 1 artist request
+    assert len(urls) == 3
+
+    outputdir = jobs[inputdirs[0]]
+    df_track = read_export(os.path.join(outputdir, "TrackMetadataTable.parquet"))
+    assert len(df_track) == 60
+    df_artist = read_export(os.path.join(outputdir, "ArtistMetadataTable.parquet"))
+    assert len(df_artist) == 5
+    df_songs = read_export(os.path.join(outputdir, "MySpotifyDataTable.parquet"))
+    assert len(df_songs) == 60 and df_songs["c_unique_tr"].iloc[0] == 1
+
+    # CSV is kept as explicit format
+    run_batch(jobs, pipeline, n_jobs=1, file_format="csv")
+    df_songs = read_export(os.path.join(outputdir, "MySpotifyDataTable.csv"))
+    assert len(df_songs) == 60
+
+    # Users of a batch of which the metadata is incomplete get no tables
+    jobs = get_jobs(inputdirs, str(tmp_path / "failed"))
+    monkeypatch.setattr(pipeline, "run", lambda uri_list: False)
+    with pytest.raises(RuntimeError):
+        run_batch(jobs, pipeline, n_jobs=1)
+    outputdir = jobs[inputdirs[0]]
+    assert not os.path.exists(os.path.join(outputdir, "TrackMetadataTable.parquet"))
@@ -0,0 +1,73 @@
+"""
+Module used to test the benchmarks of the fetch paths and of the pipeline
+"""
+
+import json
+from spotify_analysis.benchmark import (
+    FETCH_MODES,
+    STAGE_METRICS,
+    check_regression,
+    load_baseline,
+    main,
+)
+
+
+def test_fetch_benchmark(tmp_path):
+    """
+    Testing the benchmark of every fetch mode and the regression check
+    """
+
+    output = str(tmp_path / "results.jsonl")
+    argv = ["fetch", "--items", "300", "--latency", "0", "--jitter", "0"]
+    assert main(argv + ["--client-rate", "1000", "--results", output]) == 0
+    with open(output, "r", encoding="utf-8") as file:
+        record = json.loads(file.readline())
+    results = record["results"]
+
+    assert record["benchmark"] == "fetch" and record["params"]["items"] == 300
+    assert sorted(results) == sorted(FETCH_MODES)
+    for result in results.values():
+        assert result["success"] and result["requests"] == 6
+        assert result["items_per_s"] > result["requests_per_s"] > 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+    assert not check_regression(results, results)
+    slower = {
+        mode: dict(result, items_per_s=0.5 * result["items_per_s"])
+        for mode, result in results.items()
+    }
+    regressions = check_regression(slower, results, tolerance=0.2)
+    assert len(regressions) == len(FETCH_MODES)
+    assert all("items_per_s" in regression for regression in regressions)
+
+
+def test_pipeline_benchmark(tmp_path):
+    """
+    Testing the benchmark of the pipeline stages on a synthetic history, and
+    the comparison with the previous run
+    """
+
+    output = str(tmp_path / "results.jsonl")
+    argv = ["pipeline", "--plays", "3000", "--jobs", "1", "--results", output]
+    assert main(argv + ["--label", "first"]) == 0
+    assert main(argv + ["--compare", "--tolerance", "100"]) == 0
+    assert main(argv[:2] + ["2000"] + argv[3:]) == 0
+
+    assert load_baseline(output, "pipeline", {}) is None
+    with open(output, "r", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [record["label"] for record in records] == ["first", "", ""]
+
+    params = records[0]["params"]
+    assert load_baseline(output, "pipeline", params) == records[1]
+    stages = records[0]["results"]
+    assert list(stages) == ["load", "modify", "aggregate", "sort", "export"]
+    assert stages["load"]["rows"] == 3000
+    for stage in stages.values():
+        assert stage["seconds"] > 0 and stage["peak_rss_mb"] >= stage["rss_mb"] > 0
+
+    slower = {
+        name: dict(stage, seconds=10 * stage["seconds"])
+        for name, stage in stages.items()
+    }
+    assert len(check_regression(slower, stages, metrics=STAGE_METRICS)) == 5
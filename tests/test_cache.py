@@ -0,0 +1,113 @@
+"""
+Module used to test the persistent metadata cache
+"""
+
+import json
+from spotify_analysis.cache import MetadataCache
+from spotify_analysis.spotify import Spotify
+
+
+# pylint: disable=too-few-public-methods
+class FakeResponse:
+    """
+    Minimal stand-in for `requests.Response`
+    """
+
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.headers = {}
+
+
+def test_metadata_cache(tmp_path):
+    """
+    Testing storing, expiring and evicting entries of the metadata cache
+    """
+
+    metadata = ["name", "duration_ms"]
+    path = str(tmp_path / "cache.sqlite")
+    with MetadataCache(path, max_entries=2) as cache:
+        cache.put("tracks", "uri_1", metadata, {"name": "a", "duration_ms": 1})
+        cache.put("tracks", "uri_2", metadata, {"name": "b", "duration_ms": 2})
+        assert cache.get("tracks", "uri_1", metadata)["name"] == "a"
+        assert cache.get("tracks", "uri_1", ["name"]) is None
+        assert cache.get("artists", "uri_1", metadata) is None
+
+        # uri_2 is least recently used and should be evicted
+        cache.put("tracks", "uri_3", metadata, {"name": "c", "duration_ms": 3})
+        assert len(cache) == 2
+        assert cache.get("tracks", "uri_2", metadata) is None
+
+        # Entries with a negative time-to-live are expired immediately
+        cache.put("tracks", "uri_4", metadata, {"name": "d"}, ttl=-1)
+        assert cache.get("tracks", "uri_4", metadata) is None
+        assert cache.purge_expired() == 1
+        assert cache.hits == 1 and cache.misses == 4
+
+    # An explicit time-to-live of None never expires, also with a default
+    with MetadataCache(":memory:", ttl=-1) as cache:
+        cache.put("tracks", "uri_1", metadata, {"name": "a"})
+        cache.put("tracks", "uri_2", metadata, {"name": "b"}, ttl=None)
+        cache.put_missing("tracks", ["uri_3"], metadata, ttl=None)
+        assert cache.get_many("tracks", ["uri_1", "uri_2", "uri_3"], metadata) == {
+            "uri_2": {"name": "b"},
+            "uri_3": None,
+        }
+        assert cache.purge_expired() == 1
+
+    # Cache should persist on disk
+    with MetadataCache(path) as cache:
+        assert cache.get_many("tracks", ["uri_1", "uri_3"], metadata).keys() == {
+            "uri_3"
+        }
+
+
+def test_spotify_uses_cache(monkeypatch):
+    """
+    Testing that cached uri's are not requested again from the Spotify API
+    """
+
+    metadata = ["name"]
+    cache = MetadataCache(":memory:")
+    cache.put_many("tracks", {"uri_1": {"name": "a"}, "uri_2": {"name": "b"}}, metadata)
+
+    def no_request(*args, **kwargs):
+        raise AssertionError("Cached uri's should not be requested")
+
+    monkeypatch.setattr("requests.Session.get", no_request)
+    spotify_api = Spotify(reference="tracks", cache=cache)
+    spotify_api.access_spotify_api(["uri_1", "uri_2"], metadata)
+    assert spotify_api.metadata == {"uri_1": {"name": "a"}, "uri_2": {"name": "b"}}
+    assert cache.stats()["hit_rate"] == 1.0
+
+
+def test_spotify_caches_unknown_uris(monkeypatch):
+    """
+    Testing that uri's which Spotify returns as null are cached as
+    tombstones, and only requested again once the tombstone expired
+    """
+
+    urls = []
+
+    # pylint: disable=unused-argument
+    def fake_get(self, url, headers, timeout):
+        urls.append(url)
+        if "?ids=" in url:
+            return FakeResponse(json.dumps({"tracks": [{"name": "a"}, None]}))
+        return FakeResponse("null")
+
+    monkeypatch.setattr("requests.Session.get", fake_get)
+    metadata = ["name"]
+    cache = MetadataCache(":memory:")
+    for _ in range(2):
+        spotify_api = Spotify(reference="tracks", cache=cache)
+        assert spotify_api.access_spotify_api(["uri_1", "uri_2"], metadata)
+        assert spotify_api.metadata == {"uri_1": {"name": "a"}}
+    assert len(urls) == 1
+    assert cache.get_many("tracks", ["uri_2"], metadata) == {"uri_2": None}
+
+    # Expired tombstones are requested again
+    cache.put_missing("tracks", ["uri_2"], metadata, ttl=-1)
+    spotify_api = Spotify(reference="tracks", cache=cache)
+    assert spotify_api.access_spotify_api(["uri_1", "uri_2"], metadata)
+    assert len(urls) == 2 and urls[-1].endswith("tracks/uri_2")
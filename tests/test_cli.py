@@ -0,0 +1,131 @@
+"""
+Module used to test the staged command line interface
+"""
+
+import json
+import os
+import shutil
+import pytest
+from spotify_analysis.cli import get_downstream, main
+from spotify_analysis.export import read_export
+from spotify_analysis.spotify import Spotify
+from tests.test_pipeline import make_fake_request
+
+
+def test_staged_run(tmp_path, monkeypatch):
+    """
+    Testing that stages only rerun when their inputs changed
+    """
+
+    urls = []
+    monkeypatch.setattr(Spotify, "make_request", make_fake_request(urls))
+
+    fname = "./tests/Streaming_History_Audio_Example.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        template = json.load(f)[0]
+    inputdir, outputdir = tmp_path / "input", str(tmp_path / "output")
+    inputdir.mkdir()
+
+    def write_export(year, tracks):
+        plays = [
+            dict(
+                template,
+                ts=f"{year}-01-01T12:{i:02d}:00Z",
+                spotify_track_uri=f"spotify:track:tr_{i}",
+            )
+            for i in tracks
+        ]
+        path = inputdir / f"Streaming_History_Audio_{year}.json"
+        path.write_text(json.dumps(plays), encoding="utf-8")
+
+    write_export(2022, range(10))
+    secret = tmp_path / "spotify_secret.yaml"
+    secret.write_text("CLIENT_ID: id\nCLIENT_SECRET: secret\n", encoding="utf-8")
+    args = [str(inputdir), outputdir, "--jobs", "1", "--secret", str(secret)]
+    assert sorted(main(args)) == sorted(get_downstream("ingest"))
+    assert len(urls) == 2
+    df_songs = read_export(
+        os.path.join(outputdir, "export", "MySpotifyDataTable.parquet")
+    )
+    assert len(df_songs) == 10
+
+    # Nothing changed, so every stage is skipped
+    assert not main(args)
+
+    # A new export overlapping the previous one reruns everything
+    urls.clear()
+    write_export(2023, range(5, 15))
+    assert len(main(args)) == 6
+    # Only the new tracks are accessed, the artists are in the cache
+    assert len(urls) == 1 and urls[0].count("%2C") == 4
+    df_songs = read_export(
+        os.path.join(outputdir, "export", "MySpotifyDataTable.parquet")
+    )
+    assert len(df_songs) == 20
+
+    # Only the affected stages rerun, also when selected explicitly
+    shutil.rmtree(os.path.join(outputdir, "stats"))
+    assert main(args) == ["aggregate"]
+    assert not main(args + ["--only", "aggregate"])
+    assert main(args + ["--only", "aggregate", "--force"]) == ["aggregate"]
+    assert main(args + ["--from", "enrich-artists", "--force"]) == [
+        "enrich-artists",
+        "export",
+    ]
+    # Changing the export format only reruns the export
+    assert main(args + ["--format", "csv"]) == ["export"]
+    df_songs = read_export(os.path.join(outputdir, "export", "MySpotifyDataTable.csv"))
+    assert len(df_songs) == 20
+
+    # The metrics are written after every stage
+    metrics = str(tmp_path / "metrics.prom")
+    assert main(args + ["--only", "normalize", "--force", "--metrics", metrics])
+    with open(metrics, "r", encoding="utf-8") as file:
+        text = file.read()
+    assert 'pipeline_stage_seconds_count{stage="normalize"} 1' in text
+    assert 'history_rows_total{stage="normalize"}' in text
+
+    assert get_downstream("normalize") == [
+        "normalize",
+        "enrich-tracks",
+        "enrich-artists",
+        "aggregate",
+        "export",
+    ]
+
+
+def test_failed_fetch(tmp_path, monkeypatch):
+    """
+    Testing that enrich stages are not recorded as done when credentials are
+    missing or when requests fail, such that they rerun next time
+    """
+
+    inputdir, outputdir = tmp_path / "input", str(tmp_path / "output")
+    inputdir.mkdir()
+    shutil.copy(
+        "./tests/Streaming_History_Audio_Example.json",
+        inputdir / "Streaming_History_Audio_2022.json",
+    )
+    secret = tmp_path / "spotify_secret.yaml"
+    args = [str(inputdir), outputdir, "--jobs", "1", "--secret", str(secret)]
+    with pytest.raises(FileNotFoundError):
+        main(args)
+
+    # pylint: disable=unused-argument
+    async def rejected_request(self, client, semaphore, url):
+        return {"response": "The access token expired", "status": 401, "url": url}
+
+    secret.write_text("CLIENT_ID: id\nCLIENT_SECRET: secret\n", encoding="utf-8")
+    monkeypatch.setattr(Spotify, "make_request", rejected_request)
+    with pytest.raises(RuntimeError):
+        main(args)
+
+    urls = []
+    monkeypatch.setattr(Spotify, "make_request", make_fake_request(urls))
+    executed = main(args)
+    assert executed[:2] == ["enrich-tracks", "enrich-artists"] and "export" in executed
+    assert len(urls) == 2
+    df_songs = read_export(
+        os.path.join(outputdir, "export", "MySpotifyDataTable.parquet")
+    )
+    assert len(df_songs) == 3
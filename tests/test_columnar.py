@@ -0,0 +1,84 @@
+"""
+Module used to test the columnar metadata store
+"""
+
+import json
+import pandas as pd
+from spotify_analysis.columnar import ColumnarStore
+
+
+def test_columnar_store():
+    """
+    Testing typed columns, interning and conversion of the columnar store
+    """
+
+    store = ColumnarStore()
+    store["uri_1"] = {"name": "a", "explicit": True, "popularity": 10}
+    store["uri_2"] = {"name": "a", "explicit": None, "popularity": None}
+    store["uri_3"] = {"name": "b", "genres": ["rock", "pop"], "popularity": 2.5}
+    store.update({"uri_4": {"name": None, "explicit": False, "popularity": 1}})
+
+    assert len(store) == 4 and "uri_3" in store
+    assert store["uri_1"] == {
+        "name": "a",
+        "explicit": True,
+        "popularity": 10,
+        "genres": None,
+    }
+    assert store["uri_3"]["genres"] == ["rock", "pop"]
+    assert store.columns["name"].kind == "str"
+    assert store.columns["popularity"].kind == "float"
+
+    df = store.to_pandas("track_uri")
+    assert list(df.columns) == ["track_uri", "name", "explicit", "popularity", "genres"]
+    assert isinstance(df["name"].dtype, pd.CategoricalDtype)
+    assert list(df["name"].cat.categories) == ["a", "b"]
+    assert df["explicit"].dtype == "boolean"
+    assert df["popularity"].isna().tolist() == [False, True, False, False]
+
+    # Modifications after the conversion do not change the dataframe
+    store["uri_1"] = {"name": "c", "explicit": False, "popularity": 3}
+    store["uri_5"] = {"name": "a"}
+    assert df["name"].iloc[0] == "a" and len(df) == 4
+    assert store["uri_1"]["name"] == "c"
+
+    table = store.to_arrow("track_uri")
+    assert table.num_rows == 5
+    assert table.column("name").to_pylist() == ["c", "a", "b", None, "a"]
+
+    # Merging an earlier table keeps the uri's already in the store
+    merged = ColumnarStore()
+    merged["uri_1"] = {"name": "d"}
+    merged.merge(df, key="track_uri")
+    assert len(merged) == 4 and merged["uri_1"]["name"] == "d"
+    assert merged["uri_2"]["popularity"] is None
+
+
+def test_merge_keeps_types():
+    """
+    Testing that merged metadata keeps typed columns and stays serializable
+    """
+
+    store = ColumnarStore()
+    store["uri_1"] = {"name": "a", "pop": 10, "explicit": True, "dur": 1.5}
+    store["uri_2"] = {"name": "b", "pop": None, "explicit": None, "genres": ["x"]}
+    table = store.to_arrow("track_uri")
+
+    merged = ColumnarStore()
+    merged.merge(store.to_pandas("track_uri"), key="track_uri")
+    kinds = {name: column.kind for name, column in merged.columns.items()}
+    assert kinds == {
+        "name": "str",
+        "pop": "int",
+        "explicit": "bool",
+        "dur": "float",
+        "genres": "object",
+    }
+    items = {uri: merged[uri] for uri in merged}
+    assert json.loads(json.dumps(items)) == {uri: store[uri] for uri in store}
+
+    # Lists read from Arrow (numpy arrays) are merged as lists
+    merged = ColumnarStore()
+    merged.merge(table.to_pandas(), key="track_uri")
+    assert merged["uri_2"]["genres"] == ["x"]
+    assert json.loads(json.dumps(merged["uri_2"]))["genres"] == ["x"]
@@ -0,0 +1,58 @@
+"""
+Module used to test the columnar, partitioned and chunked exports
+"""
+
+import pandas as pd
+import pyarrow.compute as pc
+from spotify_analysis.export import (
+    export_plays,
+    export_table,
+    read_export,
+    write_csv_chunked,
+)
+from spotify_analysis.utils import modify_columns_spotify_history
+
+
+def test_exports(tmp_path):
+    """
+    Testing that exports keep types and partition the plays by month
+    """
+
+    df = pd.DataFrame(
+        {
+            "ts": pd.to_datetime(
+                ["2022-12-31T23:00:00Z", "2023-01-02T10:00:00Z", "2023-02-01T09:00:00Z"]
+            ),
+            "ms_played": [60000, 120000, 30000],
+            "master_metadata_track_name": ["t1", "t2", "t1"],
+            "master_metadata_album_artist_name": ["a1", "a2", "a1"],
+            "spotify_track_uri": ["spotify:track:1", "spotify:track:2", None],
+            "skipped": pd.array([True, None, False], dtype="boolean"),
+        }
+    )
+    df = modify_columns_spotify_history(df, compact=True)
+    df_meta = pd.DataFrame({"artist_uri": ["a1"], "genres": [["pop", "rock"]]})
+
+    for file_format in ["parquet", "feather"]:
+        path = export_plays(df, str(tmp_path), "plays", file_format)
+        df_read = read_export(path)
+        assert df_read.equals(df.reset_index(drop=True))
+
+        path = export_plays(df, str(tmp_path), "plays", file_format, partition=True)
+        assert sorted(p.name for p in (tmp_path / "plays").iterdir()) == [
+            "year=2022",
+            "year=2023",
+        ]
+        df_read = read_export(path)
+        assert len(df_read) == 2 and df_read["month"].tolist() == [12, 1]
+        assert isinstance(df_read["ts"].dtype, pd.DatetimeTZDtype)
+        assert isinstance(df_read["artist_name"].dtype, pd.CategoricalDtype)
+        assert len(read_export(path, filters=pc.field("year") == 2023)) == 1
+
+        path = export_table(df_meta, str(tmp_path), "artists", file_format)
+        assert read_export(path)["genres"].iloc[0].tolist() == ["pop", "rock"]
+
+    path = str(tmp_path / "plays.csv")
+    assert write_csv_chunked([df, df], path, chunksize=1) == 4
+    df_read = read_export(path)
+    assert len(df_read) == 4 and df_read.columns.tolist() == df.columns.tolist()
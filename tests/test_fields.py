@@ -0,0 +1,73 @@
+"""
+Module used to test the compiled field extractor
+"""
+
+import json
+import pytest
+from spotify_analysis.fields import compile_fields, parse_path
+from spotify_analysis.spotify import Spotify
+
+
+def test_field_extractor():
+    """
+    Testing paths of arbitrary depth, fan-out over lists and defaults
+    """
+
+    assert parse_path("album.artists[].id") == [
+        ("key", "album"),
+        ("key", "artists"),
+        ("all", None),
+        ("key", "id"),
+    ]
+    with pytest.raises(ValueError):
+        parse_path("album..id")
+
+    item = {
+        "name": "track",
+        "artists": [{"id": "a1", "name": "x"}, {"id": "a2"}],
+        "album": {"id": "al", "images": [{"url": "u0"}, {"url": "u1"}]},
+    }
+    metadata = [
+        "name",
+        ["artists", "id"],
+        "artist_ids=artists[].id",
+        "artist_names=artists[].name",
+        "album.images[1].url",
+        {"name": "release", "path": "album.release_date", "default": "unknown"},
+    ]
+    extractor = compile_fields(metadata)
+    assert compile_fields(metadata) is extractor
+    assert extractor.extract_batch([item, None]) == [
+        {
+            "name": "track",
+            "id": "a1",
+            "artist_ids": ["a1", "a2"],
+            "artist_names": ["x", None],
+            "url": "u1",
+            "release": "unknown",
+        },
+        None,
+    ]
+
+
+def test_fill_metadata_dictionary_paths():
+    """
+    Testing filling the metadata dictionary with the compiled field spec
+    """
+
+    fname = "./tests/Spotify_Response_Sample_Track.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        output = json.load(f)
+
+    # A single uri can also be given as string
+    spotify_api = Spotify(reference="tracks")
+    metadata = ["name", "artist_ids=artists[].id", "album.images[0].url"]
+    spotify_api.fill_metadata_dictionary(output, "2up3OPMp9Tb4dAKM2erWXQ", metadata)
+    assert spotify_api.metadata["2up3OPMp9Tb4dAKM2erWXQ"]["artist_ids"] == ["string"]
+    assert spotify_api.metadata["2up3OPMp9Tb4dAKM2erWXQ"]["url"].startswith("https")
+
+    # Unknown uri's are null in the response and skipped
+    output = {"tracks": [output, None]}
+    spotify_api = Spotify(reference="tracks")
+    spotify_api.fill_metadata_dictionary(output, ["uri_1", "uri_2"], metadata)
+    assert list(spotify_api.metadata) == ["uri_1"]
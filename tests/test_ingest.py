@@ -0,0 +1,110 @@
+"""
+Module used to test the incremental ingestion of streaming history exports
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from spotify_analysis.ingest import PlayStore, get_play_keys
+
+
+def write_export(exportdir, days, username="user_1"):
+    """
+    Write an export with one play per day
+    """
+
+    fname = "./tests/Streaming_History_Audio_Example.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        template = json.load(f)[0]
+
+    exportdir.mkdir()
+    plays = []
+    for day in days:
+        play = dict(template, username=username, ts=f"2023-01-{day:02d}T12:00:00Z")
+        plays.append(play)
+    path = exportdir / "Streaming_History_Audio_2023.json"
+    path.write_text(json.dumps(plays), encoding="utf-8")
+
+
+def test_incremental_ingestion(tmp_path):
+    """
+    Testing that overlapping exports only add the unseen plays
+    """
+
+    store_dir = str(tmp_path / "store")
+    write_export(tmp_path / "export_1", range(1, 11))
+    write_export(tmp_path / "export_2", range(5, 16))
+    write_export(tmp_path / "export_3", range(1, 4), username="user_2")
+
+    store = PlayStore(store_dir)
+    assert store.ingest(str(tmp_path / "export_1"), n_jobs=1) == 10
+    assert store.ingest(str(tmp_path / "export_1"), n_jobs=1) == 0
+    assert store.ingest(str(tmp_path / "export_2"), n_jobs=1) == 5
+
+    # The state of the store persists
+    store = PlayStore(store_dir)
+    assert store.ingest(str(tmp_path / "export_3"), n_jobs=1) == 3
+    assert len(store) == 18
+    assert store.watermarks["user_1"].day == 15
+    assert store.watermarks["user_2"].day == 3
+    assert sorted(path.name for path in (tmp_path / "store").glob("keys-*")) == [
+        f"keys-0000{number}.npy" for number in range(3)
+    ]
+
+    # Plays after the watermark are added without loading the stored keys
+    hidden = tmp_path / "hidden"
+    hidden.mkdir()
+    for path in (tmp_path / "store").glob("keys-*"):
+        path.rename(hidden / path.name)
+    write_export(tmp_path / "export_4", range(16, 18))
+    store = PlayStore(store_dir)
+    assert store.ingest(str(tmp_path / "export_4"), n_jobs=1) == 2
+    for path in hidden.iterdir():
+        path.rename(tmp_path / "store" / path.name)
+    assert len(store) == 20
+
+    df = store.load()
+    assert len(df) == 20
+    assert not df.duplicated(["username", "ts"]).any()
+
+    # Plays without valid timestamp are also deduplicated
+    store = PlayStore(str(tmp_path / "store_example"))
+    assert store.ingest("./tests/", n_jobs=1) == 3
+    (tmp_path / "copy").mkdir()
+    with open("./tests/Streaming_History_Audio_Example.json", encoding="utf-8") as f:
+        (tmp_path / "copy" / "Streaming_History_Audio_Copy.json").write_text(f.read())
+    assert store.ingest(str(tmp_path / "copy"), n_jobs=1) == 0
+
+
+def test_select_new(tmp_path):
+    """
+    Testing the selection of new plays of multiple accounts, each with its
+    own watermark, against the stored keys
+    """
+
+    df = pd.DataFrame(
+        {
+            "username": ["user_1", "user_1", "user_2", "user_3", "user_1", "user_1"],
+            "ts": pd.to_datetime(
+                ["2023-01-03", "2023-01-07", "2023-01-07", "2023-01-01", None]
+                + ["2023-01-07"],
+                utc=True,
+            ),
+            "ms_played": [1000] * 6,
+        }
+    )
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    watermarks = {"user_1": "2023-01-05T00:00:00+00:00", "user_2": "2023-01-10"}
+    parts = ["plays-00000.feather"]
+    state = {"files": {}, "watermarks": watermarks, "parts": parts}
+    (store_dir / "state.json").write_text(json.dumps(state), encoding="utf-8")
+    np.save(store_dir / "keys-00000.npy", get_play_keys(df.iloc[[0, 4]]))
+
+    # Stored plays and duplicates are skipped, plays after the watermark of
+    # their account (or of an unknown account) are new
+    store = PlayStore(str(store_dir))
+    new, keys = store.select_new(df)
+    assert new["username"].tolist() == ["user_1", "user_2", "user_3"]
+    assert new["ts"].dt.day.tolist() == [7, 7, 1]
+    assert keys.tolist() == get_play_keys(df.iloc[[1, 2, 3]]).tolist()
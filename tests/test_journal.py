@@ -0,0 +1,58 @@
+"""
+Module used to test the checkpoint journal of fetch jobs
+"""
+
+from spotify_analysis.journal import FetchJournal
+from spotify_analysis.spotify import Spotify
+
+
+def test_fetch_journal(tmp_path):
+    """
+    Testing that journaled metadata survives reopening the journal
+    """
+
+    path = str(tmp_path / "journal.jsonl")
+    with FetchJournal(path) as journal:
+        journal.record("tracks", ["name"], {"uri_1": {"name": "a"}})
+        journal.record("tracks", ["name"], {"uri_2": {"name": "b"}})
+        journal.record("artists", ["name"], {"uri_3": {"name": "c"}})
+
+    # Simulate a run that was killed while writing a record
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"reference": "tracks", "fie')
+
+    with FetchJournal(path) as journal:
+        assert len(journal) == 3
+        assert journal.get_completed("tracks", ["name"]).keys() == {"uri_1", "uri_2"}
+        assert not journal.get_completed("tracks", ["popularity"])
+        journal.record("tracks", ["name"], {"uri_4": {"name": "d"}})
+        journal.compact()
+
+    with FetchJournal(path) as journal:
+        assert len(journal.get_completed("tracks", ["name"])) == 3
+    with open(path, "r", encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+
+    journal.discard()
+    assert not (tmp_path / "journal.jsonl").exists()
+
+
+def test_spotify_resumes_from_journal(tmp_path, monkeypatch):
+    """
+    Testing that uri's completed in a previous run are not requested again
+    """
+
+    path = str(tmp_path / "journal.jsonl")
+    with FetchJournal(path) as journal:
+        spotify_api = Spotify(reference="tracks", journal=journal)
+        spotify_api.metadata = {"uri_1": {"name": "a"}}
+        spotify_api.store_cached_metadata(["uri_1"], ["name"])
+
+    def no_request(*args, **kwargs):
+        raise AssertionError("Journaled uri's should not be requested")
+
+    monkeypatch.setattr("requests.Session.get", no_request)
+    with FetchJournal(path) as journal:
+        spotify_api = Spotify(reference="tracks", journal=journal)
+        assert spotify_api.access_spotify_api(["uri_1"], ["name"])
+        assert spotify_api.metadata == {"uri_1": {"name": "a"}}
@@ -0,0 +1,142 @@
+"""
+Module used to test the metrics hooks of the fetch and ingest hot paths
+"""
+
+import json
+from spotify_analysis.cache import MetadataCache
+from spotify_analysis.ingest import PlayStore
+from spotify_analysis.metrics import (
+    Metrics,
+    get_sink,
+    to_prometheus_text,
+)
+from spotify_analysis.mockapi import MockSpotifyAPI
+from spotify_analysis.ratelimit import RateLimiter, RetryPolicy
+from spotify_analysis.spotify import Spotify
+from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
+
+
+def test_metrics_and_sinks(tmp_path):
+    """
+    Testing the counters, gauges, histograms and the JSON lines and
+    Prometheus text sinks
+    """
+
+    jsonl, prom = str(tmp_path / "metrics.jsonl"), str(tmp_path / "metrics.prom")
+    metrics = Metrics([get_sink(jsonl), get_sink(prom)])
+    metrics.inc("requests_total", status="200")
+    metrics.inc("requests_total", 2, status="200")
+    metrics.inc("requests_total", status="429")
+    assert metrics.add_gauge("in_flight", 1) == 1 and metrics.add_gauge("in_flight", 1)
+    metrics.set_gauge("rows_per_second", 10.5, stage="load")
+    for value in [0.001, 0.02, 0.02, 20]:
+        metrics.observe("request_seconds", value)
+    with metrics.timer("stage_seconds", stage="load"):
+        pass
+
+    assert metrics.get("requests_total", status="200") == 3
+    assert metrics.get("in_flight") == 2 and metrics.get("missing") is None
+    histogram = metrics.get("request_seconds")
+    assert histogram["count"] == 4 and abs(histogram["sum"] - 20.041) < 1e-9
+    assert histogram["buckets"]["0.005"] == 1 and histogram["buckets"]["0.025"] == 3
+    assert histogram["buckets"]["10.0"] == 3 and histogram["buckets"]["inf"] == 4
+    assert metrics.get("stage_seconds", stage="load")["count"] == 1
+
+    snapshot = metrics.emit()
+    metrics.emit()
+    with open(jsonl, "r", encoding="utf-8") as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 2 and lines[0]["counters"] == snapshot["counters"]
+
+    with open(prom, "r", encoding="utf-8") as file:
+        text = file.read()
+    assert text == to_prometheus_text(snapshot)
+    assert text.count("# TYPE requests_total counter") == 1
+    assert 'requests_total{status="429"} 1' in text
+    assert 'rows_per_second{stage="load"} 10.5' in text
+    assert 'request_seconds_bucket{le="+Inf"} 4' in text
+    assert "request_seconds_count 4" in text
+
+
+def test_fetch_metrics(tmp_path):
+    """
+    Testing the metrics of the requests to the mock of Spotify web API, of
+    the cache and of the batches, for the requests and aiohttp paths
+    """
+
+    list_uri = [f"tr{i}" for i in range(120)]
+    with MockSpotifyAPI(rate_limit=20, window=0.1, retry_after=0.05) as server:
+        for method in ["access_spotify_api", "access_spotify_api_async"]:
+            server.reset()
+            metrics = Metrics()
+            limiter = RateLimiter(
+                rate=1000, burst=20, retry=RetryPolicy(backoff_base=0.05)
+            )
+            session = server.get_session(rate_limiter=limiter, metrics=metrics)
+            cache = MetadataCache(str(tmp_path / f"{method}.sqlite"))
+            spotify_api = Spotify(reference="tracks", session=session, cache=cache)
+            assert getattr(spotify_api, method)(list_uri[:100], ["name"], n_uri=40)
+            assert getattr(spotify_api, method)(list_uri, ["name"], n_uri=40)
+            session.close()
+
+            stats = server.stats()
+            labels = {"reference": "tracks"}
+            assert metrics.get("spotify_token_refreshes_total") == 1
+            assert metrics.get("spotify_requests_total", status="200", **labels) == 4
+            assert metrics.get("spotify_request_seconds", **labels)["count"] == (
+                stats["requests"]
+            )
+            assert metrics.get("spotify_rate_limited_total", **labels) == (
+                stats["status"].get(429)
+            )
+            assert metrics.get("spotify_retries_total", **labels) == (
+                stats["requests"] - 4
+            )
+            assert metrics.get("spotify_response_bytes_total", **labels) > 0
+            lookups = {
+                result: metrics.get(
+                    "metadata_cache_lookups_total", result=result, **labels
+                )
+                for result in ["hit", "miss"]
+            }
+            assert lookups == {"hit": 100, "miss": 120}
+            fill = metrics.get("spotify_batch_fill_ratio", **labels)
+            assert fill["count"] == 4 and fill["buckets"]["0.25"] == 0
+            assert fill["buckets"]["0.5"] == 2 and fill["buckets"]["0.9"] == 4
+
+    assert metrics.get("spotify_requests_in_flight") == 0
+    assert metrics.get("spotify_requests_concurrency")["count"] == stats["requests"]
+
+
+def test_history_metrics(tmp_path):
+    """
+    Testing the metrics of loading, normalizing and ingesting the history
+    """
+
+    metrics = Metrics()
+    df_songs = get_spotify_history("./tests/", metrics=metrics)
+    modify_columns_spotify_history(df_songs, metrics=metrics)
+    assert metrics.get("history_files_total") == 1
+    assert metrics.get("history_bytes_parsed_total") > 0
+    for stage in ["load", "normalize"]:
+        assert metrics.get("history_rows_total", stage=stage) == 3
+        assert metrics.get("history_stage_seconds", stage=stage)["count"] == 1
+        assert metrics.get("history_rows_per_second", stage=stage) > 0
+
+    # The same plays in a second export are counted as duplicates
+    inputdir = tmp_path / "input"
+    inputdir.mkdir()
+    fname = "./tests/Streaming_History_Audio_Example.json"
+    with open(fname, "r", encoding="utf-8") as file:
+        plays = file.read()
+    for year in [2022, 2023]:
+        path = inputdir / f"Streaming_History_Audio_{year}.json"
+        path.write_text(plays, encoding="utf-8")
+
+    metrics = Metrics()
+    store = PlayStore(str(tmp_path / "store"), metrics=metrics)
+    store.ingest(str(inputdir), n_jobs=1)
+    assert metrics.get("ingest_plays_total", result="new") == 3
+    assert metrics.get("ingest_plays_total", result="duplicate") == 3
+    assert metrics.get("history_rows_total", stage="ingest") == 3
+    assert metrics.get("history_rows_total", stage="load") == 6
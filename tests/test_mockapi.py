@@ -0,0 +1,47 @@
+"""
+Module used to test the mock of Spotify web API
+"""
+
+import requests
+from spotify_analysis.mockapi import MockSpotifyAPI, make_item
+
+
+def test_mock_spotify_api():
+    """
+    Testing the token, item and error responses of the mock server
+    """
+
+    assert make_item("tracks", "tr1") == make_item("tracks", "tr1")
+    assert "genres" in make_item("artists", "ar1")
+
+    with MockSpotifyAPI(rate_limit=0.3, window=10, retry_after=2) as server:
+        session = server.get_session()
+        headers = session.get_headers()
+        url = server.base_url + "tracks"
+
+        res = requests.get(url, {"ids": "tr1,tr2"}, headers=headers, timeout=10)
+        assert [item["id"] for item in res.json()["tracks"]] == ["tr1", "tr2"]
+        res = requests.get(url + "/tr1", headers=headers, timeout=10)
+        assert res.json() == make_item("tracks", "tr1")
+
+        # Too many ids, then over the rate limit
+        ids = ",".join(f"tr{i}" for i in range(51))
+        res = requests.get(url, {"ids": ids}, headers=headers, timeout=10)
+        assert res.status_code == 400
+        res = requests.get(url + "/tr1", headers=headers, timeout=10)
+        assert res.status_code == 429 and res.headers["Retry-After"] == "2"
+
+        # Unknown and expired tokens are rejected
+        res = requests.get(url + "/tr1", timeout=10)
+        assert res.status_code == 401
+        server.tokens[session.access_token] = 0.0
+        res = requests.get(url + "/tr1", headers=headers, timeout=10)
+        assert res.status_code == 401
+
+        assert server.stats() == {
+            "requests": 6,
+            "items": 3,
+            "tokens": 1,
+            "status": {200: 2, 400: 1, 401: 2, 429: 1},
+        }
+        session.close()
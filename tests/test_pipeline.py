@@ -0,0 +1,96 @@
+"""
+Module used to test the pipelined enrichment of tracks, artists and albums
+"""
+
+import json
+from spotify_analysis.cache import MetadataCache
+from spotify_analysis.mockapi import MockSpotifyAPI
+from spotify_analysis.pipeline import EnrichmentPipeline
+from spotify_analysis.spotify import Spotify
+
+
+def fake_item(reference, uri):
+    """
+    Fake Spotify metadata of a track, artist or album
+    """
+
+    item = {"id": uri, "name": f"name_{uri}", "popularity": 1}
+    if reference == "tracks":
+        number = int(uri.split("_")[-1])
+        item["artists"] = [{"id": f"ar_{number % 3}"}, {"id": f"ar_{number % 5}"}]
+        item["album"] = {"id": f"al_{number % 2}"}
+    return item
+
+
+def make_fake_request(urls):
+    """
+    Fake `Spotify.make_request` answering with fake metadata, which stores
+    the requested urls in `urls`
+    """
+
+    # pylint: disable=unused-argument
+    async def fake_request(self, client, semaphore, url):
+        urls.append(url)
+        reference = url.split("/")[-1].split("?")[0]
+        if "?ids=" in url:
+            ids = url.split("?ids=")[-1].split("%2C")
+            output = {reference: [fake_item(reference, uri) for uri in ids]}
+        else:
+            reference = url.split("/")[-2]
+            output = fake_item(reference, url.split("/")[-1])
+        return {"response": json.dumps(output), "status": 200, "url": url}
+
+    return fake_request
+
+
+def test_enrichment_pipeline(monkeypatch):
+    """
+    Testing that artists and albums are accessed once, from the track responses
+    """
+
+    urls = []
+    monkeypatch.setattr(Spotify, "make_request", make_fake_request(urls))
+    cache = MetadataCache(":memory:")
+    pipeline = EnrichmentPipeline(
+        track_metadata=["name", "popularity"],
+        artist_metadata=["name"],
+        album_metadata=["name"],
+        cache=cache,
+    )
+    uri_list = [f"tr_{i}" for i in range(120)]
+    assert pipeline.run(uri_list + uri_list[:10])
+
+    assert len(pipeline.tracks.metadata) == 120
+    assert pipeline.tracks.metadata["tr_7"]["artist_ids"] == ["ar_1", "ar_2"]
+    assert pipeline.tracks.metadata["tr_7"]["album_id"] == "al_1"
+    assert sorted(pipeline.artists.metadata) == [f"ar_{i}" for i in range(5)]
+    assert sorted(pipeline.albums.metadata) == ["al_0", "al_1"]
+    # 3 track requests, 1 artist request and 1 album request
+    assert len(urls) == 5
+
+    # A rerun takes everything (including the artist ids) from the cache
+    urls.clear()
+    pipeline = EnrichmentPipeline(["name", "popularity"], ["name"], cache=cache)
+    assert pipeline.run(uri_list)
+    assert not urls and len(pipeline.artists.metadata) == 5
+
+
+def test_stages_overlap():
+    """
+    Testing that artist requests start as soon as a track response filled
+    a batch of artist ids, before the remaining track requests are done
+    """
+
+    uri_list = [f"tr{i}" for i in range(400)]
+    with MockSpotifyAPI(latency=0.01) as server:
+        session = server.get_session()
+        pipeline = EnrichmentPipeline(
+            ["name"], ["name"], session=session, max_concurrency=2
+        )
+        assert pipeline.run(uri_list)
+        session.close()
+
+    references = [entry["reference"] for entry in server.log]
+    assert references.count("tracks") == 8 and "artists" in references
+    last_track = len(references) - 1 - references[::-1].index("tracks")
+    assert references.index("artists") < last_track
@@ -0,0 +1,107 @@
+"""
+Module used to test the adaptive rate limiter
+"""
+
+import threading
+import time
+from spotify_analysis.ratelimit import RateLimiter, RetryPolicy
+from spotify_analysis.spotify import Spotify
+
+
+# pylint: disable=too-few-public-methods
+class FakeResponse:
+    """
+    Minimal stand-in for `requests.Response`
+    """
+
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+def test_rate_limiter():
+    """
+    Testing the adaptation of the rate and the backoff of the limiter
+    """
+
+    limiter = RateLimiter(rate=8.0, min_rate=1.0, max_rate=10.0, increase=1.0)
+    limiter.update(429)
+    assert limiter.rate == 4.0
+    limiter.update(503)
+    limiter.update(None)
+    limiter.update(429)
+    assert limiter.rate == 1.0
+    limiter.update(200)
+    assert limiter.rate == 2.0
+    limiter.update(404)
+    assert limiter.rate == 2.0
+
+    # Retry-After pauses all requests
+    limiter.update(429, retry_after="30")
+    assert limiter.reserve() > 25
+    assert 30 <= limiter.retry.backoff(0, "30") <= 31
+    assert 0 <= limiter.retry.backoff(3) <= 8
+
+    assert RetryPolicy.parse_retry_after("2") == 2.0
+    assert RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert RetryPolicy.parse_retry_after("soon") is None
+
+
+def test_one_decrease_per_window():
+    """
+    Testing that concurrent rate-limit errors of requests that were in
+    flight together halve the rate only once
+    """
+
+    limiter = RateLimiter(rate=8.0, min_rate=0.5)
+    sent_at = time.monotonic()
+    threads = [
+        threading.Thread(target=limiter.update, args=(429, None, sent_at))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.rate == 4.0
+
+    # Requests sent after the decrease start a new window
+    limiter.update(503, sent_at=time.monotonic())
+    assert limiter.rate == 2.0
+
+    # Without send time, the request counts as sent `Retry-After` ago
+    limiter.update(429, retry_after="1")
+    assert limiter.rate == 2.0
+    limiter.update(429)
+    assert limiter.rate == 1.0
+
+
+def test_spotify_retries_rate_limited_requests(monkeypatch):
+    """
+    Testing that requests rejected by the rate limit are retried
+    """
+
+    fname = "./tests/Spotify_Response_Sample_Tracks.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        response = f.read()
+    responses = [
+        FakeResponse(429, headers={"Retry-After": "0"}),
+        FakeResponse(502),
+        FakeResponse(200, response),
+    ]
+
+    # pylint: disable=unused-argument
+    def fake_get(*args, **kwargs):
+        return responses.pop(0)
+
+    monkeypatch.setattr("requests.Session.get", fake_get)
+    limiter = RateLimiter(retry=RetryPolicy(backoff_base=0.01))
+    spotify_api = Spotify(reference="tracks", rate_limiter=limiter)
+    list_uri = ["2up3OPMp9Tb4dAKM2erWXQ_v1", "2up3OPMp9Tb4dAKM2erWXQ_v2"]
+    assert spotify_api.access_spotify_api(list_uri, ["name"])
+    assert not responses and len(spotify_api.metadata) == 2
+
+    # Requests that keep failing are skipped
+    monkeypatch.setattr("requests.Session.get", lambda *a, **k: FakeResponse(404))
+    assert not spotify_api.access_spotify_api(["uri_1", "uri_2"], ["name"])
@@ -0,0 +1,70 @@
+"""
+Module used to test the star schema of plays, tracks, artists and genres
+"""
+
+import pandas as pd
+from spotify_analysis.schema import StarSchema
+from spotify_analysis.utils import modify_columns_spotify_history
+
+
+def test_star_schema():
+    """
+    Testing the integer keys, lookups and derived metrics of the star schema
+    """
+
+    plays = pd.DataFrame(
+        {
+            "ts": ["2023-01-01T10:00:00Z"] * 5,
+            "ms_played": [100000, 50000, 200000, 10000, 0],
+            "master_metadata_track_name": ["t1", "t2", "t1", "t3", None],
+            "master_metadata_album_artist_name": ["a1", "a2", "a1", "a3", None],
+            "spotify_track_uri": [
+                "spotify:track:tr_1",
+                "spotify:track:tr_2",
+                "spotify:track:tr_1",
+                "spotify:track:tr_3",
+                None,
+            ],
+        }
+    )
+    plays = modify_columns_spotify_history(plays, compact=True)
+    track_metadata = pd.DataFrame(
+        {
+            "track_uri": ["tr_1", "tr_2", "tr_4"],
+            "duration_ms": [200000, 100000, 300000],
+            "artist_ids": [["ar_1", "ar_2"], ["ar_2"], ["ar_3"]],
+            "album_id": ["al_1", "al_1", "al_2"],
+        }
+    )
+    artist_metadata = pd.DataFrame(
+        {
+            "artist_uri": ["ar_1", "ar_2"],
+            "name": ["a1", "a2"],
+            "genres": [["pop", "rock"], ["rock"]],
+        }
+    )
+    schema = StarSchema(plays, track_metadata, artist_metadata)
+
+    assert schema.plays["track_id"].tolist() == [0, 1, 0, 2]
+    assert "track_uri" not in schema.plays and "unique_tr" not in schema.plays
+    assert schema.tracks["track_uri"].tolist() == ["tr_1", "tr_2", "tr_3"]
+    assert schema.tracks["artist_id"].tolist() == [0, 1, -1]
+    assert schema.tracks["album_id"].tolist() == [0, 0, -1]
+    assert schema.track_artists["position"].tolist() == [0, 1, 0]
+    assert schema.albums["album_uri"].tolist() == ["al_1"]
+    assert schema.genres["genre"].tolist() == ["pop", "rock"]
+
+    names = schema.lookup("artists", "name")
+    assert names.tolist()[:3] == ["a1", "a2", "a1"] and names.isna().iloc[3]
+    ratio = schema.completion_ratio()
+    assert ratio.tolist()[:3] == [0.5, 0.5, 1.0] and ratio.isna().iloc[3]
+
+    df = schema.join(tracks=["duration_ms"], albums=["album_uri"])
+    assert df["album_album_uri"].iloc[:3].tolist() == ["al_1"] * 3
+    assert df["track_duration_ms"].tolist()[:3] == [200000, 100000, 200000]
+    assert schema.genre_plays().to_dict() == {"rock": 3, "pop": 2}
+
+    # Without metadata the dimensions only contain the history columns
+    schema = StarSchema(plays)
+    assert schema.tracks["track_name"].tolist() == ["t1", "t2", "t3"]
+    assert len(schema.artists) == 0 and len(schema.genre_plays()) == 0
@@ -0,0 +1,51 @@
+"""
+Module used to test the detection of listening sessions
+"""
+
+import pandas as pd
+from spotify_analysis.sessions import assign_sessions, get_sessions
+
+
+def test_sessions():
+    """
+    Testing the splitting of plays into sessions on gaps, platform and user
+    """
+
+    minute = 60 * 1000
+    df = pd.DataFrame(
+        {
+            "ts": pd.to_datetime(
+                [
+                    "2023-01-01T10:00:00Z",
+                    # Started at 10:10 (long play), so within the gap
+                    "2023-01-01T10:50:00Z",
+                    "2023-01-01T12:00:00Z",
+                    "2023-01-01T12:03:00Z",
+                    "2023-01-01T12:01:00Z",
+                    None,
+                ]
+            ),
+            "username": ["a", "a", "a", "a", "b", "a"],
+            "platform": ["ios", "ios", "ios", "web", "ios", "ios"],
+            "ms_played": [3 * minute, 40 * minute, 3 * minute, minute, minute, 0],
+            "skipped": [False, True, None, False, True, False],
+            "spotify_track_uri": ["spotify:track:x"] * 4 + [None, None],
+        }
+    )
+
+    sessions = assign_sessions(df)
+    assert sessions.tolist() == [0, 0, 1, 2, 3, pd.NA]
+    assert assign_sessions(df, split_on_platform=False).tolist()[:4] == [0, 0, 1, 1]
+    assert assign_sessions(df, max_gap="5min").tolist()[:2] == [0, 1]
+
+    table = get_sessions(df)
+    assert table["username"].tolist() == ["a", "a", "a", "b"]
+    assert table["n_plays"].tolist() == [2, 1, 1, 1]
+    assert table["n_tracks"].tolist() == [2, 1, 1, 0]
+    assert table["skip_ratio"].tolist() == [0.5, 0.0, 0.0, 1.0]
+    assert table["platform"].tolist() == ["ios", "ios", "web", "ios"]
+    assert table["start"].iloc[0] == pd.Timestamp("2023-01-01T09:57:00Z")
+    assert table["duration"].iloc[0] == pd.Timedelta(minutes=53)
+    assert table["ms_played"].iloc[0] == 43 * minute
+
+    assert len(get_sessions(df.iloc[:0])) == 0
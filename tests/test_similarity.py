@@ -0,0 +1,122 @@
+"""
+Module used to test the artist x genre similarity and neighbor queries
+"""
+
+import numpy as np
+import pandas as pd
+from spotify_analysis.schema import StarSchema
+from spotify_analysis.similarity import (
+    ArtistSimilarity,
+    SimilarityIndex,
+    get_top_k,
+    get_user_artist_matrix,
+)
+from spotify_analysis.utils import modify_columns_spotify_history
+
+
+def get_schema():
+    """
+    Star schema of two users and four artists, with overlapping genres
+
+    Return
+    ------
+    StarSchema
+        The star schema
+    """
+
+    tracks = ["tr_1", "tr_2", "tr_1", "tr_3", "tr_4"]
+    plays = pd.DataFrame(
+        {
+            "ts": ["2023-01-01T10:00:00Z"] * 5,
+            "username": ["u1", "u1", "u1", "u2", "u2"],
+            "ms_played": [100000, 50000, 200000, 10000, 20000],
+            "master_metadata_track_name": ["t1", "t2", "t1", "t3", "t4"],
+            "master_metadata_album_artist_name": ["a1", "a2", "a1", "a3", "a4"],
+            "spotify_track_uri": [f"spotify:track:{uri}" for uri in tracks],
+        }
+    )
+    plays = modify_columns_spotify_history(plays, compact=True)
+    track_metadata = pd.DataFrame(
+        {
+            "track_uri": ["tr_1", "tr_2", "tr_3", "tr_4"],
+            "artist_ids": [["ar_1"], ["ar_2"], ["ar_3"], ["ar_4"]],
+        }
+    )
+    artist_metadata = pd.DataFrame(
+        {
+            "artist_uri": ["ar_1", "ar_2", "ar_3", "ar_4"],
+            "name": ["a1", "a2", "a3", "a4"],
+            "genres": [["pop", "rock"], ["rock"], ["pop", "dance"], ["jazz"]],
+        }
+    )
+    return StarSchema(plays, track_metadata, artist_metadata)
+
+
+def test_top_k():
+    """
+    Testing the vectorized top-k of every row of a score matrix
+    """
+
+    scores = np.array([[0.1, 0.9, 0.0, 0.5], [0.3, 0.3, 0.7, -np.inf]])
+    ids, top = get_top_k(scores, 3)
+    assert ids.tolist() == [[1, 3, 0], [2, 0, 1]]
+    assert np.allclose(top, [[0.9, 0.5, 0.1], [0.7, 0.3, 0.3]])
+
+    # Items without overlap (or excluded) are padded with -1
+    ids, top = get_top_k(scores, 5)
+    assert ids.tolist() == [[1, 3, 0, -1, -1], [2, 0, 1, -1, -1]]
+    assert top[:, 3:].tolist() == [[0, 0], [0, 0]]
+
+
+def test_similarity_index():
+    """
+    Testing that precomputed neighbors match the neighbors of a query
+    """
+
+    rng = np.random.default_rng(0)
+    matrix = (rng.random((300, 40)) < 0.05).astype(np.float32)
+    index = SimilarityIndex(matrix)
+    norms = np.linalg.norm(matrix, axis=1)
+    normalized = matrix / np.where(norms > 0, norms, 1)[:, None]
+    assert np.allclose(index.get_scores(matrix[:5]), normalized[:5] @ normalized.T)
+
+    item_ids = np.arange(0, 300, 7)
+    ids, scores = index.neighbors(item_ids, k=5)
+    index.precompute_neighbors(k=8, block_size=64)
+    assert index.neighbor_ids.shape == (300, 8)
+    precomputed_ids, precomputed_scores = index.neighbors(item_ids, k=5)
+    assert np.allclose(precomputed_scores, scores, atol=1e-6)
+    assert not (precomputed_ids == item_ids[:, None]).any()
+    assert ((ids >= 0) == (scores > 0)).all()
+
+
+def test_artist_similarity():
+    """
+    Testing similar artists and genres, and the artists and genres closest
+    to what a user listens to
+    """
+
+    schema = get_schema()
+    matrix, users = get_user_artist_matrix(schema, weight="ms_played")
+    assert users.tolist() == ["u1", "u2"]
+    assert matrix.toarray().tolist() == [[300000, 50000, 0, 0], [0, 0, 10000, 20000]]
+
+    for k in [None, 3]:
+        similarity = ArtistSimilarity(schema, idf=False, k=k)
+        artists = similarity.similar_artists("a1")
+        assert artists["name"].tolist() == ["a2", "a3"]
+        assert np.allclose(artists["score"], [0.5**0.5, 0.5])
+        assert similarity.similar_genres("pop")["genre"].tolist() == [
+            "dance",
+            "rock",
+        ]
+        assert len(similarity.similar_genres("jazz")) == 0
+
+    # The first user listens to pop and rock, of which a3 shares pop
+    artists = similarity.artists_for_user("u1")
+    assert artists["name"].tolist() == ["a3"]
+    played = similarity.artists_for_user("u1", exclude_played=False)
+    assert played["name"].tolist() == ["a1", "a2", "a3"]
+    genres = similarity.genres_for_user("u1")
+    assert genres["genre"].tolist() == ["rock", "pop"]
+    assert similarity.genres_for_user("u2")["genre"].tolist()[0] == "pop"
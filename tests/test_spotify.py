@@ -3,6 +3,10 @@ Module used to test the Spotify class functionalities
 """
 
 import json
+import time
+import pytest
+from spotify_analysis.mockapi import MockSpotifyAPI
+from spotify_analysis.ratelimit import RateLimiter, RetryPolicy
 from spotify_analysis.spotify import Spotify
 from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
 
@@ -25,7 +29,6 @@ def test_retrieving_spotify_metadata():
     """
 
     spotify_api = Spotify(reference="tracks")
-    # TODO: Test API (via both requests and aiohttp with github secrets)
 
     fname = "./tests/Spotify_Response_Sample_Track.json"
     with open(fname, "r", encoding="utf-8") as f:
@@ -49,3 +52,122 @@ def test_retrieving_spotify_metadata():
         spotify_api2.fill_metadata_dictionary(output, list_uri, metadata)
         for key in spotify_api2.metadata:
             assert spotify_api2.metadata[key]["id"] == "string"
+
+
+def test_retrieving_spotify_metadata_async(monkeypatch):
+    """
+    Testing that the asynchronous access packs uri's into bulk requests
+    """
+
+    fname = "./tests/Spotify_Response_Sample_Tracks.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        response = f.read()
+
+    urls = []
+
+    # pylint: disable=unused-argument
+    async def fake_request(self, client, semaphore, url):
+        async with semaphore:
+            urls.append(url)
+            return {"response": response, "status": 200, "url": url}
+
+    monkeypatch.setattr(Spotify, "make_request", fake_request)
+    spotify_api = Spotify(reference="tracks", max_concurrency=2)
+    list_uri = ["2up3OPMp9Tb4dAKM2erWXQ_v1", "2up3OPMp9Tb4dAKM2erWXQ_v2"]
+    metadata = ["name", "duration_ms", "explicit", "popularity"]
+    assert spotify_api.access_spotify_api_async(list_uri, metadata)
+    assert len(urls) == 1 and urls[0].endswith("?ids=" + "%2C".join(list_uri))
+    assert len(spotify_api.metadata) == 2
+
+
+def test_accessing_spotify_api():
+    """
+    Testing the requests and aiohttp paths against the mock of Spotify web API,
+    with rate limiting, server errors and tokens that expire early
+    """
+
+    metadata = ["name", "duration_ms", "album_id=album.id"]
+    list_uri = [f"tr{i}" for i in range(230)]
+    with MockSpotifyAPI(
+        latency=0.02,
+        rate_limit=30,
+        window=0.1,
+        retry_after=0.05,
+        error_rate=0.1,
+        token_ttl=0.15,
+        expires_in=3600,
+    ) as server:
+        statuses = set()
+        for method in ["access_spotify_api", "access_spotify_api_async"]:
+            server.reset()
+            limiter = RateLimiter(
+                rate=50, burst=5, min_rate=10, retry=RetryPolicy(backoff_base=0.1)
+            )
+            session = server.get_session(rate_limiter=limiter)
+            spotify_api = Spotify(reference="tracks", session=session)
+            assert getattr(spotify_api, method)(list_uri, metadata, n_uri=20)
+            assert sorted(spotify_api.metadata) == sorted(list_uri)
+            assert spotify_api.metadata["tr7"]["album_id"].startswith("al")
+
+            # Rejected tokens were refreshed, failed requests were retried
+            stats = server.stats()
+            assert stats["status"][200] == 12 and stats["items"] == 230
+            assert 429 in stats["status"]
+            statuses.update(stats["status"])
+            session.close()
+        assert {200, 401, 429} <= statuses <= {200, 401, 429, 503}
+
+
+def test_async_rate_ramp_up():
+    """
+    Testing that the request rate of the aiohttp path ramps up when there
+    are no errors, instead of all requests being scheduled at the initial rate
+    """
+
+    list_uri = [f"tr{i}" for i in range(40 * 20)]
+    with MockSpotifyAPI(latency=0.02) as server:
+        limiter = RateLimiter(rate=5, burst=1, increase=2, max_rate=200)
+        session = server.get_session(rate_limiter=limiter)
+        spotify_api = Spotify(reference="tracks", session=session)
+        start = time.perf_counter()
+        assert spotify_api.access_spotify_api_async(list_uri, ["name"], n_uri=20)
+        seconds = time.perf_counter() - start
+        session.close()
+
+    # 40 requests at the initial rate of 5 per second would take 8 seconds
+    assert server.stats()["requests"] == 40 and limiter.rate > 50
+    assert seconds < 4
+
+
+def test_batch_size_is_clamped():
+    """
+    Testing that requests never contain more ids than the endpoint allows,
+    and that headers set by hand set the access token
+    """
+
+    list_uri = [f"al{i}" for i in range(45)]
+    with MockSpotifyAPI() as server:
+        for method in ["access_spotify_api", "access_spotify_api_async"]:
+            server.reset()
+            session = server.get_session()
+            spotify_api = Spotify(reference="albums", session=session)
+            assert getattr(spotify_api, method)(list_uri, ["name"], n_uri=50)
+            assert server.stats()["status"] == {200: 3}
+            session.close()
+
+    with pytest.raises(ValueError):
+        spotify_api.get_request_url(list_uri[:21])
+
+    spotify_api.headers = {"Authorization": "Bearer manual"}
+    assert spotify_api.access_token == "manual"
+    assert spotify_api.headers == {"Authorization": "Bearer manual"}
+
+
+def test_spotify_arguments_are_keywords():
+    """
+    Testing that only the reference of a client can be given positionally,
+    such that callers of the former `Spotify(reference, batch_size)` fail
+    """
+
+    with pytest.raises(TypeError):
+        Spotify("tracks", 200)  # pylint: disable=too-many-function-args
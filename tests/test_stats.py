@@ -0,0 +1,61 @@
+"""
+Module used to test the materialized listening statistics
+"""
+
+import pandas as pd
+from spotify_analysis.ingest import PlayStore
+from spotify_analysis.stats import ListeningStats
+from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
+from tests.test_ingest import write_export
+
+
+def test_incremental_stats(tmp_path):
+    """
+    Testing that incremental aggregates match the aggregates of all plays
+    """
+
+    df_songs = get_spotify_history("./tests/")
+    df_songs = pd.concat([df_songs] * 3, ignore_index=True)
+    df_songs.loc[4, "skipped"] = True
+
+    stats = ListeningStats()
+    stats.update(df_songs.iloc[:4])
+    stats.update(df_songs.iloc[4:])
+
+    df_full = modify_columns_spotify_history(df_songs.copy())
+    for level, key in [("track", "unique_tr"), ("artist", "artist_name")]:
+        expected = df_full[key].value_counts()
+        assert stats.top(level, n=10)["plays"].to_dict() == expected.to_dict()
+
+    artist = df_full["artist_name"].iloc[0]
+    ms_played = df_full.loc[df_full["artist_name"] == artist, "ms_played"].sum()
+    assert stats.get("artist", artist)["ms_played"] == ms_played
+    assert stats.get("artist", "unknown artist")["plays"] == 0
+    expected_plays = stats.get("artist", artist)["plays"]
+    assert stats.aggregates["track"]["skips"].sum() == 1
+
+    # Plays of known entities are added in place
+    aggregate = stats.aggregates["artist"]
+    stats.update(df_songs.iloc[:1])
+    assert stats.aggregates["artist"] is aggregate
+    assert stats.get("artist", artist)["plays"] == expected_plays + 1
+    stats = ListeningStats()
+    stats.update(df_songs)
+
+    counts = stats.counts("track", df_full["unique_tr"])
+    assert (
+        counts.tolist()
+        == df_full.groupby("unique_tr")["unique_tr"].transform("count").tolist()
+    )
+
+    # Statistics are updated and stored during ingestion
+    stats_dir = str(tmp_path / "stats")
+    write_export(tmp_path / "export_1", range(1, 11))
+    write_export(tmp_path / "export_2", range(5, 16))
+    store = PlayStore(str(tmp_path / "store"), stats=ListeningStats(stats_dir))
+    store.ingest(str(tmp_path / "export_1"), n_jobs=1)
+    store.ingest(str(tmp_path / "export_2"), n_jobs=1)
+
+    stats = ListeningStats(stats_dir)
+    assert stats.aggregates["track"]["plays"].sum() == 15
+    assert len(stats.aggregates["day"]) == 15
@@ -0,0 +1,32 @@
+"""
+Module used to test the generator of synthetic streaming histories
+"""
+
+from spotify_analysis.synthetic import HISTORY_COLUMNS, write_export
+from spotify_analysis.utils import get_spotify_history, modify_columns_spotify_history
+
+
+def test_synthetic_history(tmp_path):
+    """
+    Testing that a synthetic export loads like a real one
+    """
+
+    paths = write_export(str(tmp_path), 5000, plays_per_file=2000, seed=1)
+    assert len(paths) == 3
+    write_export(str(tmp_path / "again"), 5000, plays_per_file=2000, seed=1)
+
+    df = get_spotify_history(str(tmp_path), n_jobs=1)
+    assert list(df.columns) == HISTORY_COLUMNS
+    assert len(df) == 5000 and df["ts"].is_monotonic_increasing
+
+    # Podcasts and plays without metadata, the rest are tracks
+    episodes = df["spotify_episode_uri"].notna()
+    tracks = df["spotify_track_uri"].notna()
+    assert 0.03 < episodes.mean() < 0.07 and not (episodes & tracks).any()
+    assert 0.002 < 1 - (episodes | tracks).mean() < 0.03
+    assert df["skipped"].isna().any() and df["skipped"].any()
+
+    # The same seed gives the same export, popularity is skewed
+    assert get_spotify_history(str(tmp_path / "again"), n_jobs=1).equals(df)
+    counts = modify_columns_spotify_history(df)["unique_tr"].value_counts()
+    assert counts.iloc[0] > 5 * counts.median()
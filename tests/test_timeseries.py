@@ -0,0 +1,54 @@
+"""
+Module used to test the time-indexed rollups of the streaming history
+"""
+
+import pandas as pd
+from spotify_analysis.timeseries import ListeningTimeline
+from spotify_analysis.utils import modify_columns_spotify_history
+
+
+def test_timeline():
+    """
+    Testing the rollups and range slicing of the listening timeline
+    """
+
+    df = pd.DataFrame(
+        {
+            "ts": [
+                "2023-01-31T23:00:00Z",
+                "2023-01-02T10:00:00Z",
+                "2023-01-02T11:00:00Z",
+                "2023-02-01T09:00:00Z",
+                None,
+            ],
+            "ms_played": [60000, 120000, 30000, 60000, 60000],
+            "master_metadata_track_name": ["t1", "t1", "t2", "t3", "t1"],
+            "master_metadata_album_artist_name": ["a1", "a1", "a2", "a1", "a1"],
+            "spotify_track_uri": ["spotify:track:1"] * 5,
+        }
+    )
+    df = modify_columns_spotify_history(df, compact=True)
+    timeline = ListeningTimeline(df)
+
+    assert timeline.plays.index.is_monotonic_increasing
+    assert len(timeline.plays) == 4
+
+    day = timeline.rollups["day"]
+    assert len(day) == 31
+    assert day.loc["2023-01-02", "minutes_played"] == 2.5
+    assert day.loc["2023-01-02", "tracks"] == 2
+    assert day.loc["2023-01-02", "new_artists"] == 2
+    assert day.loc["2023-01-03", "plays"] == 0
+    assert day.loc["2023-01-31", "discovery_rate"] == 0.0
+
+    week = timeline.rollups["week"]
+    assert week.index[0] == pd.Timestamp("2023-01-02", tz="UTC")
+    month = timeline.rollups["month"]
+    assert month["plays"].tolist() == [3, 1]
+    assert month["artists"].tolist() == [2, 1]
+
+    assert len(timeline.slice("2023-01-02", "2023-01-02T10:30")) == 1
+    assert len(timeline.slice(start="2023-01-31")) == 2
+    assert len(timeline.slice(end="2023-01-01")) == 0
+    assert len(timeline.rollup("day", "2023-01-10", "2023-01-20")) == 10
+    assert timeline.rollup("month", start="2023-02-01")["plays"].tolist() == [1]
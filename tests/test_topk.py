@@ -0,0 +1,75 @@
+"""
+Module used to test the streaming top-k of tracks, artists and albums
+"""
+
+import numpy as np
+import pandas as pd
+from spotify_analysis.topk import (
+    CountMinSketch,
+    SpaceSaving,
+    StreamingTopK,
+    get_top_streaming,
+)
+
+
+def test_sketches():
+    """
+    Testing the error bounds of the Space-Saving and Count-Min sketches
+    """
+
+    rng = np.random.default_rng(0)
+    values = pd.Series(rng.zipf(1.5, 20000) % 1000).astype(str)
+    exact = values.value_counts()
+
+    summary = SpaceSaving(capacity=50)
+    sketch = CountMinSketch.from_error(epsilon=0.01, delta=0.01)
+    assert sketch.width == 272 and sketch.depth == 5
+    for ibx in range(0, len(values), 1000):
+        summary.update(values.iloc[ibx : ibx + 1000])
+        sketch.update(values.iloc[ibx : ibx + 1000].astype("category"))
+
+    assert len(summary.counts) == 50
+    assert summary.error_bound == 400
+    true_counts = exact.reindex(summary.counts.index, fill_value=0)
+    assert (summary.counts >= true_counts).all()
+    assert (summary.counts - summary.errors <= true_counts).all()
+    assert (summary.counts - true_counts <= summary.error_bound).all()
+    assert set(exact.index[:10]) <= set(summary.counts.index)
+
+    estimates = sketch.query(exact.index)
+    assert (estimates >= exact.to_numpy()).all()
+    assert (estimates - exact.to_numpy() <= 0.01 * len(values)).mean() > 0.99
+
+
+def test_streaming_topk():
+    """
+    Testing that the approximate top-k matches the exact mode
+    """
+
+    rng = np.random.default_rng(1)
+    artist = rng.zipf(1.5, 5000) % 300
+    df = pd.DataFrame(
+        {
+            "master_metadata_track_name": [f"track_{i}" for i in artist * 7 % 500],
+            "master_metadata_album_artist_name": [f"artist_{i}" for i in artist],
+            "master_metadata_album_album_name": [f"album_{i}" for i in artist % 100],
+            "spotify_track_uri": "spotify:track:1",
+            "ms_played": 1000,
+            "ts": None,
+        }
+    )
+
+    approx = StreamingTopK(k=5, capacity=50)
+    exact = StreamingTopK(k=5, exact=True)
+    for ibx in range(0, len(df), 500):
+        approx.update(df.iloc[ibx : ibx + 500])
+        exact.update(df.iloc[ibx : ibx + 500])
+
+    for level in ["track", "artist", "album"]:
+        assert approx.top(level).index.tolist() == exact.top(level).index.tolist()
+        diff = approx.top(level)["plays"] - exact.top(level)["plays"]
+        assert (diff >= 0).all() and (diff <= approx.error_bound(level)).all()
+
+    topk = get_top_streaming("./tests/", k=2, chunksize=2, exact=True, n_jobs=1)
+    assert len(topk.top("artist")) == 2
+    assert topk.top("artist", n=10)["plays"].sum() == 3
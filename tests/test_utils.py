@@ -0,0 +1,115 @@
+"""
+Module used to test the loading of Spotify's streaming history
+"""
+
+import json
+import os
+import pandas as pd
+from spotify_analysis.utils import (
+    HistoryCache,
+    get_spotify_history,
+    iter_spotify_history,
+    modify_columns_spotify_history,
+)
+
+
+def write_history(inputdir, n_files=2):
+    """
+    Write streaming history files with realistic timestamps and platforms
+    """
+
+    fname = "./tests/Streaming_History_Audio_Example.json"
+    with open(fname, "r", encoding="utf-8") as f:
+        plays = json.load(f)
+
+    for ifile in range(n_files):
+        for iplay, play in enumerate(plays):
+            play["ts"] = f"202{ifile}-01-0{iplay + 1}T12:00:00Z"
+            play["platform"] = f"platform_{ifile}"
+        path = inputdir / f"Streaming_History_Audio_202{ifile}.json"
+        path.write_text(json.dumps(plays), encoding="utf-8")
+
+
+def test_loading_spotify_history_typed(tmp_path):
+    """
+    Testing the parallel, typed and chunked loading of Spotify's history
+    """
+
+    write_history(tmp_path)
+    df = get_spotify_history(str(tmp_path), drop_pii=True, n_jobs=2)
+    assert len(df) == 6
+    assert "ip_addr_decrypted" not in df.columns
+    assert isinstance(df["ts"].dtype, pd.DatetimeTZDtype)
+    assert df["ts"].iloc[3] == pd.Timestamp("2021-01-01T12:00:00Z")
+    assert list(df["platform"].cat.categories) == ["platform_0", "platform_1"]
+    assert df["skipped"].dtype == "boolean" and df["skipped"].isna().all()
+
+    chunks = list(iter_spotify_history(str(tmp_path), chunksize=2, n_jobs=1))
+    assert [len(chunk) for chunk in chunks] == [2, 1, 2, 1]
+    assert "ip_addr_decrypted" in chunks[0].columns
+
+
+def test_history_cache(tmp_path):
+    """
+    Testing that only new or changed files are parsed into the history cache
+    """
+
+    inputdir = tmp_path / "input"
+    inputdir.mkdir()
+    write_history(inputdir)
+    cache_dir = str(tmp_path / "cache")
+
+    cache = HistoryCache(cache_dir)
+    assert len(cache.update(str(inputdir), n_jobs=1)) == 2
+    assert not HistoryCache(cache_dir).update(str(inputdir), n_jobs=1)
+
+    df = get_spotify_history(str(inputdir), n_jobs=1, cache_dir=cache_dir)
+    df_direct = get_spotify_history(str(inputdir), n_jobs=1)
+    columns = [col for col in df_direct.columns if df_direct[col].notna().any()]
+    pd.testing.assert_frame_equal(
+        df[columns], df_direct[columns], check_categorical=False
+    )
+    assert isinstance(df["platform"].dtype, pd.CategoricalDtype)
+    assert df["skipped"].dtype == "boolean"
+
+    # Rewritten files are compared by content hash, a new file is parsed
+    cache = HistoryCache(str(tmp_path / "cache_hash"), use_hash=True)
+    assert len(cache.update(str(inputdir), n_jobs=1)) == 2
+    ifile = inputdir / "Streaming_History_Audio_2020.json"
+    os.utime(ifile, ns=(0, 0))
+    write_history(inputdir, n_files=3)
+    changed = cache.update(str(inputdir), n_jobs=1)
+    assert [os.path.basename(path) for path in changed] == [
+        "Streaming_History_Audio_2022.json"
+    ]
+    assert len(cache.load()) == 9
+
+    # Removed files are removed from the cache, changing drop_pii rebuilds it
+    os.remove(ifile)
+    cache.update(str(inputdir), n_jobs=1)
+    assert len(cache.load()) == 6
+    assert len(HistoryCache(cache_dir, drop_pii=True).update(str(inputdir))) == 2
+
+
+def test_modify_columns_compact():
+    """
+    Testing that the compact normalization matches the default one
+    """
+
+    df_songs = get_spotify_history("./tests/")
+    # Add a podcast and a track without artist to the history
+    podcast = df_songs.iloc[[0]].assign(spotify_track_uri=None)
+    no_artist = df_songs.iloc[[1]].assign(master_metadata_album_artist_name=None)
+    df_songs = pd.concat([df_songs, podcast, no_artist], ignore_index=True)
+
+    df_default = modify_columns_spotify_history(df_songs.copy())
+    df_compact = modify_columns_spotify_history(df_songs.copy(), compact=True)
+    assert list(df_compact.columns) == list(df_default.columns)
+    assert df_compact.index.equals(df_default.index)
+    assert len(df_compact) == 4
+
+    for col in ["unique_tr", "track_uri", "artist_name"]:
+        assert isinstance(df_compact[col].dtype, pd.CategoricalDtype)
+        assert df_compact[col].astype(object).isna().equals(df_default[col].isna())
+        values = df_compact[col].dropna().astype(str)
+        assert values.equals(df_default[col].dropna().astype(str))